@@ -1,14 +1,18 @@
 import os
+import re
+import zlib
 import boto3
 from common.serialization import deserialize
 from aws_lambda_powertools import Logger
 from aws_lambda_powertools.event_handler.api_gateway import Router
+from aws_lambda_powertools.event_handler.exceptions import BadRequestError
 
 router = Router()
 logger = Logger()
 
 SESSION_TABLE_NAME = os.environ.get("SESSION_TABLE_NAME")
 SESSION_BUCKET_NAME = os.environ.get("SESSION_BUCKET_NAME")
+CHECKSUM_PATTERN = re.compile(r"^[0-9a-f]{64}$")
 s3_client = boto3.client("s3")
 dynamodb = boto3.resource("dynamodb")
 table = dynamodb.Table(SESSION_TABLE_NAME)
@@ -62,10 +66,12 @@ def get_session(session_id: str):
     key = f"{user_id}/{session_id}/session.jsonb"
     exists = False
     messages = []
+    version = 0
     try:
         response = s3_client.get_object(Bucket=SESSION_BUCKET_NAME, Key=key)
         data = deserialize(response["Body"].read())
         messages = convert_session_messages(data)
+        version = data.get("version", 0)
 
         exists = True
     except s3_client.exceptions.NoSuchKey:
@@ -87,10 +93,30 @@ def get_session(session_id: str):
             "exists": exists,
             "messages": messages,
             "files": files,
+            "version": version,
         },
     }
 
 
+@router.get("/sessions/<session_id>/blobs/<checksum>")
+def get_session_blob(session_id: str, checksum: str):
+    user_id = (
+        router.current_event.get("requestContext", {})
+        .get("authorizer", {})
+        .get("claims", {})
+        .get("cognito:username")
+    )
+
+    if not CHECKSUM_PATTERN.match(checksum):
+        raise BadRequestError("Invalid blob checksum")
+
+    key = f"{user_id}/{session_id}/blobs/{checksum}"
+    response = s3_client.get_object(Bucket=SESSION_BUCKET_NAME, Key=key)
+    data = zlib.decompress(response["Body"].read()).decode("utf-8")
+
+    return {"ok": True, "data": data}
+
+
 def convert_session_messages(data: dict):
     ret_value = []
     sequence_idx = 0
@@ -0,0 +1,141 @@
+"""
+Offline load test of Bedrock admission and routing against fake regions
+(benchmarks/fake_bedrock.py). Concurrent workers send requests for a fixed
+duration, each through Admission.call and BedrockRouter.converse_stream as
+the handler does, and consume the stream.
+
+  single     one region, as before routing
+  failover   three regions; the first one is down for a window mid-run
+  low        low-priority requests sent to a separate faster model
+
+Reports completed and failed requests, latency percentiles to the end of the
+stream and the share of requests served by each endpoint.
+
+Usage: python benchmarks/bedrock_routing.py [--workers N] [--duration S]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("AWS_REGION", "us-east-1")
+os.environ.setdefault("AWS_DEFAULT_REGION", os.environ["AWS_REGION"])
+os.environ.setdefault("UPLOAD_BUCKET_NAME", "benchmark")
+# Shorter backoff and circuit timings so a run takes seconds.
+os.environ.setdefault("RETRY_BASE_DELAY", "0.05")
+os.environ.setdefault("RETRY_MAX_DELAY", "1")
+os.environ.setdefault("ROUTER_OPEN_SECONDS", "1")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import common.routing as routing  # noqa: E402
+from common.throttling import Admission, RetriesExhausted  # noqa: E402
+from fake_bedrock import FakeBedrockClient  # noqa: E402
+
+SCENARIOS = {
+    "single": {
+        "endpoints": [{"region": "us-east-1", "model": "large"}],
+        "clients": {"us-east-1": {"latency": 0.2, "capacity": 4}},
+    },
+    "failover": {
+        "endpoints": [
+            {"region": "us-east-1", "model": "large"},
+            {"region": "us-west-2", "model": "large"},
+            {"region": "eu-central-1", "model": "large"},
+        ],
+        "clients": {
+            "us-east-1": {"latency": 0.2, "capacity": 4, "outages": [(1, 3)]},
+            "us-west-2": {"latency": 0.3, "capacity": 4, "error_rate": 0.05},
+            "eu-central-1": {"latency": 0.45, "capacity": 4},
+        },
+    },
+    "low": {
+        "endpoints": [{"region": "us-east-1", "model": "large"}],
+        "low_priority_endpoints": [{"region": "us-west-2", "model": "small"}],
+        "clients": {
+            "us-east-1": {"latency": 0.2, "capacity": 4},
+            "us-west-2": {"latency": 0.1, "capacity": 8},
+        },
+        "priority": "low",
+    },
+}
+
+
+def create_router(scenario: dict):
+    clients = {
+        region: FakeBedrockClient(region, **config)
+        for region, config in scenario["clients"].items()
+    }
+    routing.BEDROCK_ENDPOINTS = json.dumps(scenario["endpoints"])
+    routing.BEDROCK_LOW_PRIORITY_ENDPOINTS = json.dumps(
+        scenario.get("low_priority_endpoints", [])
+    )
+
+    return routing.create_router(lambda region: clients[region]), clients
+
+
+def worker(router, admission, priority: str, deadline: float):
+    results = []
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            endpoint, response = admission.call(
+                lambda: router.converse_stream(priority, messages=[])
+            )
+            for _ in response["stream"]:
+                pass
+            results.append((time.perf_counter() - start, endpoint.name))
+        except (RetriesExhausted, routing.NoEndpointAvailable):
+            results.append((time.perf_counter() - start, None))
+
+    return results
+
+
+def run(name: str, scenario: dict, workers: int, duration: float):
+    router, clients = create_router(scenario)
+    admission = Admission(rpm=0, tpm=0, max_attempts=6)
+    priority = scenario.get("priority", "normal")
+    deadline = time.time() + duration
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(worker, router, admission, priority, deadline)
+            for _ in range(workers)
+        ]
+        results = [result for future in futures for result in future.result()]
+
+    latencies = sorted(elapsed for elapsed, endpoint in results if endpoint)
+    failed = sum(1 for _, endpoint in results if endpoint is None)
+    served = Counter(endpoint for _, endpoint in results if endpoint)
+
+    print(f"{name}: {len(latencies)} completed, {failed} failed")
+    if latencies:
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        print(
+            f"  latency p50 {statistics.median(latencies):.2f}s"
+            f"  p95 {p95:.2f}s  max {latencies[-1]:.2f}s"
+        )
+    for endpoint, count in served.most_common():
+        print(f"  {endpoint:<24} {count / len(latencies):>6.1%}")
+    for region, client in clients.items():
+        print(f"  {region:<24} calls {client.calls}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS))
+    args = parser.parse_args()
+
+    for name in args.scenarios:
+        run(name, SCENARIOS[name], args.workers, args.duration)
+
+
+if __name__ == "__main__":
+    main()
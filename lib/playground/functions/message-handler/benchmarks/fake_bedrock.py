@@ -0,0 +1,111 @@
+"""
+Offline stand-in for the bedrock-runtime client, for load-testing the router
+and admission control without calling Bedrock.
+
+Each fake region serves at most `capacity` streams at a time and throttles
+requests beyond that, fails a fraction of requests with a 5xx error, and can
+be taken down for a window of time. converse_stream waits for the time to
+first byte and returns a stream of text deltas that holds its slot until it
+has been consumed.
+"""
+
+import time
+import random
+import threading
+from botocore.exceptions import ClientError
+
+
+def client_error(code: str, status: int):
+    return ClientError(
+        {
+            "Error": {"Code": code, "Message": f"Fake {code}"},
+            "ResponseMetadata": {"HTTPStatusCode": status},
+        },
+        "ConverseStream",
+    )
+
+
+class FakeBedrockClient:
+    def __init__(
+        self,
+        region: str,
+        latency: float = 0.2,
+        capacity: int = 4,
+        error_rate: float = 0.0,
+        outages: list = [],
+        chunks: int = 10,
+        chunk_interval: float = 0.02,
+    ):
+        self.region = region
+        self.latency = latency
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.outages = outages
+        self.chunks = chunks
+        self.chunk_interval = chunk_interval
+        self.started = time.time()
+        self.active = 0
+        self.lock = threading.Lock()
+        self.calls = {"ok": 0, "throttled": 0, "failed": 0}
+
+    def in_outage(self):
+        elapsed = time.time() - self.started
+        return any(start <= elapsed < end for start, end in self.outages)
+
+    def record(self, outcome: str):
+        with self.lock:
+            self.calls[outcome] += 1
+
+    def converse_stream(self, modelId: str, **kwargs):
+        if self.in_outage():
+            time.sleep(self.latency / 4)
+            self.record("failed")
+            raise client_error("ServiceUnavailableException", 503)
+
+        with self.lock:
+            throttled = self.active >= self.capacity
+            if not throttled:
+                self.active += 1
+
+        if throttled:
+            time.sleep(self.latency / 4)
+            self.record("throttled")
+            raise client_error("ThrottlingException", 429)
+
+        time.sleep(self.latency * random.uniform(0.8, 1.2))
+        if random.random() < self.error_rate:
+            self.release()
+            self.record("failed")
+            raise client_error("InternalServerException", 500)
+
+        self.record("ok")
+
+        return {"stream": self.stream(modelId)}
+
+    def release(self):
+        with self.lock:
+            self.active -= 1
+
+    def stream(self, model: str):
+        try:
+            yield {"messageStart": {"role": "assistant"}}
+            for idx in range(self.chunks):
+                time.sleep(self.chunk_interval)
+                yield {
+                    "contentBlockDelta": {
+                        "contentBlockIndex": 0,
+                        "delta": {"text": f"{model}@{self.region} {idx} "},
+                    }
+                }
+            yield {"messageStop": {"stopReason": "end_turn"}}
+            yield {
+                "metadata": {
+                    "usage": {
+                        "inputTokens": 100,
+                        "outputTokens": self.chunks,
+                        "totalTokens": 100 + self.chunks,
+                    }
+                }
+            }
+        finally:
+            self.release()
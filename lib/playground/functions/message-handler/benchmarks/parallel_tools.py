@@ -0,0 +1,100 @@
+"""
+Turn latency of ConverseToolExecutor.execute for a turn with several tool
+uses, against in-process stub tools that sleep for a fixed latency per tool.
+
+  sequential   one tool use at a time, as execute used to run them
+  parallel     tool uses dispatched on the bounded pool (TOOL_MAX_CONCURRENCY)
+
+Usage: python benchmarks/parallel_tools.py [--runs N]
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("AWS_REGION", "us-east-1")
+os.environ.setdefault("AWS_DEFAULT_REGION", os.environ["AWS_REGION"])
+os.environ.setdefault("UPLOAD_BUCKET_NAME", "benchmark")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import tools.executor as executor_module  # noqa: E402
+from tools import ToolProvider, ConverseToolExecutor  # noqa: E402
+
+TOOL_LATENCY = {
+    "web_search": 0.8,
+    "code_interpreter": 1.5,
+}
+
+TOOL_USE = [
+    ("web_search", {"query": "first query"}),
+    ("web_search", {"query": "second query"}),
+    ("code_interpreter", {"code": "print(1)"}),
+]
+
+
+def stub_tool(payload):
+    time.sleep(TOOL_LATENCY[payload["name"]])
+
+    return {
+        "status": "success",
+        "content": {"text": f"{payload['name']} result"},
+    }
+
+
+class StubS3Client:
+    def generate_presigned_url(self, *args, **kwargs):
+        return "https://example.com/object"
+
+    def generate_presigned_post(self, bucket, key, **kwargs):
+        return {"url": "https://example.com", "fields": {"key": key}}
+
+
+def run_turn():
+    provider = ToolProvider({name: stub_tool for name in TOOL_LATENCY})
+    executor = ConverseToolExecutor("user", "session", provider)
+    for idx, (name, input) in enumerate(TOOL_USE):
+        executor.tool_use[idx] = {
+            "toolUseId": f"tool-{idx}",
+            "name": name,
+            "input": input,
+        }
+
+    start = time.perf_counter()
+    executor.execute(StubS3Client())
+    elapsed = time.perf_counter() - start
+
+    order = [current["toolUseId"] for current in executor.get_tool_results()]
+    assert order == [f"tool-{idx}" for idx in range(len(TOOL_USE))], order
+
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    latencies = [TOOL_LATENCY[name] for name, _ in TOOL_USE]
+    print(f"tool latencies: sum {sum(latencies):.2f}s, max {max(latencies):.2f}s")
+
+    modes = {
+        "sequential": ThreadPoolExecutor(max_workers=1),
+        "parallel": executor_module.dispatch_executor,
+    }
+
+    for mode, pool in modes.items():
+        executor_module.dispatch_executor = pool
+        samples = [run_turn() for _ in range(args.runs)]
+
+        print(
+            f"{mode:<12} median {statistics.median(samples):.2f}s"
+            f"  min {min(samples):.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Replays converse_stream event logs through ConverseToolExecutor.process_chunk
+and reports events/sec and the peak memory allocated while processing. The
+previous processor, which grew the text and tool inputs by concatenation, is
+replayed alongside it and must produce identical assistant messages.
+
+Fixtures in benchmarks/fixtures hold one converse_stream event per line, as
+yielded by response["stream"].
+
+Usage: python benchmarks/stream_replay.py [--runs N] [--scale N] [fixture ...]
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+import tracemalloc
+
+os.environ.setdefault("AWS_REGION", "us-east-1")
+os.environ.setdefault("AWS_DEFAULT_REGION", os.environ["AWS_REGION"])
+os.environ.setdefault("UPLOAD_BUCKET_NAME", "benchmark")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from tools import ConverseToolExecutor  # noqa: E402
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+class LegacyExecutor:
+    def __init__(self):
+        self.text_accumulator = ""
+        self.tool_use = {}
+        self.stop_on_tool_use = False
+
+    def process_chunk(self, chunk):
+        content_block_start = chunk.get("contentBlockStart")
+        content_block_stop = chunk.get("contentBlockStop")
+        contend_block_delta = chunk.get("contentBlockDelta")
+        stop_reason = chunk.get("messageStop", {}).get("stopReason")
+        if stop_reason == "tool_use":
+            self.stop_on_tool_use = True
+
+        content_block_index = None
+        if content_block_start:
+            content_block_index = content_block_start.get("contentBlockIndex")
+        elif content_block_stop:
+            content_block_index = content_block_stop.get("contentBlockIndex")
+        elif contend_block_delta:
+            content_block_index = contend_block_delta.get("contentBlockIndex")
+
+        delta = None
+        text = None
+        tool_use = None
+        if content_block_start:
+            start = content_block_start.get("start")
+            tool_use = start.get("toolUse")
+        elif contend_block_delta:
+            delta = contend_block_delta.get("delta")
+            tool_use = delta.get("toolUse")
+            text = delta.get("text")
+
+        if text:
+            self.text_accumulator += text
+            return text
+        if tool_use:
+            current_tool_use = self.tool_use.get(content_block_index)
+            if not current_tool_use:
+                current_tool_use = {
+                    "toolUseId": "",
+                    "name": "",
+                    "input": "",
+                }
+                self.tool_use[content_block_index] = current_tool_use
+
+            current_tool_use_id = tool_use.get("toolUseId")
+            if current_tool_use_id:
+                current_tool_use["toolUseId"] = current_tool_use_id
+            current_tool_use_name = tool_use.get("name")
+            if current_tool_use_name:
+                current_tool_use["name"] = current_tool_use_name
+            current_input = tool_use.get("input")
+            if current_input:
+                current_tool_use["input"] += current_input
+
+        return None
+
+    def get_assistant_messages(self):
+        if not self.text_accumulator and not self.tool_use:
+            return []
+
+        content = []
+        if self.text_accumulator:
+            content.append({"text": self.text_accumulator})
+
+        for current in self.tool_use.values():
+            content.append(
+                {
+                    "toolUse": {
+                        "toolUseId": current["toolUseId"],
+                        "name": current["name"],
+                        "input": json.loads(current["input"]) or {},
+                    }
+                }
+            )
+
+        return [{"role": "assistant", "content": content}]
+
+
+def load_events(path: str, scale: int):
+    with open(path, "r") as f:
+        events = [json.loads(line) for line in f if line.strip()]
+
+    if scale <= 1:
+        return events
+
+    # Longer answers of the same shape: the text deltas are repeated in place.
+    scaled = []
+    for event in events:
+        delta = event.get("contentBlockDelta", {}).get("delta", {})
+        scaled.extend([event] * (scale if "text" in delta else 1))
+
+    return scaled
+
+
+def replay(create_executor, events: list):
+    executor = create_executor()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    for chunk in events:
+        executor.process_chunk(chunk)
+    messages = executor.get_assistant_messages()
+
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak, messages
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("fixtures", nargs="*")
+    args = parser.parse_args()
+
+    paths = args.fixtures or sorted(glob.glob(os.path.join(FIXTURES_PATH, "*.jsonl")))
+    processors = {
+        "legacy": LegacyExecutor,
+        "current": lambda: ConverseToolExecutor("user", "session"),
+    }
+
+    for path in paths:
+        events = load_events(path, args.scale)
+        print(f"{os.path.basename(path)}: {len(events)} events")
+
+        results = {}
+        for name, create_executor in processors.items():
+            samples = [replay(create_executor, events) for _ in range(args.runs)]
+            elapsed = min(sample[0] for sample in samples)
+            peak = max(sample[1] for sample in samples)
+            results[name] = samples[0][2]
+
+            print(
+                f"  {name:<8} {len(events) / elapsed:>12,.0f} events/s"
+                f"  peak {peak / 1024:>8,.1f} KiB"
+            )
+
+        assert results["legacy"] == results["current"], "assistant messages differ"
+
+
+if __name__ == "__main__":
+    main()
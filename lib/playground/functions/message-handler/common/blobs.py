@@ -0,0 +1,148 @@
+import os
+import zlib
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+SESSION_BUCKET_NAME = os.environ.get("SESSION_BUCKET_NAME")
+SESSION_BLOB_THRESHOLD = int(os.environ.get("SESSION_BLOB_THRESHOLD", "16384"))
+BLOB_WORKERS = 8
+OFFLOADED_EXTRA = ("response_text", "response_html")
+
+blob_executor = ThreadPoolExecutor(max_workers=BLOB_WORKERS, thread_name_prefix="blob")
+
+
+def is_blob_ref(value):
+    return isinstance(value, dict) and "__blob__" in value
+
+
+# Large tool payloads are stored once per session as content-addressed
+# objects next to the session, and the session keeps {"__blob__": checksum}
+# in their place. Blobs already stored or loaded by this instance are not
+# written again, and loaded ones are kept for the later steps of the request.
+class SessionBlobs:
+    def __init__(self, s3_client, user_id: str, session_id: str):
+        self.s3_client = s3_client
+        self.user_id = user_id
+        self.session_id = session_id
+        self.stored = set()
+        self.loaded = {}
+
+    def key(self, checksum: str):
+        return f"{self.user_id}/{self.session_id}/blobs/{checksum}"
+
+    def offload(self, value):
+        if not isinstance(value, str):
+            return value
+
+        data = value.encode("utf-8")
+        if len(data) <= SESSION_BLOB_THRESHOLD:
+            return value
+
+        checksum = hashlib.sha256(data).hexdigest()
+        if checksum not in self.stored:
+            self.s3_client.put_object(
+                Bucket=SESSION_BUCKET_NAME,
+                Key=self.key(checksum),
+                Body=zlib.compress(data),
+            )
+            self.stored.add(checksum)
+
+        return {"__blob__": checksum, "size": len(data)}
+
+    def load(self, ref: dict):
+        checksum = ref["__blob__"]
+        if checksum in self.loaded:
+            return self.loaded[checksum]
+
+        response = self.s3_client.get_object(
+            Bucket=SESSION_BUCKET_NAME, Key=self.key(checksum)
+        )
+        value = zlib.decompress(response["Body"].read()).decode("utf-8")
+        self.stored.add(checksum)
+        self.loaded[checksum] = value
+
+        return value
+
+    # Returns the session to store; the session itself is left unchanged so
+    # it can still be sent to the model.
+    def offload_session(self, session: dict):
+        tool_extra = {}
+        for tool_use_id, extra in session.get("tool_extra", {}).items():
+            tool_extra[tool_use_id] = {
+                name: self.offload(value) if name in OFFLOADED_EXTRA else value
+                for name, value in extra.items()
+            }
+
+        messages = [self.offload_message(message) for message in session["messages"]]
+
+        return {**session, "tool_extra": tool_extra, "messages": messages}
+
+    def offload_message(self, message: dict):
+        return map_tool_result_content(message, self.offload_content)
+
+    def offload_content(self, content):
+        if not isinstance(content, dict) or "text" not in content:
+            return content
+
+        return {**content, "text": self.offload(content["text"])}
+
+    # Returns the messages with the tool result text in place, for the
+    # messages sent to the model. The session keeps its references, and so
+    # does tool_extra, which the user interface loads on demand.
+    def hydrate(self, messages: list):
+        refs = {
+            content["text"]["__blob__"]: content["text"]
+            for message in messages
+            for content in tool_result_content(message)
+            if is_blob_ref(content.get("text"))
+        }
+        if not refs:
+            return messages
+
+        values = dict(zip(refs, blob_executor.map(self.load, refs.values())))
+
+        def hydrate_content(content):
+            if not isinstance(content, dict) or not is_blob_ref(content.get("text")):
+                return content
+
+            return {**content, "text": values[content["text"]["__blob__"]]}
+
+        return [
+            map_tool_result_content(message, hydrate_content) for message in messages
+        ]
+
+
+def tool_result_content(message: dict):
+    for item in message.get("content", []):
+        tool_result = item.get("toolResult")
+        if not tool_result:
+            continue
+
+        for content in tool_result.get("content", []):
+            if isinstance(content, dict):
+                yield content
+
+
+# Returns the message with fn applied to the content of its tool results;
+# messages without tool results are returned as they are.
+def map_tool_result_content(message: dict, fn):
+    if not any("toolResult" in item for item in message.get("content", [])):
+        return message
+
+    content = []
+    for item in message["content"]:
+        tool_result = item.get("toolResult")
+        if tool_result:
+            item = {
+                **item,
+                "toolResult": {
+                    **tool_result,
+                    "content": [
+                        fn(current) for current in tool_result.get("content", [])
+                    ],
+                },
+            }
+
+        content.append(item)
+
+    return {**message, "content": content}
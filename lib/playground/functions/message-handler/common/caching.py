@@ -0,0 +1,122 @@
+import os
+import re
+import threading
+from botocore.exceptions import ClientError
+from common.context import is_turn_start
+
+# "auto" enables prompt caching for models known to support it, "1" for every
+# model and "0" disables it.
+PROMPT_CACHING = os.environ.get("PROMPT_CACHING", "auto")
+
+CACHE_POINT = {"cachePoint": {"type": "default"}}
+CACHING_MODELS = (
+    "anthropic.claude-3-5-haiku",
+    "anthropic.claude-3-7-sonnet",
+    "anthropic.claude-sonnet-4",
+    "anthropic.claude-opus-4",
+    "anthropic.claude-haiku-4",
+    "amazon.nova-micro",
+    "amazon.nova-lite",
+    "amazon.nova-pro",
+    "amazon.nova-premier",
+)
+USAGE_KEYS = (
+    "inputTokens",
+    "outputTokens",
+    "cacheReadInputTokens",
+    "cacheWriteInputTokens",
+)
+
+
+def base_model_id(model_id: str):
+    # Cross-region inference profiles prefix the model id with a geography.
+    model_id = model_id.split("/")[-1]
+
+    return re.sub(r"^(us|eu|apac|us-gov|global)\.", "", model_id)
+
+
+def is_caching_error(error: Exception):
+    if not isinstance(error, ClientError):
+        return False
+
+    details = error.response.get("Error", {})
+
+    return (
+        details.get("Code") == "ValidationException"
+        and "cach" in details.get("Message", "").lower()
+    )
+
+
+def with_cache_point(message: dict):
+    return {**message, "content": [*message["content"], CACHE_POINT]}
+
+
+# Adds cache points after the system prompt, which also covers the tool
+# configuration before it, after the last message, so the next request of a
+# tool loop reads everything up to it, and before the current turn, which
+# earlier requests of the session have written.
+def add_cache_points(system: list, messages: list):
+    system = [*system, CACHE_POINT]
+
+    points = {len(messages) - 1}
+    for idx in range(len(messages) - 1, 0, -1):
+        if is_turn_start(messages[idx]):
+            points.add(idx - 1)
+            break
+
+    messages = [
+        with_cache_point(message) if idx in points else message
+        for idx, message in enumerate(messages)
+    ]
+
+    return system, messages
+
+
+# Models that reject cache points with a validation error are remembered
+# and called without them from then on.
+class PromptCache:
+    def __init__(self, mode: str = PROMPT_CACHING):
+        self.mode = mode
+        self.unsupported = set()
+        self.lock = threading.Lock()
+
+    def supports(self, model_id: str):
+        if self.mode == "0" or model_id in self.unsupported:
+            return False
+        if self.mode == "1":
+            return True
+
+        return base_model_id(model_id).startswith(CACHING_MODELS)
+
+    def converse_stream(self, client, model_id: str, **kwargs):
+        if not self.supports(model_id) or not kwargs.get("messages"):
+            return client.converse_stream(modelId=model_id, **kwargs)
+
+        system, messages = add_cache_points(
+            kwargs.get("system", []), kwargs["messages"]
+        )
+
+        try:
+            return client.converse_stream(
+                modelId=model_id, **{**kwargs, "system": system, "messages": messages}
+            )
+        except Exception as e:
+            if not is_caching_error(e):
+                raise
+
+            print(f"Prompt caching is not supported by {model_id}: {e}")
+            with self.lock:
+                self.unsupported.add(model_id)
+
+            return client.converse_stream(modelId=model_id, **kwargs)
+
+
+def add_usage(totals: dict, usage: dict):
+    for key in USAGE_KEYS:
+        totals[key] = totals.get(key, 0) + usage.get(key, 0)
+
+    return totals
+
+
+def usage_since(start: dict, totals: dict):
+    return {key: totals.get(key, 0) - start.get(key, 0) for key in USAGE_KEYS}
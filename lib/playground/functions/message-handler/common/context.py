@@ -0,0 +1,163 @@
+import os
+import json
+from common.tokens import estimate_content_tokens, estimate_messages_tokens
+
+CONTEXT_MAX_TOKENS = int(os.environ.get("CONTEXT_MAX_TOKENS", "60000"))
+CONTEXT_RECENT_TOKENS = int(os.environ.get("CONTEXT_RECENT_TOKENS", "20000"))
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.environ.get("CONTEXT_SUMMARY_MAX_TOKENS", "1024"))
+# Tool inputs and results are clipped to this many characters in the
+# transcript that is summarized.
+SUMMARY_TOOL_CHARS = 2000
+
+SUMMARY_PROMPT = """
+You maintain a running summary of a conversation between a user and an assistant that can use tools.
+Update the summary with the new part of the conversation.
+Keep facts, decisions, requirements, names of files and artifacts, code that is still relevant, tool results the assistant relied on and open tasks.
+Drop greetings, repetition and anything superseded.
+Write the summary in plain text, without preamble.
+"""
+
+
+def is_turn_start(message: dict):
+    # A user message that is not a tool result starts a turn. Splitting only
+    # there keeps each toolUse with its toolResult.
+    return message["role"] == "user" and not any(
+        "toolResult" in item for item in message["content"]
+    )
+
+
+def clip(text: str, limit: int = SUMMARY_TOOL_CHARS):
+    if len(text) <= limit:
+        return text
+
+    return f"{text[:limit]}... [{len(text) - limit} characters omitted]"
+
+
+def format_transcript(messages: list):
+    lines = []
+    for message in messages:
+        for item in message["content"]:
+            if "text" in item:
+                lines.append(f"{message['role']}: {item['text']}")
+            elif "image" in item:
+                lines.append(f"{message['role']}: [image]")
+            elif "toolUse" in item:
+                tool_use = item["toolUse"]
+                tool_input = clip(json.dumps(tool_use.get("input", {})))
+                lines.append(f"assistant: [tool {tool_use['name']}] {tool_input}")
+            elif "toolResult" in item:
+                tool_result = item["toolResult"]
+                text = "\n".join(
+                    content["text"]
+                    for content in tool_result.get("content", [])
+                    if isinstance(content.get("text"), str)
+                )
+                lines.append(
+                    f"tool result ({tool_result.get('status', 'success')}): "
+                    f"{clip(text)}"
+                )
+
+    return "\n\n".join(lines)
+
+
+def with_summary(messages: list, summary: str):
+    first, *rest = messages
+    text = f"<conversation_summary>\n{summary}\n</conversation_summary>"
+
+    return [{**first, "content": [{"text": text}, *first["content"]]}, *rest]
+
+
+# Builds the messages sent to the model. The session keeps the full history;
+# once it no longer fits CONTEXT_MAX_TOKENS, the turns before the most recent
+# CONTEXT_RECENT_TOKENS are replaced with a rolling summary. The summary and
+# the number of messages it covers are stored in the session and reused until
+# the history outgrows the limit again, when the next part is folded into it.
+class ContextManager:
+    def __init__(
+        self,
+        summarize,
+        max_tokens: int = CONTEXT_MAX_TOKENS,
+        recent_tokens: int = CONTEXT_RECENT_TOKENS,
+    ):
+        self.summarize = summarize
+        self.max_tokens = max_tokens
+        self.recent_tokens = recent_tokens
+
+    def prepare(self, system: list, messages: list, context: dict, hydrate=None):
+        system_tokens = estimate_content_tokens(system)
+        full_tokens = system_tokens + estimate_messages_tokens(messages)
+
+        request_messages = self.build(messages, context)
+        request_tokens = system_tokens + estimate_messages_tokens(request_messages)
+
+        if request_tokens > self.max_tokens:
+            split = self.find_split(messages, context.get("summarized", 0))
+            if split > context.get("summarized", 0):
+                self.fold(messages, split, context, hydrate)
+                request_messages = self.build(messages, context)
+                request_tokens = system_tokens + estimate_messages_tokens(
+                    request_messages
+                )
+
+        stats = {
+            "full_tokens": full_tokens,
+            "request_tokens": request_tokens,
+            "saved_tokens": full_tokens - request_tokens,
+            "summarized_messages": context.get("summarized", 0),
+        }
+
+        return request_messages, stats
+
+    def build(self, messages: list, context: dict):
+        summarized = context.get("summarized", 0)
+        summary = context.get("summary")
+        if not summarized or not summary or summarized >= len(messages):
+            return messages
+
+        return with_summary(messages[summarized:], summary)
+
+    # The latest turn start that leaves at least recent_tokens after it. The
+    # last turn is always kept, however long it is.
+    def find_split(self, messages: list, start: int):
+        split = start
+        recent = 0
+        for idx in range(len(messages) - 1, start, -1):
+            recent += estimate_content_tokens(messages[idx]["content"])
+            if is_turn_start(messages[idx]):
+                split = idx
+                if recent >= self.recent_tokens:
+                    break
+
+        return split
+
+    # hydrate loads the stored tool results of the part that is summarized.
+    def fold(self, messages: list, split: int, context: dict, hydrate=None):
+        summarized = context.get("summarized", 0)
+        folded = messages[summarized:split]
+
+        try:
+            if hydrate:
+                folded = hydrate(folded)
+
+            summary = self.summarize(context.get("summary"), format_transcript(folded))
+        except Exception as e:
+            # Without a summary the older turns are dropped rather than
+            # sending a request that does not fit.
+            print(f"Failed to summarize context: {e}")
+            summary = context.get("summary") or "Earlier turns were omitted."
+
+        context["summary"] = summary
+        context["summarized"] = split
+
+
+def summary_request(previous: str, transcript: str):
+    parts = []
+    if previous:
+        parts.append(f"<summary>\n{previous}\n</summary>")
+    parts.append(f"<conversation>\n{transcript}\n</conversation>")
+
+    return {
+        "system": [{"text": SUMMARY_PROMPT}],
+        "messages": [{"role": "user", "content": [{"text": "\n\n".join(parts)}]}],
+        "inferenceConfig": {"maxTokens": CONTEXT_SUMMARY_MAX_TOKENS, "temperature": 0},
+    }
@@ -1,10 +1,16 @@
 import os
 import uuid
 import urllib.parse
+from collections import OrderedDict
 
 AWS_REGION = os.environ["AWS_REGION"]
 MAX_FILE_SIZE = 100 * 1000 * 1000  # 100Mb
 UPLOAD_BUCKET_NAME = os.environ.get("UPLOAD_BUCKET_NAME")
+INLINED_SESSIONS_MAX = 256
+
+# Checksums of the images inlined into the sessions this instance served
+# most recently.
+inlined_checksums = OrderedDict()
 
 
 def generate_presigned_get(s3_client, user_id: str, session_id: str, file_name: str):
@@ -50,6 +56,35 @@ def generate_presigned_post(
     return response
 
 
+def generate_presigned_post_prefix(
+    s3_client, prefix: str, max_size: int = MAX_FILE_SIZE, expiration=15 * 60
+):
+    response = s3_client.generate_presigned_post(
+        UPLOAD_BUCKET_NAME,
+        f"{prefix}${{filename}}",
+        Conditions=[["content-length-range", 0, max_size]],
+        ExpiresIn=expiration,
+    )
+
+    response["url"] = f"https://{UPLOAD_BUCKET_NAME}.s3.{AWS_REGION}.amazonaws.com"
+
+    return response
+
+
+def generate_presigned_post_response_prefix(
+    s3_client, user_id: str, session_id: str, expiration=3600
+):
+    file_id = str(uuid.uuid4())
+    prefix = f"{user_id}/{session_id}/response/{file_id}/"
+
+    response = generate_presigned_post_prefix(
+        s3_client, prefix, expiration=expiration
+    )
+    response["file_id"] = file_id
+
+    return response
+
+
 def filter_inline_files(files, inline_files):
     ret_value = []
     checksums = [file.get("checksum") for file in inline_files]
@@ -77,24 +112,68 @@ def filter_inline_files(files, inline_files):
     return ret_value
 
 
-def get_inline_file_data(s3_client, user_id, session_id, files_to_inline):
-    ret_value = []
+def inline_file_key(user_id, session_id, file_name):
+    file_name = os.path.basename(file_name)
+    url_encoded_key = urllib.parse.quote(file_name)
+
+    return f"{user_id}/{session_id}/request/{url_encoded_key}"
+
+
+def remember_inlined(session_id, inline_files):
+    inlined_checksums[session_id] = [
+        {"checksum": file.get("checksum")} for file in inline_files
+    ]
+    inlined_checksums.move_to_end(session_id)
+
+    while len(inlined_checksums) > INLINED_SESSIONS_MAX:
+        inlined_checksums.popitem(last=False)
+
+
+# Starts fetching the new images among the session files before the session
+# is loaded, keyed by checksum. Images are only known to be new in a new
+# session or when this instance served the previous turn of the session;
+# otherwise nothing is fetched ahead. Only the headers are awaited; the bodies
+# of images with a stored variant are never read.
+def prefetch_inline_files(
+    s3_client, user_id, session_id, files, executor, new_session=False
+):
+    inline_files = inlined_checksums.get(session_id)
+    if inline_files is None:
+        if not new_session:
+            return {}
+
+        inline_files = []
 
-    for file_to_inline in files_to_inline:
-        format = file_to_inline.get("format")
-        file_name = file_to_inline.get("file_name")
-        file_name = os.path.basename(file_name)
-        url_encoded_key = urllib.parse.quote(file_name)
-        s3_key = f"{user_id}/{session_id}/request/{url_encoded_key}"
-
-        response = s3_client.get_object(Bucket=UPLOAD_BUCKET_NAME, Key=s3_key)
-        file_content = response["Body"].read()
-
-        ret_value.append(
-            {
-                "format": format,
-                "data": file_content,
-            }
+    return {
+        file_to_inline["checksum"]: executor.submit(
+            s3_client.get_object,
+            Bucket=UPLOAD_BUCKET_NAME,
+            Key=inline_file_key(user_id, session_id, file_to_inline["file_name"]),
         )
+        for file_to_inline in filter_inline_files(files, inline_files)
+    }
+
+
+# Releases the prefetched responses, whether or not their bodies were read.
+def discard_prefetched(prefetched: dict):
+    def close(future):
+        if not future.exception():
+            future.result()["Body"].close()
+
+    for future in prefetched.values():
+        if not future.cancel():
+            future.add_done_callback(close)
+
+
+def read_inline_file(s3_client, user_id, session_id, file_to_inline, prefetched={}):
+    future = prefetched.get(file_to_inline.get("checksum"))
+    if future:
+        response = future.result()
+    else:
+        response = s3_client.get_object(
+            Bucket=UPLOAD_BUCKET_NAME,
+            Key=inline_file_key(user_id, session_id, file_to_inline.get("file_name")),
+        )
+
+    return response["Body"].read()
 
-    return ret_value
@@ -0,0 +1,170 @@
+import io
+import os
+import hashlib
+from PIL import Image, ImageOps
+from common.memory import MemoryBackend
+from common.blobs import blob_executor
+from common import metrics
+
+SESSION_BUCKET_NAME = os.environ.get("SESSION_BUCKET_NAME")
+IMAGE_FORMAT = os.environ.get("IMAGE_FORMAT", "webp")
+IMAGE_QUALITY = int(os.environ.get("IMAGE_QUALITY", "85"))
+# Larger images are downscaled by the models anyway.
+IMAGE_MAX_DIMENSION = int(os.environ.get("IMAGE_MAX_DIMENSION", "1568"))
+IMAGE_CACHE_MAX_BYTES = int(
+    os.environ.get("IMAGE_CACHE_MAX_BYTES", str(32 * 1000 * 1000))
+)
+
+SIGNATURES = {
+    b"\x89PNG": "png",
+    b"\xff\xd8": "jpeg",
+    b"GIF8": "gif",
+    b"RIFF": "webp",
+}
+
+
+def is_image_ref(source):
+    return isinstance(source, dict) and "__image__" in source
+
+
+def detect_format(data: bytes, default: str = "png"):
+    for signature, format in SIGNATURES.items():
+        if data.startswith(signature):
+            return format
+
+    return default
+
+
+def encode_image(data: bytes, format: str):
+    try:
+        image = Image.open(io.BytesIO(data))
+        image = ImageOps.exif_transpose(image)
+    except Exception as e:
+        print(f"Failed to decode {format} image: {e}")
+        return data, format
+
+    resized = max(image.size) > IMAGE_MAX_DIMENSION
+    if resized:
+        image.thumbnail((IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION))
+
+    if image.mode not in ("RGB", "RGBA"):
+        has_alpha = "A" in image.mode or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+    buffer = io.BytesIO()
+    if IMAGE_FORMAT == "webp":
+        image.save(buffer, format="WEBP", quality=IMAGE_QUALITY, method=4)
+    elif IMAGE_FORMAT == "jpeg" and image.mode == "RGB":
+        image.save(buffer, format="JPEG", quality=IMAGE_QUALITY, optimize=True)
+    else:
+        image.save(buffer, format="PNG", optimize=True)
+
+    encoded = buffer.getvalue()
+    if not resized and len(encoded) >= len(data):
+        return data, format
+
+    return encoded, detect_format(encoded)
+
+
+# Inlined attachments are downscaled and re-encoded once per user and
+# checksum and stored next to the user's sessions. Sessions keep
+# {"__image__": key} as the image source and the bytes are only put back
+# into the copy of the messages sent to the model. Recently used variants
+# are kept in memory.
+class ImageStore:
+    def __init__(self, s3_client, cache: MemoryBackend = None):
+        self.s3_client = s3_client
+        self.cache = cache or MemoryBackend(IMAGE_CACHE_MAX_BYTES)
+
+    def key(self, user_id: str, checksum: str):
+        return f"{user_id}/images/{checksum}-{IMAGE_MAX_DIMENSION}"
+
+    def get(self, key: str):
+        cached = self.cache.get(key)
+        if cached:
+            return cached[1]
+
+        response = self.s3_client.get_object(Bucket=SESSION_BUCKET_NAME, Key=key)
+        data = response["Body"].read()
+        self.cache.put(key, float("inf"), data)
+
+        return data
+
+    # read_original is only called when no variant has been stored yet.
+    def inline(self, user_id: str, file_to_inline: dict, read_original):
+        checksum = file_to_inline.get("checksum")
+        data = None
+        if checksum:
+            key = self.key(user_id, checksum)
+            try:
+                data = self.get(key)
+            except self.s3_client.exceptions.NoSuchKey:
+                pass
+
+        if data is None:
+            original = read_original(file_to_inline)
+            checksum = checksum or hashlib.sha256(original).hexdigest()
+            key = self.key(user_id, checksum)
+
+            data, _ = encode_image(original, file_to_inline["format"])
+            self.s3_client.put_object(Bucket=SESSION_BUCKET_NAME, Key=key, Body=data)
+            self.cache.put(key, float("inf"), data)
+
+            metrics.add("ImageOriginalBytes", len(original), metrics.BYTES)
+            metrics.add("ImageStoredBytes", len(data), metrics.BYTES)
+
+        return {
+            "image": {
+                "format": detect_format(data, file_to_inline["format"]),
+                "source": {"__image__": key, "size": len(data)},
+            }
+        }
+
+    def inline_files(self, user_id: str, files_to_inline: list, read_original):
+        return list(
+            blob_executor.map(
+                lambda current: self.inline(user_id, current, read_original),
+                files_to_inline,
+            )
+        )
+
+    # Returns the messages with the image bytes in place; messages without
+    # image references are shared, the others are copied.
+    def hydrate(self, messages: list):
+        keys = {
+            item["image"]["source"]["__image__"]
+            for message in messages
+            for item in message["content"]
+            if is_image_ref(item.get("image", {}).get("source"))
+        }
+        if not keys:
+            return messages
+
+        data = dict(zip(keys, blob_executor.map(self.get, keys)))
+
+        def hydrate_item(item):
+            source = item.get("image", {}).get("source")
+            if not is_image_ref(source):
+                return item
+
+            return {
+                **item,
+                "image": {
+                    **item["image"],
+                    "source": {"bytes": data[source["__image__"]]},
+                },
+            }
+
+        def hydrate_message(message):
+            if not any(
+                is_image_ref(item.get("image", {}).get("source"))
+                for item in message["content"]
+            ):
+                return message
+
+            return {
+                **message,
+                "content": [hydrate_item(item) for item in message["content"]],
+            }
+
+        return [hydrate_message(message) for message in messages]
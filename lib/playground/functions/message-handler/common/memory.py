@@ -0,0 +1,44 @@
+import threading
+from collections import OrderedDict
+
+
+# A size-bounded, least recently used in-memory store of byte values with
+# their expiry, shared by the tool result caches and the image store.
+class MemoryBackend:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            self.entries.move_to_end(key)
+            return entry[0], entry[1]
+
+    def put(self, key: str, expires: float, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+
+        with self.lock:
+            self.delete_locked(key)
+
+            self.entries[key] = (expires, data)
+            self.total_bytes += len(data)
+
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+
+    def delete(self, key: str):
+        with self.lock:
+            self.delete_locked(key)
+
+    def delete_locked(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= len(entry[1])
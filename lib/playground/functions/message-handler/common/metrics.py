@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import threading
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1")
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "ArtifactsAndTools")
+FUNCTION_NAME = os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "message-handler")
+# CloudWatch accepts up to 100 metrics per document and 100 values per metric.
+EMF_MAX_METRICS = 100
+EMF_MAX_VALUES = 100
+
+MILLISECONDS = "Milliseconds"
+BYTES = "Bytes"
+COUNT = "Count"
+
+
+class Timer:
+    def __init__(self, name: str, dimensions: dict = None):
+        self.name = name
+        self.dimensions = dimensions
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.elapsed = (time.perf_counter() - self.start) * 1000
+        add(self.name, self.elapsed, MILLISECONDS, self.dimensions)
+
+
+# Metrics of one request. Values added with add() are kept as distributions,
+# increment() sums into a single value. flush() writes them to stdout as
+# CloudWatch embedded metric format documents, one per set of dimensions,
+# followed by a summary record of the request.
+class RequestMetrics:
+    def __init__(self, dimensions: dict = {}, properties: dict = {}):
+        self.dimensions = {"Function": FUNCTION_NAME, **dimensions}
+        self.properties = dict(properties)
+        self.metrics = {}
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def entry(self, name: str, unit: str, dimensions: dict):
+        key = (name, tuple(sorted((dimensions or {}).items())))
+        if key not in self.metrics:
+            self.metrics[key] = {"unit": unit, "values": []}
+
+        return self.metrics[key]
+
+    def add(self, name: str, value: float, unit: str = COUNT, dimensions=None):
+        with self.lock:
+            self.entry(name, unit, dimensions)["values"].append(value)
+
+    def increment(self, name: str, value: float = 1, unit=COUNT, dimensions=None):
+        with self.lock:
+            values = self.entry(name, unit, dimensions)["values"]
+            if values:
+                values[0] += value
+            else:
+                values.append(value)
+
+    def set_property(self, key: str, value):
+        with self.lock:
+            self.properties[key] = value
+
+    def documents(self):
+        groups = {}
+        for (name, dimensions), metric in self.metrics.items():
+            groups.setdefault(dimensions, []).append((name, metric))
+
+        timestamp = int(time.time() * 1000)
+        for dimensions, metrics in groups.items():
+            dimensions = {**self.dimensions, **dict(dimensions)}
+
+            for start in range(0, len(metrics), EMF_MAX_METRICS):
+                chunk = metrics[start : start + EMF_MAX_METRICS]
+                rounds = max(len(metric["values"]) for _, metric in chunk)
+
+                for offset in range(0, rounds, EMF_MAX_VALUES):
+                    values = {
+                        name: metric["values"][offset : offset + EMF_MAX_VALUES]
+                        for name, metric in chunk
+                        if metric["values"][offset : offset + EMF_MAX_VALUES]
+                    }
+
+                    yield {
+                        "_aws": {
+                            "Timestamp": timestamp,
+                            "CloudWatchMetrics": [
+                                {
+                                    "Namespace": METRICS_NAMESPACE,
+                                    "Dimensions": [list(dimensions)],
+                                    "Metrics": [
+                                        {"Name": name, "Unit": metric["unit"]}
+                                        for name, metric in chunk
+                                        if name in values
+                                    ],
+                                }
+                            ],
+                        },
+                        **dimensions,
+                        **values,
+                    }
+
+    def summary(self):
+        metrics = {}
+        for (name, dimensions), metric in self.metrics.items():
+            label = ".".join([name, *(value for _, value in dimensions)])
+            values = metric["values"]
+            metrics[label] = {
+                "count": len(values),
+                "sum": round(sum(values), 3),
+                "max": round(max(values), 3),
+            }
+
+        return {
+            "summary": "request",
+            "duration_ms": round((time.perf_counter() - self.start) * 1000, 1),
+            **self.properties,
+            "metrics": metrics,
+        }
+
+    def flush(self, out=print):
+        with self.lock:
+            for document in self.documents():
+                out(json.dumps(document, default=str))
+            out(json.dumps(self.summary(), default=str))
+
+
+# The handler serves one request at a time per container, so the metrics of
+# the current request are module state, like the WebSocket sequence, and are
+# reachable from the threads the request starts.
+current = None
+
+
+def begin(dimensions: dict = {}, properties: dict = {}):
+    global current
+
+    current = RequestMetrics(dimensions, properties) if METRICS_ENABLED == "1" else None
+
+    return current
+
+
+def end():
+    global current
+
+    request_metrics, current = current, None
+    if request_metrics:
+        request_metrics.flush()
+
+
+def add(name: str, value: float, unit: str = COUNT, dimensions: dict = None):
+    if current:
+        current.add(name, value, unit, dimensions)
+
+
+def increment(name: str, value: float = 1, unit: str = COUNT, dimensions=None):
+    if current:
+        current.increment(name, value, unit, dimensions)
+
+
+def set_property(key: str, value):
+    if current:
+        current.set_property(key, value)
+
+
+def timer(name: str, dimensions: dict = None):
+    return Timer(name, dimensions)
@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import boto3
+import threading
+from botocore.exceptions import ClientError, HTTPClientError
+from botocore.exceptions import ConnectionError as BotoConnectionError
+from common.throttling import RETRYABLE_ERRORS
+from common.caching import PromptCache
+
+BEDROCK_REGION = os.environ.get("BEDROCK_REGION")
+BEDROCK_MODEL = os.environ.get("BEDROCK_MODEL")
+BEDROCK_ENDPOINTS = os.environ.get("BEDROCK_ENDPOINTS")
+BEDROCK_LOW_PRIORITY_ENDPOINTS = os.environ.get("BEDROCK_LOW_PRIORITY_ENDPOINTS")
+ROUTER_FAILURE_THRESHOLD = int(os.environ.get("ROUTER_FAILURE_THRESHOLD", "3"))
+ROUTER_OPEN_SECONDS = float(os.environ.get("ROUTER_OPEN_SECONDS", "30"))
+ROUTER_LATENCY_ALPHA = float(os.environ.get("ROUTER_LATENCY_ALPHA", "0.3"))
+# An endpoint later in the list is only preferred when it is this much faster.
+ROUTER_LATENCY_MARGIN = float(os.environ.get("ROUTER_LATENCY_MARGIN", "1.5"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class NoEndpointAvailable(Exception):
+    pass
+
+
+# Errors worth sending to another endpoint: throttling, 5xx and connection
+# errors. Anything else, such as a validation error, would fail the same way
+# everywhere.
+def is_failover_error(error: Exception):
+    if isinstance(error, (BotoConnectionError, HTTPClientError)):
+        return True
+    if not isinstance(error, ClientError):
+        return False
+
+    code = error.response.get("Error", {}).get("Code")
+    status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+
+    return code in RETRYABLE_ERRORS or status >= 500
+
+
+def parse_endpoints(value: str):
+    if not value:
+        return []
+
+    return [
+        {"region": endpoint.get("region"), "model": endpoint["model"]}
+        for endpoint in json.loads(value)
+    ]
+
+
+# Latency is the time until converse_stream returns, which is when the
+# response headers arrive and the model has accepted the request.
+class Endpoint:
+    def __init__(self, region: str, model: str, client):
+        self.region = region
+        self.model = model
+        self.client = client
+        self.latency = None
+        self.failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def name(self):
+        return f"{self.region}/{self.model}"
+
+    def available(self, now: float):
+        with self.lock:
+            if self.state == OPEN and now - self.opened_at >= ROUTER_OPEN_SECONDS:
+                self.state = HALF_OPEN
+
+            return self.state == CLOSED or (
+                self.state == HALF_OPEN and not self.probing
+            )
+
+    # A half-open endpoint lets a single request through as a probe.
+    def begin(self):
+        with self.lock:
+            if self.state != HALF_OPEN:
+                return True
+            if self.probing:
+                return False
+
+            self.probing = True
+            return True
+
+    def record_success(self, latency: float):
+        with self.lock:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += ROUTER_LATENCY_ALPHA * (latency - self.latency)
+
+            self.failures = 0
+            self.state = CLOSED
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == HALF_OPEN or self.failures >= ROUTER_FAILURE_THRESHOLD:
+                if self.state != OPEN:
+                    print(f"Opening circuit for {self.name}")
+                self.state = OPEN
+                self.opened_at = time.time()
+
+    def to_dict(self):
+        return {
+            "endpoint": self.name,
+            "state": self.state,
+            "failures": self.failures,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency else None,
+        }
+
+
+# Sends each request to the first healthy endpoint in configuration order,
+# unless a later one has been markedly faster, and fails over to the next
+# endpoint on throttling or 5xx. Low-priority requests go to their own
+# endpoints first and fall back to the normal ones. When every endpoint
+# fails, the last error is raised so the caller can back off and retry.
+class BedrockRouter:
+    def __init__(
+        self,
+        endpoints: list,
+        low_priority_endpoints: list = None,
+        prompt_cache: PromptCache = None,
+    ):
+        if not endpoints:
+            raise ValueError("At least one Bedrock endpoint is required")
+
+        self.endpoints = endpoints
+        self.low_priority_endpoints = low_priority_endpoints or []
+        self.prompt_cache = prompt_cache
+
+    def candidates(self, priority: str = "normal"):
+        groups = [self.endpoints]
+        if priority == "low" and self.low_priority_endpoints:
+            groups.insert(0, self.low_priority_endpoints)
+
+        now = time.time()
+        candidates = []
+        for endpoints in groups:
+            available = [endpoint for endpoint in endpoints if endpoint.available(now)]
+            candidates.extend(sorted(available, key=self.rank(available)))
+
+        if not candidates:
+            # Every circuit is open: try the one that opened first rather
+            # than failing without a request.
+            endpoints = [endpoint for group in groups for endpoint in group]
+            return sorted(endpoints, key=lambda endpoint: endpoint.opened_at)[:1]
+
+        return candidates
+
+    def rank(self, endpoints: list):
+        positions = {id(endpoint): idx for idx, endpoint in enumerate(endpoints)}
+        best = min(
+            (endpoint.latency for endpoint in endpoints if endpoint.latency),
+            default=None,
+        )
+
+        def key(endpoint):
+            slow = (
+                best is not None
+                and endpoint.latency is not None
+                and endpoint.latency > best * ROUTER_LATENCY_MARGIN
+            )
+            return (slow, positions[id(endpoint)])
+
+        return key
+
+    # Cache points are added for the endpoint's model when the router has a
+    # prompt cache and the request is part of a conversation worth caching.
+    def converse_stream(
+        self, priority: str = "normal", cache: bool = True, **kwargs
+    ):
+        error = None
+        for endpoint in self.candidates(priority):
+            if not endpoint.begin():
+                continue
+
+            start = time.perf_counter()
+            try:
+                if cache and self.prompt_cache:
+                    response = self.prompt_cache.converse_stream(
+                        endpoint.client, endpoint.model, **kwargs
+                    )
+                else:
+                    response = endpoint.client.converse_stream(
+                        modelId=endpoint.model, **kwargs
+                    )
+            except Exception as e:
+                if not is_failover_error(e):
+                    # The endpoint answered; the request itself is at fault.
+                    endpoint.record_success(time.perf_counter() - start)
+                    raise
+
+                endpoint.record_failure()
+                print(f"Bedrock endpoint {endpoint.name} failed: {e}")
+                error = e
+                continue
+
+            endpoint.record_success(time.perf_counter() - start)
+
+            return endpoint, response
+
+        raise error or NoEndpointAvailable("No Bedrock endpoint is available")
+
+    def stats(self):
+        endpoints = self.endpoints + self.low_priority_endpoints
+
+        return [endpoint.to_dict() for endpoint in endpoints]
+
+
+def create_router(create_client=None):
+    clients = {}
+
+    def get_client(region: str):
+        if region not in clients:
+            if create_client:
+                clients[region] = create_client(region)
+            else:
+                clients[region] = boto3.client("bedrock-runtime", region_name=region)
+
+        return clients[region]
+
+    def create_endpoints(config: list):
+        return [
+            Endpoint(
+                endpoint["region"] or BEDROCK_REGION,
+                endpoint["model"],
+                get_client(endpoint["region"] or BEDROCK_REGION),
+            )
+            for endpoint in config
+        ]
+
+    endpoints = parse_endpoints(BEDROCK_ENDPOINTS) or [
+        {"region": BEDROCK_REGION, "model": BEDROCK_MODEL}
+    ]
+
+    return BedrockRouter(
+        create_endpoints(endpoints),
+        create_endpoints(parse_endpoints(BEDROCK_LOW_PRIORITY_ENDPOINTS)),
+        PromptCache(),
+    )
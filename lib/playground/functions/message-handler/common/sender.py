@@ -3,7 +3,10 @@ import math
 import json
 import uuid
 import boto3
+import threading
 from tools.executor import ConverseToolExecutor
+from tools.streaming import records_text
+from common import metrics
 
 MAX_PAYLOAD_SIZE = 24 * 1024  # 24 KB
 
@@ -13,6 +16,7 @@ api_gateway_management_api = boto3.client(
 )
 
 sequence_idx = 0
+sequence_lock = threading.Lock()
 
 
 class MessageSender:
@@ -20,6 +24,12 @@ class MessageSender:
         self.connection_id = connection_id
 
     def send_data(self, data):
+        # Tool uses running concurrently report progress from their own
+        # threads; frames of one message are kept together and in sequence.
+        with sequence_lock:
+            self.send_data_locked(data)
+
+    def send_data_locked(self, data):
         global sequence_idx
 
         sequence_idx += 1
@@ -49,6 +59,10 @@ class MessageSender:
                 Data=json.dumps(frame_message, indent=None, separators=(",", ":")),
             )
 
+        metrics.increment("WebSocketMessages")
+        metrics.increment("WebSocketFrames", num_frames)
+        metrics.increment("WebSocketBytes", total_length, metrics.BYTES)
+
     def send_error(self, error):
         self.send_data(
             {"event_type": "ERROR", "error": error},
@@ -59,11 +73,12 @@ class MessageSender:
             {"event_type": "HEARTBEAT", "payload": payload},
         )
 
-    def send_loop(self, finish):
+    def send_loop(self, finish, session_version=None):
         self.send_data(
             {
                 "event_type": "LOOP",
                 "finish": finish,
+                "session_version": session_version,
             },
         )
 
@@ -119,6 +134,18 @@ class MessageSender:
 
         return tool_use_extra
 
+    def send_tool_progress(self, tool_use_id, tool_name, records):
+        text = records_text(records)
+        if not text:
+            return
+
+        self.send_tool(
+            tool_use_id,
+            tool_name,
+            "running",
+            extra={"response_text_delta": text},
+        )
+
     def send_tool_finished_messages(self, executor: ConverseToolExecutor):
         tool_results = executor.get_tool_results()
         tool_results_extra = {current["toolUseId"]: {} for current in tool_results}
@@ -132,6 +159,7 @@ class MessageSender:
             extra = current.get("extra", {})
             response_html = extra.get("html")
             output_files = extra.get("output_files", [])
+            cache = extra.get("cache")
 
             extra = {
                 "response_text": response_text,
@@ -139,6 +167,9 @@ class MessageSender:
                 "output_files": output_files,
             }
 
+            if cache:
+                extra["cache"] = cache
+
             tool_results_extra[tool_use_id] = extra
 
             self.send_tool(
@@ -1,39 +1,88 @@
 import os
+import time
 import boto3
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 from common.serialization import serialize, deserialize
+from common.blobs import SessionBlobs
+from common import metrics
 
 SESSION_TABLE_NAME = os.environ.get("SESSION_TABLE_NAME")
 SESSION_BUCKET_NAME = os.environ.get("SESSION_BUCKET_NAME")
+# How long load_session waits for a save of the requested version that is
+# still in flight in another invocation.
+SESSION_LOAD_WAIT = float(os.environ.get("SESSION_LOAD_WAIT", "10"))
+SESSION_LOAD_POLL_INTERVAL = 0.1
+SESSION_IO_WORKERS = 8
+
+session_executor = ThreadPoolExecutor(
+    max_workers=SESSION_IO_WORKERS, thread_name_prefix="session"
+)
 
 dynamodb = boto3.resource("dynamodb")
 table = dynamodb.Table(SESSION_TABLE_NAME)
 
 
-def load_session(s3_client, user_id: str, session_id: str):
+# Sessions carry a version that is increased on every save. A client that
+# continues a conversation passes the version it was told about, and an older
+# session is polled for until the save that produced it has landed.
+def load_session(
+    s3_client,
+    user_id: str,
+    session_id: str,
+    min_version: int = 0,
+):
     key = f"{user_id}/{session_id}/session.jsonb"
-    new_session = False
+    deadline = time.time() + SESSION_LOAD_WAIT
+
+    while True:
+        try:
+            with metrics.timer("SessionLoadTime"):
+                response = s3_client.get_object(Bucket=SESSION_BUCKET_NAME, Key=key)
+                body = response["Body"].read()
+                data = deserialize(body)
+            metrics.add("SessionLoadBytes", len(body), metrics.BYTES)
+        except s3_client.exceptions.NoSuchKey:
+            data = None
+
+        version = data.get("version", 0) if data else 0
+        if version >= min_version or time.time() >= deadline:
+            break
+
+        time.sleep(SESSION_LOAD_POLL_INTERVAL)
+
+    if version < min_version:
+        print(f"Session {session_id} is at version {version}, expected {min_version}")
 
-    try:
-        response = s3_client.get_object(Bucket=SESSION_BUCKET_NAME, Key=key)
-        data = deserialize(response["Body"].read())
-    except s3_client.exceptions.NoSuchKey:
+    if data is None:
         data = {
             "session_id": session_id,
             "messages": [],
             "tool_extra": {},
             "inline_files": [],
+            "context": {},
+            "version": 0,
         }
-        new_session = True
 
-    return new_session, data
+        return True, data
 
+    return False, data
 
-def save_session(s3_client, user_id: str, session_id: str, session: dict):
+
+def save_session(
+    s3_client, user_id: str, session_id: str, session: dict, blobs: SessionBlobs = None
+):
     key = f"{user_id}/{session_id}/session.jsonb"
-    body = serialize(session)
 
-    s3_client.put_object(Bucket=SESSION_BUCKET_NAME, Key=key, Body=body)
+    with metrics.timer("SessionSaveTime"):
+        if blobs:
+            session = blobs.offload_session(session)
+
+        body = serialize(session)
+
+        s3_client.put_object(Bucket=SESSION_BUCKET_NAME, Key=key, Body=body)
+
+    metrics.add("SessionSaveBytes", len(body), metrics.BYTES)
 
 
 def create_dynamodb_session(user_id: str, session_id: str, title: str = ""):
@@ -1,3 +1,5 @@
+import functools
+
 _assistant = """
 Use tools if they can help answer a question.
 To achieve the best results, follow these instructions:
@@ -55,7 +57,14 @@ DON'T create artifacts of types other than: "html" and "react".
 """
 
 
+# The prompt is the same for every request of a session, so it is built once
+# per set of files and shared; callers must not modify it.
 def system_messages(artifacts_enabled: bool, file_names: list[str]):
+    return _system_messages(artifacts_enabled, tuple(file_names))
+
+
+@functools.lru_cache(maxsize=128)
+def _system_messages(artifacts_enabled: bool, file_names: tuple[str]):
     ret_value = [{"text": _assistant}]
 
     if artifacts_enabled:
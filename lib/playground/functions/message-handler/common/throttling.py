@@ -0,0 +1,294 @@
+import os
+import time
+import boto3
+import random
+import threading
+from decimal import Decimal
+from botocore.exceptions import ClientError
+from common import metrics
+
+BEDROCK_RPM = int(os.environ.get("BEDROCK_RPM", "0"))
+BEDROCK_TPM = int(os.environ.get("BEDROCK_TPM", "0"))
+RATE_LIMIT_TABLE_NAME = os.environ.get("RATE_LIMIT_TABLE_NAME")
+RETRY_MAX_ATTEMPTS = int(os.environ.get("RETRY_MAX_ATTEMPTS", "10"))
+RETRY_BASE_DELAY = float(os.environ.get("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY", "20"))
+ADMISSION_MAX_WAIT = float(os.environ.get("ADMISSION_MAX_WAIT", "60"))
+
+RETRYABLE_ERRORS = {
+    "ThrottlingException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+}
+
+
+class RetriesExhausted(Exception):
+    pass
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+def backoff_delay(
+    attempt: int, base: float = RETRY_BASE_DELAY, cap: float = RETRY_MAX_DELAY
+):
+    # Full jitter: concurrent callers throttled at the same time spread their
+    # retries over the whole window instead of retrying in lockstep.
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def is_retryable(error: Exception):
+    if not isinstance(error, ClientError):
+        return False
+
+    return error.response.get("Error", {}).get("Code") in RETRYABLE_ERRORS
+
+
+class LocalBucketBackend:
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def take(self, name: str, amount: float, capacity: float, max_wait: float):
+        rate = capacity / 60
+        now = time.time()
+
+        with self.lock:
+            tokens, updated = self.buckets.get(name, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate) - amount
+
+            wait = max(0.0, -tokens / rate)
+            if wait > max_wait:
+                return None
+
+            self.buckets[name] = (tokens, now)
+
+        return wait
+
+    def give(self, name: str, amount: float, capacity: float):
+        rate = capacity / 60
+        now = time.time()
+
+        with self.lock:
+            if name not in self.buckets:
+                return
+
+            tokens, updated = self.buckets[name]
+            tokens = min(capacity, tokens + (now - updated) * rate + amount)
+            self.buckets[name] = (tokens, now)
+
+
+class DynamoDBBucketBackend:
+    # Items are {bucket, tokens, updated}, updated with an optimistic
+    # condition on the previous timestamp so concurrent containers share
+    # one bucket.
+    def __init__(self, table, max_conflicts: int = 5):
+        self.table = table
+        self.max_conflicts = max_conflicts
+
+    def update(self, name: str, change):
+        for _ in range(self.max_conflicts):
+            response = self.table.get_item(Key={"bucket": name}, ConsistentRead=True)
+            item = response.get("Item")
+
+            now = time.time()
+            previous = item["updated"] if item else None
+            result = change(
+                float(item["tokens"]) if item else None,
+                float(previous) if item else now,
+                now,
+            )
+            if result is None:
+                return None
+
+            tokens, updated, value = result
+            params = {
+                "Item": {
+                    "bucket": name,
+                    "tokens": Decimal(str(round(tokens, 3))),
+                    "updated": Decimal(str(round(updated, 6))),
+                }
+            }
+            # "bucket" is a DynamoDB reserved word.
+            if item:
+                params["ConditionExpression"] = "#u = :updated"
+                params["ExpressionAttributeNames"] = {"#u": "updated"}
+                params["ExpressionAttributeValues"] = {":updated": previous}
+            else:
+                params["ConditionExpression"] = "attribute_not_exists(#b)"
+                params["ExpressionAttributeNames"] = {"#b": "bucket"}
+
+            try:
+                self.table.put_item(**params)
+                return value
+            except ClientError as e:
+                code = e.response.get("Error", {}).get("Code")
+                if code != "ConditionalCheckFailedException":
+                    raise
+
+        raise RuntimeError(f"Too many concurrent updates of bucket {name}")
+
+    def take(self, name: str, amount: float, capacity: float, max_wait: float):
+        rate = capacity / 60
+
+        def change(tokens, updated, now):
+            if tokens is None:
+                tokens = capacity
+            tokens = min(capacity, tokens + (now - updated) * rate) - amount
+
+            wait = max(0.0, -tokens / rate)
+            if wait > max_wait:
+                return None
+
+            return tokens, now, wait
+
+        return self.update(name, change)
+
+    def give(self, name: str, amount: float, capacity: float):
+        rate = capacity / 60
+
+        def change(tokens, updated, now):
+            if tokens is None:
+                return None
+
+            tokens = min(capacity, tokens + (now - updated) * rate + amount)
+            return tokens, now, True
+
+        self.update(name, change)
+
+
+class TokenBucket:
+    # Refills continuously to capacity over a minute. Callers reserve what
+    # they need up front, going into debt if necessary, and wait until the
+    # debt is repaid, so admissions are spread evenly over the minute.
+    def __init__(self, name: str, capacity: int, backend):
+        self.name = name
+        self.capacity = capacity
+        self.backend = backend
+
+    # A failing backend admits calls rather than blocking them; failures are
+    # counted so an admission that is not enforced shows up in the metrics.
+    def take(self, amount: float, max_wait: float = ADMISSION_MAX_WAIT):
+        amount = min(amount, self.capacity)
+
+        try:
+            return self.backend.take(self.name, amount, self.capacity, max_wait)
+        except Exception as e:
+            print(f"Failed to take from bucket {self.name}: {e}")
+            metrics.increment(
+                "AdmissionBackendErrors", dimensions={"Bucket": self.name}
+            )
+            return 0.0
+
+    def give(self, amount: float):
+        if amount <= 0:
+            return
+
+        try:
+            self.backend.give(self.name, amount, self.capacity)
+        except Exception as e:
+            print(f"Failed to give to bucket {self.name}: {e}")
+            metrics.increment(
+                "AdmissionBackendErrors", dimensions={"Bucket": self.name}
+            )
+
+
+class RetryStats:
+    def __init__(self):
+        self.attempts = 0
+        self.retries = 0
+        self.throttles = 0
+        self.backoff_ms = 0.0
+        self.admission_wait_ms = 0.0
+
+    def to_dict(self):
+        return {
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "throttles": self.throttles,
+            "backoff_ms": round(self.backoff_ms, 1),
+            "admission_wait_ms": round(self.admission_wait_ms, 1),
+        }
+
+
+class Admission:
+    # Admits calls against the request and token per-minute quotas, then
+    # retries retryable errors with exponential backoff and full jitter.
+    def __init__(
+        self,
+        rpm: int = BEDROCK_RPM,
+        tpm: int = BEDROCK_TPM,
+        backend=None,
+        max_attempts: int = RETRY_MAX_ATTEMPTS,
+    ):
+        backend = backend or LocalBucketBackend()
+        self.requests = TokenBucket("requests", rpm, backend) if rpm else None
+        self.tokens = TokenBucket("tokens", tpm, backend) if tpm else None
+        self.max_attempts = max_attempts
+
+    # A call rejected by the token bucket returns its request token.
+    def admit(self, tokens: int, stats: RetryStats):
+        request_wait = self.requests.take(1) if self.requests else 0.0
+        token_wait = 0.0
+        if self.tokens and request_wait is not None:
+            token_wait = self.tokens.take(tokens)
+
+        if request_wait is None or token_wait is None:
+            if self.requests and request_wait is not None:
+                self.requests.give(1)
+
+            raise RateLimitExceeded(
+                "The model is receiving too many requests, please try again later."
+            )
+
+        wait = max(request_wait, token_wait)
+        if wait > 0:
+            stats.admission_wait_ms += wait * 1000
+            time.sleep(wait)
+
+    def settle(self, reserved: int, used: int):
+        # Returns the part of a token reservation that was not used.
+        if self.tokens and used is not None:
+            self.tokens.give(min(reserved, self.tokens.capacity) - used)
+
+    def call(self, fn, tokens: int = 0, stats: RetryStats = None):
+        stats = stats or RetryStats()
+
+        for attempt in range(self.max_attempts):
+            self.admit(tokens, stats)
+            stats.attempts += 1
+
+            try:
+                return fn()
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+
+                # A rejected call did not use its token reservation.
+                self.settle(tokens, 0)
+                stats.throttles += 1
+                if attempt == self.max_attempts - 1:
+                    break
+
+                delay = backoff_delay(attempt)
+                stats.retries += 1
+                stats.backoff_ms += delay * 1000
+                print(
+                    f"Throttled ({e.response['Error']['Code']}), retrying in "
+                    f"{delay:.2f}s (attempt {attempt + 1}/{self.max_attempts})"
+                )
+                time.sleep(delay)
+
+        raise RetriesExhausted(
+            f"Maximum number of {self.max_attempts} attempts reached."
+        )
+
+
+def create_admission():
+    backend = None
+    if RATE_LIMIT_TABLE_NAME:
+        table = boto3.resource("dynamodb").Table(RATE_LIMIT_TABLE_NAME)
+        backend = DynamoDBBucketBackend(table)
+
+    return Admission(backend=backend)
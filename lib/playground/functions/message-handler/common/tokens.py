@@ -0,0 +1,33 @@
+import json
+
+CHARS_PER_TOKEN = 4
+IMAGE_TOKENS = 1600
+
+
+def estimate_tokens(text: str):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def estimate_content_tokens(content: list):
+    tokens = 0
+
+    for item in content:
+        if "text" in item:
+            text = item["text"]
+            if isinstance(text, dict):
+                # Stored tool results keep the size of the text they replace.
+                tokens += (text.get("size", 0) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+            else:
+                tokens += estimate_tokens(text)
+        elif "image" in item:
+            tokens += IMAGE_TOKENS
+        elif "toolUse" in item:
+            tokens += estimate_tokens(json.dumps(item["toolUse"].get("input", {})))
+        elif "toolResult" in item:
+            tokens += estimate_content_tokens(item["toolResult"].get("content", []))
+
+    return tokens
+
+
+def estimate_messages_tokens(messages: list):
+    return sum(estimate_content_tokens(message["content"]) for message in messages)
@@ -1,38 +1,66 @@
 import os
 import json
-import boto3
 import time
+import boto3
 from common.sender import MessageSender
 from common.system import system_messages
 from tools import ToolProvider, ConverseToolExecutor, converse_tools
+from tools.cache import create_code_interpreter_cache, create_web_search_cache
 from common.files import (
     filter_inline_files,
-    get_inline_file_data,
+    read_inline_file,
+    prefetch_inline_files,
+    discard_prefetched,
+    remember_inlined,
 )
-from common.session import load_session, save_session, create_dynamodb_session
-
-
-from botocore.exceptions import ClientError
+from common.session import (
+    load_session,
+    save_session,
+    create_dynamodb_session,
+    session_executor,
+)
+from common.blobs import SessionBlobs
+from common.images import ImageStore
+from common.tokens import estimate_tokens
+from common.throttling import create_admission, RetryStats, RetriesExhausted
+from common.routing import create_router
+from common.context import ContextManager, summary_request
+from common.caching import add_usage, usage_since
+from common import metrics
 
 #custom exception for max retries on Bedrock call
 class BedrockConverseStreamMaxRetriesReached(Exception):
     pass
 
-THROTTLE_DELAY = 1.0  # Delay in seconds when throttled
+MAX_TOKENS = 4096
+USAGE_METRICS = {
+    "inputTokens": "InputTokens",
+    "outputTokens": "OutputTokens",
+    "cacheReadInputTokens": "CacheReadInputTokens",
+    "cacheWriteInputTokens": "CacheWriteInputTokens",
+}
+# Tool iterations run in one invocation up to AGENT_LOOP_MAX_STEPS model calls,
+# while the remaining time leaves AGENT_LOOP_RESERVE_MS after the longest step
+# so far. The session is saved every AGENT_LOOP_CHECKPOINT_STEPS steps and when
+# the loop ends; the client continues the loop when the budget runs out.
+AGENT_LOOP_MAX_STEPS = int(os.environ.get("AGENT_LOOP_MAX_STEPS", "10"))
+AGENT_LOOP_RESERVE_MS = int(os.environ.get("AGENT_LOOP_RESERVE_MS", "60000"))
+AGENT_LOOP_CHECKPOINT_STEPS = int(os.environ.get("AGENT_LOOP_CHECKPOINT_STEPS", "3"))
 
 
 AWS_REGION = os.environ["AWS_REGION"]
-BEDROCK_REGION = os.environ.get("BEDROCK_REGION")
-BEDROCK_MODEL = os.environ.get("BEDROCK_MODEL")
 ARTIFACTS_ENABLED = os.environ.get("ARTIFACTS_ENABLED")
 TOOL_CODE_INTERPRETER = os.environ.get("TOOL_CODE_INTERPRETER")
+CODE_INTERPRETER_STATEFUL = os.environ.get("CODE_INTERPRETER_STATEFUL")
 TOOL_WEB_SEARCH = os.environ.get("TOOL_WEB_SEARCH")
 
 
 s3_client = boto3.client(
     "s3", region_name=AWS_REGION, endpoint_url=f"https://s3.{AWS_REGION}.amazonaws.com"
 )
-bedrock_client = boto3.client("bedrock-runtime", region_name=BEDROCK_REGION)
+router = create_router()
+admission = create_admission()
+image_store = ImageStore(s3_client)
 
 provider = ToolProvider(
     {
@@ -41,14 +69,55 @@ provider = ToolProvider(
     }
 )
 
+result_caches = {"web_search": create_web_search_cache()}
+# Results of a stateful code interpreter depend on the kernel state as well.
+if CODE_INTERPRETER_STATEFUL != "1":
+    result_caches["code_interpreter"] = create_code_interpreter_cache()
+
 tool_config = []
 if TOOL_CODE_INTERPRETER:
-    tool_config.append(converse_tools.code_interpreter)
+    if CODE_INTERPRETER_STATEFUL == "1":
+        tool_config.append(converse_tools.code_interpreter_stateful)
+    else:
+        tool_config.append(converse_tools.code_interpreter)
 if TOOL_WEB_SEARCH:
     tool_config.append(converse_tools.web_search)
 
 
-def handle_message(logger, connection_id, user_id, body):
+def summarize_context(previous: str, transcript: str):
+    request = summary_request(previous, transcript)
+    tokens = estimate_tokens(transcript) + request["inferenceConfig"]["maxTokens"]
+    _, response = admission.call(
+        lambda: router.converse_stream("low", cache=False, **request), tokens
+    )
+
+    parts = []
+    usage = {}
+    for chunk in response["stream"]:
+        text = chunk.get("contentBlockDelta", {}).get("delta", {}).get("text")
+        if text:
+            parts.append(text)
+        if "metadata" in chunk:
+            usage = chunk["metadata"].get("usage", {})
+
+    admission.settle(tokens, usage.get("totalTokens"))
+
+    return "".join(parts)
+
+
+context_manager = ContextManager(summarize_context)
+
+
+def has_time_for_step(lambda_context, step_ms: float):
+    if lambda_context is None:
+        return True
+
+    remaining_ms = lambda_context.get_remaining_time_in_millis()
+
+    return remaining_ms > AGENT_LOOP_RESERVE_MS + step_ms
+
+
+def handle_message(logger, connection_id, user_id, body, lambda_context=None):
     logger.info(f"Received message for {user_id}")
     logger.info(body)
     sender = MessageSender(connection_id)
@@ -65,34 +134,55 @@ def handle_message(logger, connection_id, user_id, body):
         elif event_type == "CONVERSE":
             files = body.get("files", [])
             message = body.get("message")
+            priority = body.get("priority", "normal")
+            session_version = body.get("session_version") or 0
+
+            metrics.begin(
+                properties={
+                    "request_id": getattr(lambda_context, "aws_request_id", None),
+                    "session_id": session_id,
+                    "priority": priority,
+                }
+            )
 
-            new_session, session = load_session(s3_client, user_id, session_id)
+            # The session and the images it may need are fetched together.
+            blobs = SessionBlobs(s3_client, user_id, session_id)
+            session_future = session_executor.submit(
+                load_session, s3_client, user_id, session_id, session_version
+            )
+            prefetched = prefetch_inline_files(
+                s3_client,
+                user_id,
+                session_id,
+                files,
+                session_executor,
+                new_session=session_version == 0,
+            )
+            new_session, session = session_future.result()
             converse_messages = session.get("messages")
             tool_extra = session.get("tool_extra")
             inline_files = session.get("inline_files")
+            context = session.setdefault("context", {})
+            usage = session.setdefault("usage", {})
 
             files_to_inline = filter_inline_files(files, inline_files)
             inline_files.extend(files_to_inline)
-            inline_files_data = get_inline_file_data(
-                s3_client, user_id, session_id, files_to_inline
+            # Originals are only read for images without a stored variant.
+            image_content = image_store.inline_files(
+                user_id,
+                files_to_inline,
+                lambda file_to_inline: read_inline_file(
+                    s3_client, user_id, session_id, file_to_inline, prefetched
+                ),
             )
+            discard_prefetched(prefetched)
+            remember_inlined(session_id, inline_files)
 
             content = []
             if message:
                 content.append({"text": message})
 
-            if inline_files_data:
-                content.extend(
-                    [
-                        {
-                            "image": {
-                                "format": data["format"],
-                                "source": {"bytes": data["data"]},
-                            },
-                        }
-                        for data in inline_files_data
-                    ]
-                )
+            content.extend(image_content)
             if content:
                 converse_messages.append(
                     {
@@ -101,25 +191,78 @@ def handle_message(logger, connection_id, user_id, body):
                     }
                 )
 
-            finish = converse_make_request_stream(
-                sender,
-                user_id,
-                session_id,
-                converse_messages,
-                tool_extra,
-                files,
+            listing = None
+            def checkpoint():
+                session["version"] = session.get("version", 0) + 1
+                save_session(s3_client, user_id, session_id, session, blobs)
+
+            # The summary record reports the usage of this request; the
+            # session totals are kept under their own name.
+            usage_start = dict(usage)
+            steps = 0
+            longest_step_ms = 0
+            while True:
+                step_start = time.perf_counter()
+                finish = converse_make_request_stream(
+                    sender,
+                    user_id,
+                    session_id,
+                    converse_messages,
+                    tool_extra,
+                    context,
+                    usage,
+                    files,
+                    blobs,
+                    priority,
+                )
+                # A new session is only listed once the model has answered,
+                # so a failed first call does not leave an empty session.
+                if new_session and not listing:
+                    listing = session_executor.submit(
+                        create_dynamodb_session, user_id, session_id, message
+                    )
+
+                steps += 1
+                step_ms = (time.perf_counter() - step_start) * 1000
+                metrics.set_property("usage", usage_since(usage_start, usage))
+                metrics.set_property("session_usage", usage)
+                longest_step_ms = max(longest_step_ms, step_ms)
+
+                if (
+                    finish
+                    or steps >= AGENT_LOOP_MAX_STEPS
+                    or not has_time_for_step(lambda_context, longest_step_ms)
+                ):
+                    break
+
+                if (
+                    AGENT_LOOP_CHECKPOINT_STEPS
+                    and steps % AGENT_LOOP_CHECKPOINT_STEPS == 0
+                ):
+                    checkpoint()
+
+            metrics.add("AgentLoopSteps", steps)
+            metrics.set_property("finish", finish)
+
+            # The loop signal does not wait for the final save; the next
+            # request waits for this version when it loads the session.
+            session["version"] = session.get("version", 0) + 1
+            saving = session_executor.submit(
+                save_session, s3_client, user_id, session_id, session, blobs
             )
+            sender.send_loop(finish, session["version"])
 
-            if new_session:
-                create_dynamodb_session(user_id, session_id, message)
-            save_session(s3_client, user_id, session_id, session)
-
-            sender.send_loop(finish)
+            saving.result()
+            if listing:
+                listing.result()
         else:
             raise ValueError(f"Unknown event type: {event_type}")
     except Exception as e:
         logger.error(f"Error processing message: {e}")
+        metrics.set_property("error", str(e))
         sender.send_error(str(e))
+    finally:
+        metrics.end()
 
     return {"statusCode": 200, "body": json.dumps({"ok": True})}
 
@@ -130,41 +273,95 @@ def converse_make_request_stream(
     session_id,
     converse_messages,
     tool_extra,
+    context,
+    usage,
     files,
+    blobs: SessionBlobs,
+    priority="normal",
 ):
+    request_start = time.perf_counter()
     file_names = [os.path.basename(file["file_name"]) for file in files]
     system = system_messages(ARTIFACTS_ENABLED == "1", file_names)
 
     additional_params = {}
     if tool_config:
         additional_params["toolConfig"] = {"tools": tool_config}
-    num_retries = 0
-    max_retries = 10
-    while num_retries < max_retries:
-        try:
-            streaming_response = bedrock_client.converse_stream(
-                modelId=BEDROCK_MODEL,
+
+    # Stored tool results and images are only loaded for the messages that
+    # are actually sent.
+    request_messages, context_stats = context_manager.prepare(
+        system, converse_messages, context, hydrate=blobs.hydrate
+    )
+    metrics.add("RequestTokensEstimate", context_stats["request_tokens"])
+    metrics.add("ContextTokensSaved", context_stats["saved_tokens"])
+    with metrics.timer("SessionHydrateTime"):
+        request_messages = blobs.hydrate(request_messages)
+    request_messages = image_store.hydrate(request_messages)
+
+    # Reserved against the token quota up front; the unused part is returned
+    # once the response reports its usage.
+    request_tokens = context_stats["request_tokens"] + MAX_TOKENS
+    retry_stats = RetryStats()
+
+    try:
+        endpoint, streaming_response = admission.call(
+            lambda: router.converse_stream(
+                priority,
                 system=system,
-                messages=converse_messages,
-                inferenceConfig={"maxTokens": 4096, "temperature": 0.5},
+                messages=request_messages,
+                inferenceConfig={"maxTokens": MAX_TOKENS, "temperature": 0.5},
                 **additional_params,
-            )
-            break
-        except ClientError as e:
-            if e.response["Error"]["Code"] == "ThrottlingException":
-                num_retries += 1
-                print(f"Bedrock ConverseStream throttled. Retrying after {THROTTLE_DELAY} seconds (attempt {num_retries}/{max_retries})")
-                time.sleep(THROTTLE_DELAY)
-            else:
-                raise e
-    else:
-        # This block is executed if the while loop completes without breaking
-        raise BedrockConverseStreamMaxRetriesReached(f"Maximum number of {max_retries} retries reached for Bedrock ConverseStream operation.")
-    executor = ConverseToolExecutor(user_id, session_id, provider)
-    for chunk in streaming_response["stream"]:
-        if text := executor.process_chunk(chunk):
-            sender.send_text(text)
-
+            ),
+            request_tokens,
+            retry_stats,
+        )
+    except RetriesExhausted as e:
+        raise BedrockConverseStreamMaxRetriesReached(
+            f"{e} Bedrock ConverseStream operation was throttled."
+        )
+    finally:
+        metrics.add(
+            "AdmissionWaitTime", retry_stats.admission_wait_ms, metrics.MILLISECONDS
+        )
+        metrics.add("BackoffTime", retry_stats.backoff_ms, metrics.MILLISECONDS)
+        metrics.increment("BedrockRetries", retry_stats.retries)
+        metrics.increment("BedrockThrottles", retry_stats.throttles)
+        metrics.set_property("endpoints", router.stats())
+
+    model = {"Model": endpoint.model}
+    metrics.set_property("endpoint", endpoint.name)
+
+    executor = ConverseToolExecutor(user_id, session_id, provider, result_caches)
+    executor.prepare(s3_client, files, on_progress=sender.send_tool_progress)
+
+    stream_start = time.perf_counter()
+    first_token = False
+    try:
+        for chunk in streaming_response["stream"]:
+            if not first_token and "contentBlockDelta" in chunk:
+                first_token = True
+                elapsed = (time.perf_counter() - request_start) * 1000
+                metrics.add("TimeToFirstToken", elapsed, metrics.MILLISECONDS, model)
+
+            if text := executor.process_chunk(chunk):
+                sender.send_text(text)
+    except Exception:
+        executor.cancel()
+        raise
+
+    elapsed = (time.perf_counter() - stream_start) * 1000
+    metrics.add("StreamDuration", elapsed, metrics.MILLISECONDS, model)
+
+    request_usage = executor.get_usage()
+    admission.settle(request_tokens, request_usage.get("totalTokens"))
+    add_usage(usage, request_usage)
+
+    for key, name in USAGE_METRICS.items():
+        if key in request_usage:
+            metrics.add(name, request_usage[key], metrics.COUNT, model)
+    if "latencyMs" in executor.get_metrics():
+        latency = executor.get_metrics()["latencyMs"]
+        metrics.add("ModelLatency", latency, metrics.MILLISECONDS, model)
 
     assistant_messages = executor.get_assistant_messages()
     converse_messages.extend(assistant_messages)
@@ -173,7 +370,7 @@ def converse_make_request_stream(
         tool_use_extra = sender.send_tool_running_messages(executor)
         tool_extra.update(tool_use_extra)
 
-        executor.execute(s3_client, file_names)
+        executor.execute(s3_client, files, on_progress=sender.send_tool_progress)
         user_messages = executor.get_user_messages()
         converse_messages.extend(user_messages)
 
@@ -184,4 +381,6 @@ def converse_make_request_stream(
 
         return False
 
+    executor.cancel()
+
     return True
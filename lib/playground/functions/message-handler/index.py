@@ -7,7 +7,7 @@ logger = Logger(log_uncaught_exceptions=True)
 
 
 @logger.inject_lambda_context(log_event=True)
-def handler(event, _: LambdaContext):
+def handler(event, context: LambdaContext):
     event_type = event["requestContext"]["eventType"]
     connection_id = event["requestContext"]["connectionId"]
     user_id = event["requestContext"]["authorizer"]["username"]
@@ -16,6 +16,6 @@ def handler(event, _: LambdaContext):
 
     if event_type == "MESSAGE":
         message = json.loads(event["body"])
-        return handle_message(logger, connection_id, user_id, message)
+        return handle_message(logger, connection_id, user_id, message, context)
 
     return {"ok": True}
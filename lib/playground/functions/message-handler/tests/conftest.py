@@ -0,0 +1,13 @@
+import os
+import sys
+
+os.environ.setdefault("AWS_REGION", "us-east-1")
+os.environ.setdefault("AWS_DEFAULT_REGION", os.environ["AWS_REGION"])
+os.environ.setdefault("UPLOAD_BUCKET_NAME", "uploads")
+os.environ.setdefault("SESSION_BUCKET_NAME", "sessions")
+os.environ.setdefault("SESSION_TABLE_NAME", "sessions")
+os.environ.setdefault("WEBSOCKET_API_ENDPOINT", "https://websocket.example")
+os.environ.setdefault("BEDROCK_REGION", os.environ["AWS_REGION"])
+os.environ.setdefault("BEDROCK_MODEL", "anthropic.claude-3-5-sonnet-20240620-v1:0")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
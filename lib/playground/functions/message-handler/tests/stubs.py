@@ -0,0 +1,165 @@
+import io
+import threading
+from botocore.exceptions import ClientError
+
+
+def client_error(code: str, status: int = 400, message: str = ""):
+    return ClientError(
+        {
+            "Error": {"Code": code, "Message": message or f"Stub {code}"},
+            "ResponseMetadata": {"HTTPStatusCode": status},
+        },
+        "Stub",
+    )
+
+
+# In-memory stand-in for the S3 client calls the handler makes.
+class StubS3Client:
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+    def __init__(self):
+        self.objects = {}
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def record(self, name: str, key: str = None):
+        with self.lock:
+            self.calls.append((name, key))
+
+    def count(self, name: str):
+        return sum(1 for call, _ in self.calls if call == name)
+
+    def put_object(self, Bucket, Key, Body):
+        self.record("put_object", Key)
+        if isinstance(Body, str):
+            Body = Body.encode("utf-8")
+        self.objects[(Bucket, Key)] = Body
+
+    def get_object(self, Bucket, Key):
+        self.record("get_object", Key)
+        if (Bucket, Key) not in self.objects:
+            raise self.exceptions.NoSuchKey(Key)
+
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def list_objects_v2(self, Bucket, Prefix, StartAfter=""):
+        self.record("list_objects_v2", Prefix)
+        keys = sorted(
+            key
+            for bucket, key in self.objects
+            if bucket == Bucket and key.startswith(Prefix) and key > StartAfter
+        )
+
+        return {"Contents": [{"Key": key} for key in keys]}
+
+    def delete_objects(self, Bucket, Delete):
+        self.record("delete_objects")
+        for item in Delete["Objects"]:
+            self.objects.pop((Bucket, item["Key"]), None)
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"https://{Params['Bucket']}.example/{Params['Key']}"
+
+    def generate_presigned_post(self, Bucket, Key, Conditions=None, ExpiresIn=None):
+        return {"url": f"https://{Bucket}.example", "fields": {"key": Key}}
+
+
+# Checks DynamoDB expressions the way the service does where it matters for
+# these tests: reserved words must go through ExpressionAttributeNames.
+RESERVED_WORDS = {"bucket", "name", "size", "status", "data", "value", "ttl"}
+
+
+def check_expression(expression: str, names: dict):
+    for word in expression.replace("(", " ").replace(")", " ").split():
+        if word.lower() in RESERVED_WORDS:
+            message = f"Attribute name is a reserved keyword; reserved keyword: {word}"
+            raise client_error("ValidationException", message=message)
+        if word.startswith("#") and word not in (names or {}):
+            raise client_error("ValidationException", message=f"Unknown name {word}")
+
+
+def resolve(name: str, names: dict):
+    return (names or {}).get(name, name)
+
+
+# Enough of a DynamoDB Table resource for get_item, conditional put_item and
+# delete_item.
+class StubTable:
+    def __init__(self, key: str):
+        self.key = key
+        self.items = {}
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get_item(self, Key, ConsistentRead=False):
+        self.calls.append("get_item")
+        item = self.items.get(Key[self.key])
+
+        return {"Item": dict(item)} if item else {}
+
+    def put_item(
+        self,
+        Item,
+        ConditionExpression=None,
+        ExpressionAttributeNames=None,
+        ExpressionAttributeValues=None,
+    ):
+        self.calls.append("put_item")
+        names = ExpressionAttributeNames
+        values = ExpressionAttributeValues or {}
+
+        with self.lock:
+            current = self.items.get(Item[self.key])
+
+            if ConditionExpression:
+                check_expression(ConditionExpression, names)
+                if not self.matches(ConditionExpression, current, names, values):
+                    raise client_error("ConditionalCheckFailedException")
+
+            self.items[Item[self.key]] = dict(Item)
+
+    def delete_item(self, Key):
+        self.calls.append("delete_item")
+        with self.lock:
+            self.items.pop(Key[self.key], None)
+
+    def matches(self, expression: str, current: dict, names: dict, values: dict):
+        for condition in expression.split(" OR "):
+            condition = condition.strip()
+            if condition.startswith("attribute_not_exists("):
+                name = resolve(condition[len("attribute_not_exists(") : -1], names)
+                if current is None or name not in current:
+                    return True
+            else:
+                name, value = [part.strip() for part in condition.split("=")]
+                name = resolve(name, names)
+                if current is not None and current.get(name) == values[value]:
+                    return True
+
+        return False
+
+
+# Returns a scripted converse_stream result or raises a scripted error per
+# call, in order.
+class StubBedrockClient:
+    def __init__(self, results: list = None):
+        self.results = list(results or [])
+        self.requests = []
+
+    def converse_stream(self, modelId: str, **kwargs):
+        self.requests.append({"modelId": modelId, **kwargs})
+        result = self.results.pop(0) if self.results else {"stream": []}
+        if isinstance(result, Exception):
+            raise result
+
+        return result
+
+    def converse(self, modelId: str, **kwargs):
+        self.requests.append({"modelId": modelId, **kwargs})
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+
+        return result
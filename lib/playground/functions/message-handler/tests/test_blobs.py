@@ -0,0 +1,104 @@
+from stubs import StubS3Client
+from common.blobs import SESSION_BLOB_THRESHOLD, SessionBlobs
+from common.session import load_session, save_session
+
+LARGE_TEXT = "x" * (SESSION_BLOB_THRESHOLD + 1)
+
+
+def tool_result_message(text: str):
+    return {
+        "role": "user",
+        "content": [
+            {
+                "toolResult": {
+                    "toolUseId": "tool",
+                    "content": [{"text": text}],
+                    "status": "success",
+                }
+            }
+        ],
+    }
+
+
+def create_session(text: str):
+    return {
+        "session_id": "session",
+        "messages": [
+            {"role": "user", "content": [{"text": "Hello"}]},
+            tool_result_message(text),
+        ],
+        "tool_extra": {"tool": {"response_text": text, "status": "success"}},
+        "version": 1,
+    }
+
+
+def result_text(message: dict):
+    return message["content"][0]["toolResult"]["content"][0]["text"]
+
+
+def test_small_values_stay_inline():
+    s3_client = StubS3Client()
+    session = create_session("small")
+
+    stored = SessionBlobs(s3_client, "user", "session").offload_session(session)
+
+    assert stored == session
+    assert s3_client.count("put_object") == 0
+
+
+def test_large_tool_results_are_offloaded_once():
+    s3_client = StubS3Client()
+    blobs = SessionBlobs(s3_client, "user", "session")
+    session = create_session(LARGE_TEXT)
+
+    stored = blobs.offload_session(session)
+    blobs.offload_session(session)
+
+    ref = result_text(stored["messages"][1])
+    assert ref["size"] == len(LARGE_TEXT)
+    assert stored["tool_extra"]["tool"]["response_text"] == ref
+    assert stored["tool_extra"]["tool"]["status"] == "success"
+    assert stored["messages"][0] == session["messages"][0]
+    assert result_text(session["messages"][1]) == LARGE_TEXT
+    assert s3_client.count("put_object") == 1
+
+
+def test_hydrate_restores_tool_results():
+    s3_client = StubS3Client()
+    stored = SessionBlobs(s3_client, "user", "session").offload_session(
+        create_session(LARGE_TEXT)
+    )
+
+    blobs = SessionBlobs(s3_client, "user", "session")
+    messages = blobs.hydrate(stored["messages"])
+    blobs.hydrate(stored["messages"])
+
+    assert result_text(messages[1]) == LARGE_TEXT
+    assert messages[0] is stored["messages"][0]
+    assert s3_client.count("get_object") == 1
+
+
+def test_loaded_blobs_are_not_stored_again():
+    s3_client = StubS3Client()
+    stored = SessionBlobs(s3_client, "user", "session").offload_session(
+        create_session(LARGE_TEXT)
+    )
+
+    blobs = SessionBlobs(s3_client, "user", "session")
+    blobs.hydrate(stored["messages"])
+    blobs.offload_session(create_session(LARGE_TEXT))
+
+    assert s3_client.count("put_object") == 1
+
+
+def test_session_round_trip_keeps_references():
+    s3_client = StubS3Client()
+    blobs = SessionBlobs(s3_client, "user", "session")
+    save_session(s3_client, "user", "session", create_session(LARGE_TEXT), blobs)
+
+    new_session, session = load_session(s3_client, "user", "session", 1)
+
+    assert not new_session
+    assert isinstance(result_text(session["messages"][1]), dict)
+    messages = SessionBlobs(s3_client, "user", "session").hydrate(session["messages"])
+    assert result_text(messages[1]) == LARGE_TEXT
@@ -0,0 +1,177 @@
+import os
+import time
+import pytest
+from stubs import StubS3Client, StubTable
+from common.memory import MemoryBackend
+from tools import ConverseToolExecutor, ToolProvider
+from tools.cache import (
+    DynamoDBBackend,
+    LocalDiskBackend,
+    ToolResultCache,
+    code_interpreter_key,
+    web_search_key,
+)
+
+RESPONSE = {"status": "success", "content": {"text": "result"}}
+
+
+@pytest.fixture(params=["memory", "disk", "dynamodb"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend(1000)
+    if request.param == "disk":
+        return LocalDiskBackend(str(tmp_path), max_bytes=1000)
+
+    return DynamoDBBackend(StubTable("cacheKey"), max_bytes=1000)
+
+
+def search_payload(query: str, urls: list = None):
+    return {"name": "web_search", "input": {"query": query, "urls": urls or []}}
+
+
+def test_backend_round_trip(backend):
+    cache = ToolResultCache(backend, web_search_key)
+    key = cache.key("user", "session", search_payload("weather"), [])
+
+    assert cache.get(key) is None
+    cache.put(key, RESPONSE)
+
+    assert cache.get(key) == RESPONSE
+    assert cache.stats(True) == {
+        "hit": True,
+        "hits": 1,
+        "requests": 2,
+        "hit_rate": 0.5,
+    }
+
+
+def test_expired_entries_are_deleted(backend, monkeypatch):
+    cache = ToolResultCache(backend, web_search_key, ttl=60)
+    key = cache.key("user", "session", search_payload("weather"), [])
+    cache.put(key, RESPONSE)
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 120)
+
+    assert cache.get(key) is None
+    assert backend.get(key) is None
+
+
+def test_errors_are_not_cached(backend):
+    cache = ToolResultCache(backend, web_search_key)
+    key = cache.key("user", "session", search_payload("weather"), [])
+    cache.put(key, {"status": "error", "content": {"text": "failed"}})
+
+    assert cache.get(key) is None
+
+
+def test_oversized_results_are_not_stored(backend):
+    cache = ToolResultCache(backend, web_search_key)
+    key = cache.key("user", "session", search_payload("weather"), [])
+    cache.put(key, {"status": "success", "content": {"text": "x" * 2000}})
+
+    assert cache.get(key) is None
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(10)
+    backend.put("a", 0.0, b"1234")
+    backend.put("b", 0.0, b"1234")
+    backend.get("a")
+    backend.put("c", 0.0, b"1234")
+
+    assert backend.get("b") is None
+    assert backend.get("a") == (0.0, b"1234")
+    assert backend.total_bytes == 8
+
+
+def test_disk_backend_survives_restarts(tmp_path):
+    path = str(tmp_path)
+    key = "a" * 64
+    LocalDiskBackend(path).put(key, 123.0, b"data")
+    open(os.path.join(path, "stray.tmp"), "w").close()
+
+    backend = LocalDiskBackend(path)
+
+    assert backend.get(key) == (123.0, b"data")
+    assert os.listdir(path) == [key]
+
+
+def test_disk_backend_evicts_over_max_bytes(tmp_path):
+    backend = LocalDiskBackend(str(tmp_path), max_bytes=20)
+    backend.put("a" * 64, 0.0, b"x" * 8)
+    backend.put("b" * 64, 0.0, b"x" * 8)
+
+    assert backend.get("a" * 64) is None
+    assert not os.path.exists(backend.entry_path("a" * 64))
+    assert backend.get("b" * 64) is not None
+
+
+def test_failing_backend_is_a_miss():
+    class FailingBackend:
+        def get(self, key):
+            raise RuntimeError("unavailable")
+
+        def put(self, key, expires, data):
+            raise RuntimeError("unavailable")
+
+    cache = ToolResultCache(FailingBackend(), web_search_key)
+    key = cache.key("user", "session", search_payload("weather"), [])
+    cache.put(key, RESPONSE)
+
+    assert cache.get(key) is None
+
+
+def test_web_search_key_normalizes_the_query():
+    cache = ToolResultCache(MemoryBackend(1000), web_search_key)
+
+    first = cache.key("user", "session", search_payload(" Weather  Today"), [])
+    second = cache.key("other", "other", search_payload("weather today"), [])
+    other = cache.key("user", "session", search_payload("weather"), [])
+
+    assert first == second
+    assert first != other
+
+
+def test_code_interpreter_key_needs_file_checksums():
+    payload = {
+        "name": "code_interpreter",
+        "input": {"code": "print(1)"},
+        "output_files": [],
+    }
+    files = [{"file_name": "user/session/data.csv", "checksum": "abc"}]
+
+    key = code_interpreter_key("user", "session", payload, files)
+    changed = code_interpreter_key(
+        "user", "session", payload, [{**files[0], "checksum": "def"}]
+    )
+
+    assert key["input_files"] == [["data.csv", "abc"]]
+    assert key != changed
+    unversioned = [{"file_name": "user/session/data.csv"}]
+    assert code_interpreter_key("user", "session", payload, unversioned) is None
+
+
+def test_executor_uses_cached_results():
+    calls = []
+
+    def web_search(payload):
+        calls.append(payload["input"]["query"])
+        return {**RESPONSE, "extra": {"source": "search"}}
+
+    cache = ToolResultCache(MemoryBackend(10000), web_search_key)
+    provider = ToolProvider({"web_search": web_search})
+    s3_client = StubS3Client()
+    tool_use = {"toolUseId": "tool", "name": "web_search", "input": {"query": "q"}}
+
+    results = []
+    for _ in range(2):
+        executor = ConverseToolExecutor(
+            "user", "session", provider, {"web_search": cache}
+        )
+        results.append(executor.execute_tool_use(s3_client, tool_use, [], [], None))
+
+    assert calls == ["q"]
+    assert [result["extra"]["cache"]["hit"] for result in results] == [False, True]
+    assert results[1]["extra"]["source"] == "search"
+    assert results[1]["content"] == RESPONSE["content"]
@@ -0,0 +1,154 @@
+from common.context import (
+    ContextManager,
+    SUMMARY_TOOL_CHARS,
+    format_transcript,
+    is_turn_start,
+)
+
+# 100 tokens per text at the estimate of four characters per token.
+TEXT = "x" * 400
+
+
+def turn(idx: int):
+    return [
+        {"role": "user", "content": [{"text": f"{idx}{TEXT}"}]},
+        {
+            "role": "assistant",
+            "content": [
+                {"toolUse": {"toolUseId": f"t{idx}", "name": "tool", "input": {}}}
+            ],
+        },
+        {
+            "role": "user",
+            "content": [
+                {"toolResult": {"toolUseId": f"t{idx}", "content": [{"text": TEXT}]}}
+            ],
+        },
+        {"role": "assistant", "content": [{"text": TEXT}]},
+    ]
+
+
+def conversation(turns: int):
+    return [message for idx in range(turns) for message in turn(idx)]
+
+
+class RecordingSummarizer:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, previous: str, transcript: str):
+        self.calls.append((previous, transcript))
+        return f"summary {len(self.calls)}"
+
+
+def test_short_conversations_are_sent_as_they_are():
+    summarize = RecordingSummarizer()
+    manager = ContextManager(summarize, max_tokens=10000, recent_tokens=500)
+    messages = conversation(3)
+    context = {}
+
+    request_messages, stats = manager.prepare([], messages, context)
+
+    assert request_messages is messages
+    assert summarize.calls == []
+    assert context == {}
+    assert stats["saved_tokens"] == 0
+
+
+def test_older_turns_are_summarized():
+    summarize = RecordingSummarizer()
+    manager = ContextManager(summarize, max_tokens=1000, recent_tokens=500)
+    messages = conversation(5)
+    context = {}
+
+    request_messages, stats = manager.prepare([], messages, context)
+
+    # Two turns of 300 tokens are kept; the three before them are folded.
+    assert context == {"summary": "summary 1", "summarized": 12}
+    [(previous, transcript)] = summarize.calls
+    assert previous is None
+    assert "user: 2x" in transcript and "user: 3x" not in transcript
+    assert is_turn_start(request_messages[0])
+    assert request_messages[0]["content"][0]["text"].startswith(
+        "<conversation_summary>\nsummary 1\n"
+    )
+    assert request_messages[1:] == messages[13:]
+    assert stats["saved_tokens"] > 0
+    assert stats["summarized_messages"] == 12
+
+
+def test_summary_is_reused_until_the_history_outgrows_it():
+    summarize = RecordingSummarizer()
+    manager = ContextManager(summarize, max_tokens=1000, recent_tokens=500)
+    messages = conversation(5)
+    context = {}
+    manager.prepare([], messages, context)
+
+    manager.prepare([], messages, context)
+    assert len(summarize.calls) == 1
+
+    messages = conversation(8)
+    manager.prepare([], messages, context)
+
+    assert len(summarize.calls) == 2
+    previous, transcript = summarize.calls[1]
+    assert previous == "summary 1"
+    assert "user: 3x" in transcript and "user: 2x" not in transcript
+    assert context["summarized"] == 24
+
+
+def test_only_the_folded_part_is_hydrated():
+    hydrated = []
+
+    def hydrate(messages):
+        hydrated.extend(messages)
+        return messages
+
+    manager = ContextManager(RecordingSummarizer(), max_tokens=1000, recent_tokens=500)
+    messages = conversation(5)
+    manager.prepare([], messages, {}, hydrate)
+
+    assert hydrated == messages[:12]
+
+
+def test_failed_summary_drops_older_turns():
+    def summarize(previous, transcript):
+        raise RuntimeError("throttled")
+
+    manager = ContextManager(summarize, max_tokens=1000, recent_tokens=500)
+    context = {}
+    request_messages, _ = manager.prepare([], conversation(5), context)
+
+    assert context["summary"] == "Earlier turns were omitted."
+    assert "Earlier turns were omitted." in request_messages[0]["content"][0]["text"]
+
+
+def test_the_last_turn_is_kept_however_long():
+    manager = ContextManager(RecordingSummarizer(), max_tokens=100, recent_tokens=50)
+    messages = conversation(2)
+    context = {}
+
+    request_messages, _ = manager.prepare([], messages, context)
+
+    assert context["summarized"] == 4
+    assert len(request_messages) == 4
+
+
+def test_transcript_clips_tool_results():
+    message = {
+        "role": "user",
+        "content": [
+            {
+                "toolResult": {
+                    "toolUseId": "t",
+                    "status": "error",
+                    "content": [{"text": "y" * (SUMMARY_TOOL_CHARS + 10)}],
+                }
+            }
+        ],
+    }
+
+    transcript = format_transcript([message])
+
+    assert transcript.startswith("tool result (error): yyy")
+    assert transcript.endswith("... [10 characters omitted]")
@@ -0,0 +1,109 @@
+import os
+import json
+import threading
+from stubs import StubS3Client
+from tools import ConverseToolExecutor, ToolProvider
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "fixtures")
+
+
+def load_events(name: str):
+    with open(os.path.join(FIXTURES_PATH, name)) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def replay(executor: ConverseToolExecutor, events: list):
+    return "".join(executor.process_chunk(event) or "" for event in events)
+
+
+def test_replays_tool_use_stream():
+    executor = ConverseToolExecutor("user", "session")
+    text = replay(executor, load_events("tool_use.jsonl"))
+
+    assert text == executor.get_text()
+    assert executor.execution_requested()
+    assert executor.get_usage()["totalTokens"] == 3022
+    assert executor.get_metrics()["latencyMs"] == 9120
+
+    [message] = executor.get_assistant_messages()
+    tool_uses = [item["toolUse"] for item in message["content"] if "toolUse" in item]
+    assert [tool_use["name"] for tool_use in tool_uses] == [
+        "code_interpreter",
+        "web_search",
+    ]
+    assert all(isinstance(tool_use["input"], dict) for tool_use in tool_uses)
+
+
+def test_usage_without_metadata_event():
+    executor = ConverseToolExecutor("user", "session")
+    events = [e for e in load_events("long_artifact.jsonl") if "metadata" not in e]
+    replay(executor, events)
+
+    assert executor.get_usage() == {}
+    assert executor.get_metrics() == {}
+    assert not executor.execution_requested()
+
+
+def test_dispatches_tool_uses_while_streaming():
+    calls = []
+    provider = ToolProvider(
+        {
+            "code_interpreter": lambda payload: calls.append(payload["name"])
+            or {"status": "success", "content": {"text": "done"}},
+            "web_search": lambda payload: calls.append(payload["name"])
+            or {"status": "success", "content": {"text": "found"}},
+        }
+    )
+    executor = ConverseToolExecutor("user", "session", provider)
+    s3_client = StubS3Client()
+    executor.prepare(s3_client)
+
+    replay(executor, load_events("tool_use.jsonl"))
+    assert len(executor.dispatched) == 2
+
+    executor.execute(s3_client)
+
+    assert sorted(calls) == ["code_interpreter", "web_search"]
+    assert [result["status"] for result in executor.get_tool_results()] == [
+        "success",
+        "success",
+    ]
+
+
+def test_cancel_drops_dispatched_tool_uses():
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocking_tool(payload):
+        started.set()
+        release.wait(5)
+        return {"status": "success", "content": {"text": "late"}}
+
+    provider = ToolProvider(
+        {"code_interpreter": blocking_tool, "web_search": blocking_tool}
+    )
+    executor = ConverseToolExecutor("user", "session", provider)
+    executor.prepare(StubS3Client())
+
+    events = load_events("tool_use.jsonl")
+    replay(executor, events[:-2])
+    futures = list(executor.dispatched.values())
+    assert futures
+    assert started.wait(5)
+
+    executor.cancel()
+    release.set()
+
+    assert executor.dispatched == {}
+    assert executor.get_tool_results() == []
+    # The stream state is left as it was: usage is still reported.
+    replay(executor, events[-2:])
+    assert executor.get_usage()["totalTokens"] == 3022
+
+
+def test_result_caches_default_to_a_new_dict():
+    first = ConverseToolExecutor("user", "session")
+    first.result_caches["web_search"] = object()
+    second = ConverseToolExecutor("user", "session")
+
+    assert second.result_caches == {}
@@ -0,0 +1,124 @@
+import json
+import pytest
+import handler
+import common.sender
+import common.session
+from stubs import StubBedrockClient, StubS3Client, StubTable, client_error
+from common.images import ImageStore
+from common.routing import BedrockRouter, Endpoint
+from common.throttling import Admission
+
+
+def text_stream(text: str, input_tokens: int, output_tokens: int):
+    return {
+        "stream": [
+            {"messageStart": {"role": "assistant"}},
+            {"contentBlockDelta": {"delta": {"text": text}, "contentBlockIndex": 0}},
+            {"contentBlockStop": {"contentBlockIndex": 0}},
+            {"messageStop": {"stopReason": "end_turn"}},
+            {
+                "metadata": {
+                    "usage": {
+                        "inputTokens": input_tokens,
+                        "outputTokens": output_tokens,
+                        "totalTokens": input_tokens + output_tokens,
+                    },
+                    "metrics": {"latencyMs": 100},
+                }
+            },
+        ]
+    }
+
+
+class StubApiGateway:
+    def __init__(self):
+        self.messages = []
+
+    def post_to_connection(self, ConnectionId, Data):
+        frame = json.loads(Data)
+        self.messages.append(json.loads(frame["data"]))
+
+
+class StubLogger:
+    def info(self, message):
+        pass
+
+    def error(self, message):
+        print(message)
+
+
+@pytest.fixture
+def stubs(monkeypatch):
+    s3_client = StubS3Client()
+    bedrock_client = StubBedrockClient()
+    api_gateway = StubApiGateway()
+    table = StubTable("sessionId")
+
+    monkeypatch.setattr(handler, "s3_client", s3_client)
+    monkeypatch.setattr(handler, "image_store", ImageStore(s3_client))
+    monkeypatch.setattr(handler, "admission", Admission())
+    monkeypatch.setattr(handler, "tool_config", [])
+    monkeypatch.setattr(
+        handler,
+        "router",
+        BedrockRouter([Endpoint("us-east-1", "model", bedrock_client)]),
+    )
+    monkeypatch.setattr(common.sender, "api_gateway_management_api", api_gateway)
+    monkeypatch.setattr(common.session, "table", table)
+
+    return s3_client, bedrock_client, api_gateway, table
+
+
+def converse(message: str, session_version: int = 0):
+    body = {
+        "session_id": "session-1",
+        "event_type": "CONVERSE",
+        "message": message,
+        "session_version": session_version,
+    }
+
+    return handler.handle_message(StubLogger(), "connection", "user", body)
+
+
+def request_summaries(output: str):
+    return [
+        record
+        for record in map(json.loads, filter(None, output.splitlines()))
+        if record.get("summary") == "request"
+    ]
+
+
+def test_summary_reports_usage_of_the_request(stubs, capsys):
+    _, bedrock_client, api_gateway, _ = stubs
+    bedrock_client.results = [text_stream("Hi", 100, 10), text_stream("Ok", 150, 20)]
+
+    converse("Hello")
+    version = api_gateway.messages[-1]["session_version"]
+    capsys.readouterr()
+    converse("Thanks", version)
+
+    [summary] = request_summaries(capsys.readouterr().out)
+    assert summary["usage"]["inputTokens"] == 150
+    assert summary["usage"]["outputTokens"] == 20
+    assert summary["session_usage"]["inputTokens"] == 250
+    assert summary["session_usage"]["outputTokens"] == 30
+
+
+def test_failed_call_does_not_list_the_session(stubs):
+    s3_client, bedrock_client, api_gateway, table = stubs
+    bedrock_client.results = [client_error("ValidationException")]
+
+    converse("Hello")
+
+    assert api_gateway.messages[-1]["event_type"] == "ERROR"
+    assert table.items == {}
+    assert s3_client.count("put_object") == 0
+
+
+def test_new_session_is_listed(stubs):
+    _, bedrock_client, _, table = stubs
+    bedrock_client.results = [text_stream("Hi", 100, 10)]
+
+    converse("Hello")
+
+    assert table.items["session-1"]["title"] == "Hello"
@@ -0,0 +1,84 @@
+import io
+from PIL import Image
+from stubs import StubS3Client
+from common.images import (
+    IMAGE_MAX_DIMENSION,
+    SESSION_BUCKET_NAME,
+    ImageStore,
+    detect_format,
+    encode_image,
+)
+from common.memory import MemoryBackend
+
+
+def png(width: int, height: int):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 40, 40)).save(buffer, format="PNG")
+
+    return buffer.getvalue()
+
+
+class OriginalReader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.calls = 0
+
+    def __call__(self, file_to_inline: dict):
+        self.calls += 1
+        return self.data
+
+
+def test_large_images_are_downscaled():
+    data, format = encode_image(png(IMAGE_MAX_DIMENSION * 2, 100), "png")
+
+    image = Image.open(io.BytesIO(data))
+    assert max(image.size) == IMAGE_MAX_DIMENSION
+    assert format == detect_format(data)
+
+
+def test_unreadable_images_are_kept():
+    assert encode_image(b"not an image", "png") == (b"not an image", "png")
+
+
+def test_variants_are_encoded_once_per_checksum():
+    s3_client = StubS3Client()
+    read_original = OriginalReader(png(64, 64))
+    file_to_inline = {"file_name": "a.png", "format": "png", "checksum": "abc"}
+
+    first = ImageStore(s3_client).inline("user", file_to_inline, read_original)
+    # A new store, as in another execution environment, reads the variant.
+    second = ImageStore(s3_client).inline("user", file_to_inline, read_original)
+
+    assert first == second
+    assert first["image"]["source"]["__image__"].startswith("user/images/abc-")
+    assert read_original.calls == 1
+    assert s3_client.count("put_object") == 1
+
+
+def test_variants_are_served_from_memory():
+    s3_client = StubS3Client()
+    store = ImageStore(s3_client, MemoryBackend(1000000))
+    file_to_inline = {"file_name": "a.png", "format": "png", "checksum": "abc"}
+
+    [content] = store.inline_files("user", [file_to_inline], OriginalReader(png(8, 8)))
+    store.hydrate([{"role": "user", "content": [content]}])
+
+    assert s3_client.count("get_object") == 1
+
+
+def test_hydrate_puts_the_bytes_back():
+    s3_client = StubS3Client()
+    store = ImageStore(s3_client)
+    file_to_inline = {"file_name": "a.png", "format": "png"}
+    content = store.inline("user", file_to_inline, OriginalReader(png(8, 8)))
+    text_message = {"role": "assistant", "content": [{"text": "Hi"}]}
+    messages = [{"role": "user", "content": [{"text": "Look"}, content]}, text_message]
+
+    hydrated = ImageStore(s3_client).hydrate(messages)
+
+    [(_, key)] = [call for call in s3_client.calls if call[0] == "put_object"]
+    stored = s3_client.objects[(SESSION_BUCKET_NAME, key)]
+    assert hydrated[0]["content"][1]["image"]["source"] == {"bytes": stored}
+    assert hydrated[1] is text_message
+    assert "__image__" in messages[0]["content"][1]["image"]["source"]
+
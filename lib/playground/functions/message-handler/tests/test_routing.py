@@ -0,0 +1,150 @@
+import pytest
+from stubs import StubBedrockClient, client_error
+from common import routing
+from common.routing import BedrockRouter, Endpoint, NoEndpointAvailable
+
+
+def create_router(*results, low_priority: list = None):
+    endpoints = [
+        Endpoint(f"region-{idx}", "model", StubBedrockClient(endpoint_results))
+        for idx, endpoint_results in enumerate(results)
+    ]
+    low_priority_endpoints = [
+        Endpoint(f"low-{idx}", "model", StubBedrockClient(endpoint_results))
+        for idx, endpoint_results in enumerate(low_priority or [])
+    ]
+
+    return BedrockRouter(endpoints, low_priority_endpoints)
+
+
+def test_low_priority_endpoints_default_to_a_new_list():
+    first = BedrockRouter([Endpoint("region", "model", StubBedrockClient())])
+    first.low_priority_endpoints.append("endpoint")
+    second = BedrockRouter([Endpoint("region", "model", StubBedrockClient())])
+
+    assert second.low_priority_endpoints == []
+
+
+@pytest.mark.parametrize(
+    "error",
+    [client_error("ThrottlingException", 429), client_error("InternalFailure", 500)],
+)
+def test_fails_over_on_throttling_and_server_errors(error):
+    router = create_router([error], [{"stream": []}])
+
+    endpoint, _ = router.converse_stream(messages=[])
+
+    assert endpoint.region == "region-1"
+    assert router.endpoints[0].failures == 1
+
+
+def test_does_not_fail_over_on_validation_errors():
+    router = create_router([client_error("ValidationException")], [{"stream": []}])
+
+    with pytest.raises(Exception, match="ValidationException"):
+        router.converse_stream(messages=[])
+
+    assert router.endpoints[1].client.requests == []
+    assert router.endpoints[0].state == routing.CLOSED
+
+
+def test_raises_the_last_error_when_every_endpoint_fails():
+    router = create_router(
+        [client_error("ThrottlingException", 429)],
+        [client_error("ServiceUnavailableException", 503)],
+    )
+
+    with pytest.raises(Exception, match="ServiceUnavailableException"):
+        router.converse_stream(messages=[])
+
+
+def test_circuit_opens_and_probes_after_the_open_period(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(routing.time, "time", lambda: now[0])
+    throttled = [
+        client_error("ThrottlingException", 429)
+        for _ in range(routing.ROUTER_FAILURE_THRESHOLD)
+    ]
+    router = create_router(throttled, [{"stream": []}] * 10)
+    first = router.endpoints[0]
+
+    for _ in range(routing.ROUTER_FAILURE_THRESHOLD):
+        router.converse_stream(messages=[])
+
+    assert first.state == routing.OPEN
+    endpoint, _ = router.converse_stream(messages=[])
+    assert endpoint.region == "region-1"
+    assert len(first.client.requests) == routing.ROUTER_FAILURE_THRESHOLD
+
+    # After the open period one request probes the endpoint and closes it.
+    now[0] += routing.ROUTER_OPEN_SECONDS
+    endpoint, _ = router.converse_stream(messages=[])
+    assert endpoint is first
+    assert first.state == routing.CLOSED
+
+
+def test_failed_probe_opens_the_circuit_again(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(routing.time, "time", lambda: now[0])
+    throttled = [
+        client_error("ThrottlingException", 429)
+        for _ in range(routing.ROUTER_FAILURE_THRESHOLD + 1)
+    ]
+    router = create_router(throttled, [{"stream": []}] * 10)
+    first = router.endpoints[0]
+
+    for _ in range(routing.ROUTER_FAILURE_THRESHOLD):
+        router.converse_stream(messages=[])
+
+    now[0] += routing.ROUTER_OPEN_SECONDS
+    router.converse_stream(messages=[])
+
+    assert first.state == routing.OPEN
+    assert first.opened_at == now[0]
+
+
+def test_all_circuits_open_tries_the_oldest(monkeypatch):
+    monkeypatch.setattr(routing.time, "time", lambda: 1000.0)
+    router = create_router([{"stream": []}], [{"stream": []}])
+    for endpoint, opened_at in zip(router.endpoints, [990.0, 980.0]):
+        endpoint.state = routing.OPEN
+        endpoint.opened_at = opened_at
+
+    assert router.candidates() == [router.endpoints[1]]
+
+
+def test_low_priority_requests_prefer_their_endpoints():
+    router = create_router(
+        [{"stream": []}],
+        low_priority=[[client_error("ThrottlingException", 429)]],
+    )
+
+    assert [endpoint.region for endpoint in router.candidates("low")] == [
+        "low-0",
+        "region-0",
+    ]
+    assert [endpoint.region for endpoint in router.candidates()] == ["region-0"]
+
+    endpoint, _ = router.converse_stream(priority="low", messages=[])
+    assert endpoint.region == "region-0"
+
+
+def test_markedly_faster_endpoint_is_preferred():
+    router = create_router([], [])
+    router.endpoints[0].latency = 1.0
+    router.endpoints[1].latency = 1.0 / (routing.ROUTER_LATENCY_MARGIN + 1)
+
+    assert router.candidates()[0] is router.endpoints[1]
+
+    router.endpoints[0].latency = router.endpoints[1].latency
+    assert router.candidates()[0] is router.endpoints[0]
+
+
+def test_no_endpoint_available_while_probing():
+    router = create_router([{"stream": []}])
+    endpoint = router.endpoints[0]
+    endpoint.state = routing.HALF_OPEN
+    endpoint.probing = True
+
+    with pytest.raises(NoEndpointAvailable):
+        router.converse_stream(messages=[])
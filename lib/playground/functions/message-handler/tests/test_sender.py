@@ -0,0 +1,81 @@
+import json
+import pytest
+import common.sender
+from common.memory import MemoryBackend
+from common.sender import MAX_PAYLOAD_SIZE, MessageSender
+from stubs import StubS3Client
+from tools import ConverseToolExecutor, ToolProvider
+from tools.cache import ToolResultCache, web_search_key
+
+
+class StubApiGateway:
+    def __init__(self):
+        self.frames = []
+
+    def post_to_connection(self, ConnectionId, Data):
+        self.frames.append(json.loads(Data))
+
+    def messages(self):
+        messages, parts = [], []
+        for frame in self.frames:
+            parts.append(frame["data"])
+            if frame["last"]:
+                messages.append(json.loads("".join(parts)))
+                parts = []
+
+        return messages
+
+
+@pytest.fixture
+def api_gateway(monkeypatch):
+    api_gateway = StubApiGateway()
+    monkeypatch.setattr(common.sender, "api_gateway_management_api", api_gateway)
+
+    return api_gateway
+
+
+def search_executor(cache: ToolResultCache = None):
+    provider = ToolProvider(
+        {"web_search": lambda payload: {"status": "success", "content": {"text": "r"}}}
+    )
+    caches = {"web_search": cache} if cache else None
+    executor = ConverseToolExecutor("user", "session", provider, caches)
+    executor.tool_use = {
+        0: {"toolUseId": "tool", "name": "web_search", "input": '{"query": "q"}'}
+    }
+
+    return executor
+
+
+def test_forwards_tool_result_cache_stats(api_gateway):
+    cache = ToolResultCache(MemoryBackend(10000), web_search_key)
+    sender = MessageSender("connection")
+
+    for _ in range(2):
+        executor = search_executor(cache)
+        executor.execute(StubS3Client())
+        sender.send_tool_finished_messages(executor)
+
+    first, second = [message["extra"]["cache"] for message in api_gateway.messages()]
+    assert first == {"hit": False, "hits": 0, "requests": 1, "hit_rate": 0.0}
+    assert second == {"hit": True, "hits": 1, "requests": 2, "hit_rate": 0.5}
+
+
+def test_results_without_a_cache_have_no_stats(api_gateway):
+    executor = search_executor()
+    executor.execute(StubS3Client())
+    MessageSender("connection").send_tool_finished_messages(executor)
+
+    [message] = api_gateway.messages()
+    assert message["extra"]["response_text"] == "r"
+    assert "cache" not in message["extra"]
+
+
+def test_large_messages_are_split_into_frames(api_gateway):
+    text = "x" * (MAX_PAYLOAD_SIZE * 2)
+    MessageSender("connection").send_text(text)
+
+    assert len(api_gateway.frames) == 3
+    assert [frame["frame_idx"] for frame in api_gateway.frames] == [1, 2, 3]
+    [message] = api_gateway.messages()
+    assert message["text"] == text
@@ -0,0 +1,63 @@
+import json
+from stubs import StubS3Client
+from tools import ConverseToolExecutor, ToolProvider
+
+BUCKET = "uploads"
+
+
+def tool_use(tool_name: str, input: dict):
+    return {"toolUseId": f"{tool_name}-1", "name": tool_name, "input": input}
+
+
+def run_tool(s3_client, provider, current: dict):
+    progress = []
+    executor = ConverseToolExecutor("user", "session", provider)
+    result = executor.execute_tool_use(
+        s3_client,
+        current,
+        [],
+        [],
+        lambda tool_use_id, tool_name, records: progress.append(records),
+    )
+
+    return result, progress
+
+
+def test_code_interpreter_streams_records():
+    s3_client = StubS3Client()
+
+    def code_interpreter(payload):
+        prefix = payload["stream"]["fields"]["key"].replace("${filename}", "")
+        record = {"sequence": 1, "outputs": [{"name": "stdout", "text": "1\n"}]}
+        s3_client.put_object(BUCKET, f"{prefix}0001.json", json.dumps(record))
+        return {"status": "success", "content": {"text": "1"}}
+
+    provider = ToolProvider({"code_interpreter": code_interpreter})
+    result, _ = run_tool(
+        s3_client, provider, tool_use("code_interpreter", {"code": "print(1)"})
+    )
+
+    assert result["status"] == "success"
+    assert s3_client.count("list_objects_v2") >= 1
+    assert s3_client.count("delete_objects") == 1
+    assert not any("/stream/" in key for _, key in s3_client.objects)
+
+
+def test_other_tools_are_not_polled():
+    s3_client = StubS3Client()
+    provider = ToolProvider(
+        {
+            "web_search": lambda payload: {
+                "status": "success",
+                "content": {"text": "stream" in payload and "streamed" or "plain"},
+            }
+        }
+    )
+    result, progress = run_tool(
+        s3_client, provider, tool_use("web_search", {"query": "q"})
+    )
+
+    assert result["content"]["text"] == "plain"
+    assert progress == []
+    assert s3_client.count("list_objects_v2") == 0
+    assert s3_client.count("delete_objects") == 0
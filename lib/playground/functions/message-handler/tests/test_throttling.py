@@ -0,0 +1,144 @@
+import pytest
+from stubs import StubTable, client_error
+from common import metrics
+from common.throttling import (
+    Admission,
+    DynamoDBBucketBackend,
+    LocalBucketBackend,
+    RateLimitExceeded,
+    RetriesExhausted,
+    RetryStats,
+    TokenBucket,
+)
+
+
+class FailingBackend:
+    def take(self, name, amount, capacity, max_wait):
+        raise client_error("ValidationException")
+
+    def give(self, name, amount, capacity):
+        raise client_error("ValidationException")
+
+
+def test_dynamodb_bucket_is_created_and_updated():
+    table = StubTable("bucket")
+    backend = DynamoDBBucketBackend(table)
+
+    assert backend.take("tokens", 40, 100, 60) == 0.0
+    assert float(table.items["tokens"]["tokens"]) == pytest.approx(60, abs=0.1)
+
+    assert backend.take("tokens", 50, 100, 60) == 0.0
+    assert float(table.items["tokens"]["tokens"]) == pytest.approx(10, abs=0.1)
+
+    backend.give("tokens", 30, 100)
+    assert float(table.items["tokens"]["tokens"]) == pytest.approx(40, abs=0.1)
+
+
+def test_dynamodb_bucket_rejects_beyond_max_wait():
+    backend = DynamoDBBucketBackend(StubTable("bucket"))
+
+    assert backend.take("requests", 10, 10, 60) == 0.0
+    # Ten more requests need a full minute of refill.
+    assert backend.take("requests", 10, 10, 30) is None
+    assert backend.take("requests", 5, 10, 60) == pytest.approx(30, abs=0.5)
+
+
+def test_dynamodb_bucket_retries_conflicting_updates():
+    table = StubTable("bucket")
+    backend = DynamoDBBucketBackend(table)
+    backend.take("tokens", 10, 100, 60)
+
+    put_item = table.put_item
+    conflicts = []
+
+    def conflicting_put_item(**params):
+        if not conflicts:
+            # Another container updates the bucket between read and write.
+            conflicts.append(True)
+            table.items["tokens"]["updated"] += 1
+        put_item(**params)
+
+    table.put_item = conflicting_put_item
+    assert backend.take("tokens", 10, 100, 60) == 0.0
+    assert table.calls.count("get_item") == 3
+
+
+def test_failing_backend_admits_and_is_counted():
+    request_metrics = metrics.begin()
+    bucket = TokenBucket("tokens", 100, FailingBackend())
+
+    assert bucket.take(10) == 0.0
+    bucket.give(10)
+
+    summary = request_metrics.summary()["metrics"]
+    metrics.end()
+    assert summary["AdmissionBackendErrors.tokens"]["sum"] == 2
+
+
+def test_token_rejection_returns_request_token(monkeypatch):
+    monkeypatch.setattr("common.throttling.time.sleep", lambda seconds: None)
+    backend = LocalBucketBackend()
+    admission = Admission(rpm=10, tpm=1000, backend=backend)
+
+    # The second call waits a minute for the tokens, a third would wait two.
+    admission.admit(1000, RetryStats())
+    admission.admit(1000, RetryStats())
+    requests_before = backend.buckets["requests"][0]
+
+    with pytest.raises(RateLimitExceeded):
+        admission.admit(1000, RetryStats())
+
+    assert backend.buckets["requests"][0] == pytest.approx(requests_before, abs=0.1)
+
+
+def test_settle_returns_unused_tokens():
+    backend = LocalBucketBackend()
+    admission = Admission(tpm=1000, backend=backend)
+
+    admission.admit(800, RetryStats())
+    admission.settle(800, 300)
+
+    assert backend.buckets["tokens"][0] == pytest.approx(700, abs=1)
+
+
+def test_retries_throttled_calls(monkeypatch):
+    monkeypatch.setattr("common.throttling.time.sleep", lambda seconds: None)
+    admission = Admission(max_attempts=3)
+    errors = [client_error("ThrottlingException", 429)] * 2
+    stats = RetryStats()
+
+    def call():
+        if errors:
+            raise errors.pop()
+        return "ok"
+
+    assert admission.call(call, stats=stats) == "ok"
+    assert (stats.attempts, stats.retries, stats.throttles) == (3, 2, 2)
+
+    def always_throttled():
+        raise client_error("ThrottlingException", 429)
+
+    with pytest.raises(RetriesExhausted):
+        admission.call(always_throttled)
+
+
+def test_summarization_settles_its_reservation(monkeypatch):
+    import handler
+    from common.routing import BedrockRouter, Endpoint
+    from stubs import StubBedrockClient
+
+    stream = [
+        {"contentBlockDelta": {"delta": {"text": "The user asked for a chart."}}},
+        {"metadata": {"usage": {"totalTokens": 120}}},
+    ]
+    client = StubBedrockClient([{"stream": stream}])
+    backend = LocalBucketBackend()
+    monkeypatch.setattr(
+        handler, "router", BedrockRouter([Endpoint("us-east-1", "model", client)])
+    )
+    monkeypatch.setattr(handler, "admission", Admission(tpm=100000, backend=backend))
+
+    assert handler.summarize_context(None, "user: draw a chart") == (
+        "The user asked for a chart."
+    )
+    assert backend.buckets["tokens"][0] == pytest.approx(100000 - 120, abs=5)
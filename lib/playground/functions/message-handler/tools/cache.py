@@ -0,0 +1,323 @@
+import os
+import re
+import json
+import time
+import boto3
+import hashlib
+import threading
+from collections import OrderedDict
+from common.memory import MemoryBackend
+
+TOOL_RESULT_CACHE = os.environ.get("TOOL_RESULT_CACHE", "")
+TOOL_RESULT_CACHE_TTL = int(os.environ.get("TOOL_RESULT_CACHE_TTL", "3600"))
+TOOL_RESULT_CACHE_MAX_BYTES = int(
+    os.environ.get("TOOL_RESULT_CACHE_MAX_BYTES", str(32 * 1000 * 1000))
+)
+TOOL_RESULT_CACHE_PATH = os.environ.get(
+    "TOOL_RESULT_CACHE_PATH", "/tmp/tool-result-cache"
+)
+
+WEB_SEARCH_CACHE = os.environ.get("WEB_SEARCH_CACHE", "")
+WEB_SEARCH_CACHE_TTL = int(os.environ.get("WEB_SEARCH_CACHE_TTL", "900"))
+WEB_SEARCH_CACHE_MAX_BYTES = int(
+    os.environ.get("WEB_SEARCH_CACHE_MAX_BYTES", str(16 * 1000 * 1000))
+)
+TOOL_CACHE_TABLE_NAME = os.environ.get("TOOL_CACHE_TABLE_NAME")
+DYNAMODB_MAX_ITEM_BYTES = 350 * 1000
+
+KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class LocalDiskBackend:
+    # One file per entry, named by key, with an expiry header line. Survives
+    # handler restarts within the same execution environment.
+    def __init__(
+        self,
+        path: str = TOOL_RESULT_CACHE_PATH,
+        max_bytes: int = TOOL_RESULT_CACHE_MAX_BYTES,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(self.path, exist_ok=True)
+        self.load()
+
+    def load(self):
+        files = []
+        for name in os.listdir(self.path):
+            file_path = os.path.join(self.path, name)
+
+            if not KEY_PATTERN.match(name):
+                os.remove(file_path)
+                continue
+
+            stat = os.stat(file_path)
+            files.append((stat.st_mtime, name, stat.st_size))
+
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.total_bytes += size
+
+    def entry_path(self, key: str):
+        return os.path.join(self.path, key)
+
+    def get(self, key: str):
+        with self.lock:
+            if key not in self.entries:
+                return None
+
+            self.entries.move_to_end(key)
+
+        try:
+            with open(self.entry_path(key), "rb") as f:
+                expires = float(f.readline())
+                data = f.read()
+        except (FileNotFoundError, ValueError):
+            self.delete(key)
+            return None
+
+        return expires, data
+
+    def put(self, key: str, expires: float, data: bytes):
+        content = f"{expires}\n".encode("utf-8") + data
+        if len(content) > self.max_bytes:
+            return
+
+        tmp_path = f"{self.entry_path(key)}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, self.entry_path(key))
+
+        with self.lock:
+            size = self.entries.pop(key, None)
+            if size is not None:
+                self.total_bytes -= size
+
+            self.entries[key] = len(content)
+            self.total_bytes += len(content)
+
+            while self.total_bytes > self.max_bytes:
+                evicted, evicted_size = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+                try:
+                    os.remove(self.entry_path(evicted))
+                except FileNotFoundError:
+                    pass
+
+    def delete(self, key: str):
+        with self.lock:
+            size = self.entries.pop(key, None)
+            if size is None:
+                return
+
+            self.total_bytes -= size
+
+        try:
+            os.remove(self.entry_path(key))
+        except FileNotFoundError:
+            pass
+
+
+class DynamoDBBackend:
+    # Items are {cacheKey, expires, data}; expires doubles as the table's TTL
+    # attribute so expired entries are also removed by DynamoDB itself.
+    def __init__(self, table, max_bytes: int = DYNAMODB_MAX_ITEM_BYTES):
+        self.table = table
+        self.max_bytes = max_bytes
+
+    def get(self, key: str):
+        item = self.table.get_item(Key={"cacheKey": key}).get("Item")
+        if item is None:
+            return None
+
+        return float(item["expires"]), item["data"].encode("utf-8")
+
+    def put(self, key: str, expires: float, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+
+        self.table.put_item(
+            Item={
+                "cacheKey": key,
+                "expires": int(expires),
+                "data": data.decode("utf-8"),
+            }
+        )
+
+    def delete(self, key: str):
+        self.table.delete_item(Key={"cacheKey": key})
+
+
+class LocalTable:
+    # Stand-in for the subset of the boto3 DynamoDB Table interface used by
+    # DynamoDBBackend, for local runs without a table.
+    def __init__(self, key_name: str = "cacheKey"):
+        self.key_name = key_name
+        self.items = {}
+        self.lock = threading.Lock()
+
+    def get_item(self, Key: dict):
+        with self.lock:
+            item = self.items.get(Key[self.key_name])
+
+        return {"Item": dict(item)} if item is not None else {}
+
+    def put_item(self, Item: dict):
+        with self.lock:
+            self.items[Item[self.key_name]] = dict(Item)
+
+        return {}
+
+    def delete_item(self, Key: dict):
+        with self.lock:
+            self.items.pop(Key[self.key_name], None)
+
+        return {}
+
+
+def code_interpreter_key(user_id: str, session_id: str, payload: dict, files: list):
+    # Scoped to the session: file references and output files are per session.
+    input_files = []
+    for file in files:
+        checksum = file.get("checksum")
+        if not checksum:
+            return None
+
+        input_files.append([os.path.basename(file["file_name"]), checksum])
+
+    output_files = [file["file_name"] for file in payload["output_files"]]
+    input = {**payload["input"], "output_files": sorted(output_files)}
+
+    return {
+        "user_id": user_id,
+        "session_id": session_id,
+        "name": payload["name"],
+        "input": input,
+        "input_files": sorted(input_files),
+        "result_max_tokens": payload.get("result_max_tokens"),
+    }
+
+
+def web_search_key(user_id: str, session_id: str, payload: dict, files: list):
+    # Shared across sessions and users: results only depend on the query.
+    input = payload["input"]
+    query = " ".join(str(input.get("query") or "").lower().split())
+
+    urls = input.get("urls") or []
+    if isinstance(urls, str):
+        urls = [urls]
+
+    return {
+        "name": payload["name"],
+        "query": query,
+        "urls": sorted(set(str(url).strip() for url in urls)),
+        "result_max_tokens": payload.get("result_max_tokens"),
+    }
+
+
+class ToolResultCache:
+    # Caches successful results of a tool by a hash of the parts of its input
+    # and files that determine the result, as returned by key_function.
+    def __init__(self, backend, key_function, ttl: int = TOOL_RESULT_CACHE_TTL):
+        self.backend = backend
+        self.key_function = key_function
+        self.ttl = ttl
+        self.hits = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def key(self, user_id: str, session_id: str, payload: dict, files: list):
+        value = self.key_function(user_id, session_id, payload, files)
+        if value is None:
+            return None
+
+        data = json.dumps(value, sort_keys=True)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        if not key:
+            return None
+
+        try:
+            entry = self.backend.get(key)
+        except Exception as e:
+            print(f"Failed to read tool result cache: {e}")
+            entry = None
+
+        if entry is not None and entry[0] < time.time():
+            self.delete(key)
+            entry = None
+
+        with self.lock:
+            self.requests += 1
+            if entry is not None:
+                self.hits += 1
+
+        if entry is None:
+            return None
+
+        return json.loads(entry[1])
+
+    def put(self, key: str, response: dict):
+        if not key or response.get("status") != "success":
+            return
+
+        data = json.dumps(response).encode("utf-8")
+
+        try:
+            self.backend.put(key, time.time() + self.ttl, data)
+        except Exception as e:
+            print(f"Failed to write tool result cache: {e}")
+
+    def delete(self, key: str):
+        try:
+            self.backend.delete(key)
+        except Exception as e:
+            print(f"Failed to delete from tool result cache: {e}")
+
+    def stats(self, hit: bool):
+        with self.lock:
+            hits, requests = self.hits, self.requests
+
+        return {
+            "hit": hit,
+            "hits": hits,
+            "requests": requests,
+            "hit_rate": round(hits / requests, 3) if requests else 0.0,
+        }
+
+
+def create_backend(backend: str, max_bytes: int):
+    if backend == "memory":
+        return MemoryBackend(max_bytes)
+    if backend == "disk":
+        return LocalDiskBackend(max_bytes=max_bytes)
+    if backend == "dynamodb":
+        if TOOL_CACHE_TABLE_NAME:
+            table = boto3.resource("dynamodb").Table(TOOL_CACHE_TABLE_NAME)
+        else:
+            table = LocalTable()
+
+        return DynamoDBBackend(table)
+
+    return None
+
+
+def create_code_interpreter_cache():
+    backend = create_backend(TOOL_RESULT_CACHE, TOOL_RESULT_CACHE_MAX_BYTES)
+    if backend is None:
+        return None
+
+    return ToolResultCache(backend, code_interpreter_key, TOOL_RESULT_CACHE_TTL)
+
+
+def create_web_search_cache():
+    backend = create_backend(WEB_SEARCH_CACHE, WEB_SEARCH_CACHE_MAX_BYTES)
+    if backend is None:
+        return None
+
+    return ToolResultCache(backend, web_search_key, WEB_SEARCH_CACHE_TTL)
@@ -1,72 +1,131 @@
+import os
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from .provider import ToolProvider
-from common.files import generate_presigned_get, generate_presigned_post
+from .streaming import is_streaming_tool, create_stream_channel
+from .shaping import TOOL_RESULT_MAX_TOKENS, shape_tool_content
+from common import metrics
+from common.files import (
+    generate_presigned_get,
+    generate_presigned_post,
+    generate_presigned_post_response_prefix,
+)
+
+STREAM_POLL_INTERVAL = 1.0
+TOOL_MAX_CONCURRENCY = int(os.environ.get("TOOL_MAX_CONCURRENCY", "4"))
+TOOL_TIMEOUT = float(os.environ.get("TOOL_TIMEOUT", "840"))
+TOOL_TIMEOUTS = json.loads(os.environ.get("TOOL_TIMEOUTS", "{}"))
+TOOL_SPECULATIVE_DISPATCH = os.environ.get("TOOL_SPECULATIVE_DISPATCH", "1")
+
+# Tool uses are dispatched on a bounded pool, while the provider calls they
+# wait on run on a separate pool so a dispatched tool use never waits for a
+# free worker in its own pool.
+dispatch_executor = ThreadPoolExecutor(
+    max_workers=TOOL_MAX_CONCURRENCY, thread_name_prefix="dispatch"
+)
+tool_executor = ThreadPoolExecutor(thread_name_prefix="tool")
 
 
 class ConverseToolExecutor:
     def __init__(
-        self, user_id: str, session_id: str, provider: ToolProvider = ToolProvider()
+        self,
+        user_id: str,
+        session_id: str,
+        provider: ToolProvider = ToolProvider(),
+        result_caches: dict = None,
     ):
         self.user_id = user_id
         self.session_id = session_id
         self.provider = provider
-        self.text_accumulator = ""
+        self.result_caches = result_caches or {}
+        self.text_parts = []
         self.tool_use = {}
         self.stop_on_tool_use = False
         self.tool_results = []
+        self.dispatch_args = None
+        self.input_files = None
+        self.dispatched = {}
+        self.usage = {}
+        self.metrics = {}
+        self.event_handlers = {
+            "contentBlockStart": self.process_content_block_start,
+            "contentBlockDelta": self.process_content_block_delta,
+            "contentBlockStop": self.process_content_block_stop,
+            "messageStop": self.process_message_stop,
+            "metadata": self.process_metadata,
+        }
 
     def process_chunk(self, chunk):
-        content_block_start = chunk.get("contentBlockStart")
-        content_block_stop = chunk.get("contentBlockStop")
-        contend_block_delta = chunk.get("contentBlockDelta")
-        stop_reason = chunk.get("messageStop", {}).get("stopReason")
-        if stop_reason == "tool_use":
-            self.stop_on_tool_use = True
+        for event_type, event in chunk.items():
+            process_event = self.event_handlers.get(event_type)
+            if process_event:
+                return process_event(event)
+
+        return None
+
+    def process_content_block_start(self, event):
+        tool_use = event.get("start", {}).get("toolUse")
+        if tool_use:
+            self.update_tool_use(event.get("contentBlockIndex"), tool_use)
 
-        content_block_index = None
-        if content_block_start:
-            content_block_index = content_block_start.get("contentBlockIndex")
-        elif content_block_stop:
-            content_block_index = content_block_stop.get("contentBlockIndex")
-        elif contend_block_delta:
-            content_block_index = contend_block_delta.get("contentBlockIndex")
-
-        delta = None
-        text = None
-        tool_use = None
-        if content_block_start:
-            start = content_block_start.get("start")
-            tool_use = start.get("toolUse")
-        elif contend_block_delta:
-            delta = contend_block_delta.get("delta")
-            tool_use = delta.get("toolUse")
-            text = delta.get("text")
+        return None
+
+    def process_content_block_delta(self, event):
+        delta = event.get("delta", {})
 
+        text = delta.get("text")
         if text:
-            self.text_accumulator += text
+            self.text_parts.append(text)
             return text
+
+        tool_use = delta.get("toolUse")
         if tool_use:
-            current_tool_use = self.tool_use.get(content_block_index)
-            if not current_tool_use:
-                current_tool_use = {
-                    "toolUseId": "",
-                    "name": "",
-                    "input": "",
-                }
-                self.tool_use[content_block_index] = current_tool_use
-
-            current_tool_use_id = tool_use.get("toolUseId")
-            if current_tool_use_id:
-                current_tool_use["toolUseId"] = current_tool_use_id
-            current_tool_use_name = tool_use.get("name")
-            if current_tool_use_name:
-                current_tool_use["name"] = current_tool_use_name
-            current_input = tool_use.get("input")
-            if current_input:
-                current_tool_use["input"] += current_input
+            self.update_tool_use(event.get("contentBlockIndex"), tool_use)
 
         return None
 
+    def process_content_block_stop(self, event):
+        content_block_index = event.get("contentBlockIndex")
+        if self.dispatch_args and content_block_index in self.tool_use:
+            self.dispatch(content_block_index)
+
+        return None
+
+    def process_message_stop(self, event):
+        if event.get("stopReason") == "tool_use":
+            self.stop_on_tool_use = True
+
+        return None
+
+    def process_metadata(self, event):
+        self.usage = event.get("usage", {})
+        self.metrics = event.get("metrics", {})
+
+        return None
+
+    def update_tool_use(self, content_block_index, tool_use: dict):
+        current_tool_use = self.tool_use.get(content_block_index)
+        if not current_tool_use:
+            # Input deltas are collected in a list and joined once when the
+            # tool use is formatted.
+            current_tool_use = {
+                "toolUseId": "",
+                "name": "",
+                "input": [],
+            }
+            self.tool_use[content_block_index] = current_tool_use
+
+        current_tool_use_id = tool_use.get("toolUseId")
+        if current_tool_use_id:
+            current_tool_use["toolUseId"] = current_tool_use_id
+        current_tool_use_name = tool_use.get("name")
+        if current_tool_use_name:
+            current_tool_use["name"] = current_tool_use_name
+        current_input = tool_use.get("input")
+        if current_input:
+            current_tool_use["input"].append(current_input)
+
     def process_response(self, response):
         stop_reason = response.get("stopReason")
         if stop_reason == "tool_use":
@@ -79,7 +138,7 @@ class ConverseToolExecutor:
             tool_use = current.get("toolUse")
 
             if text:
-                self.text_accumulator += text
+                self.text_parts.append(text)
 
             if tool_use:
                 current_tool_use = {
@@ -91,72 +150,228 @@ class ConverseToolExecutor:
                 self.tool_use[idx] = current_tool_use
 
     def get_text(self):
-        return self.text_accumulator
+        return "".join(self.text_parts)
+
+    def get_usage(self):
+        return self.usage
+
+    def get_metrics(self):
+        return self.metrics
 
     def execution_requested(self):
         return self.stop_on_tool_use
 
-    def execute(self, s3_client, file_names: list = []):
-        tool_use = self.get_formatted_tool_use()
+    # Enables speculative dispatch: each tool use starts as soon as its content
+    # block closes, while the rest of the response is still streaming.
+    def prepare(self, s3_client, files: list = [], on_progress=None):
+        if TOOL_SPECULATIVE_DISPATCH != "1":
+            return
+
+        self.dispatch_args = (s3_client, files, on_progress)
+
+    def dispatch(self, content_block_index):
+        s3_client, files, on_progress = self.dispatch_args
+
+        try:
+            current = self.format_tool_use(self.tool_use[content_block_index])
+        except json.JSONDecodeError:
+            return
+
+        self.dispatched[content_block_index] = dispatch_executor.submit(
+            self.execute_tool_use,
+            s3_client,
+            current,
+            self.get_input_files(s3_client, files),
+            files,
+            on_progress,
+        )
+
+    def cancel(self):
+        # Tool uses already running finish in the background; their results
+        # are dropped.
+        for future in self.dispatched.values():
+            future.cancel()
+
+        self.dispatched = {}
+
+    def execute(self, s3_client, files: list = [], on_progress=None):
+        input_files = self.get_input_files(s3_client, files)
+
+        # Tool uses run concurrently; results keep the order of the tool uses.
+        futures = []
+        for content_block_index, current in self.tool_use.items():
+            future = self.dispatched.get(content_block_index)
+            if future is None:
+                future = dispatch_executor.submit(
+                    self.execute_tool_use,
+                    s3_client,
+                    self.format_tool_use(current),
+                    input_files,
+                    files,
+                    on_progress,
+                )
+
+            futures.append(future)
+
+        for future in futures:
+            self.tool_results.append(future.result())
+
+    def get_input_files(self, s3_client, files: list):
+        if self.input_files is not None:
+            return self.input_files
 
         input_files = []
-        for file_name in file_names:
+        for current in files:
             file = generate_presigned_get(
-                s3_client, self.user_id, self.session_id, file_name
+                s3_client, self.user_id, self.session_id, current["file_name"]
             )
+            file["checksum"] = current.get("checksum")
 
             input_files.append(file)
 
-        for current in tool_use:
-            tool_use_id = current["toolUseId"]
-            tool_name = current["name"]
-            input = current["input"]
-
-            output_file_names = input.get("output_files", [])
-            if type(output_file_names) != list:
-                if type(output_file_names) == str:
-                    try:
-                        output_file_names = json.loads(
-                            output_file_names.replace("'", '"')
-                        )
-                    except json.JSONDecodeError:
-                        output_file_names = [output_file_names]
-
-            output_files = []
-            for file_name in output_file_names:
-                file = generate_presigned_post(
-                    s3_client, self.user_id, self.session_id, file_name
-                )
+        self.input_files = input_files
 
-                output_files.append(file)
+        return input_files
 
-            response = self.provider.execute(
-                {
-                    "tool_use_id": tool_use_id,
-                    "name": tool_name,
-                    "input": input,
-                    "input_files": input_files,
-                    "output_files": output_files,
-                },
+    def execute_tool_use(
+        self, s3_client, current: dict, input_files: list, files: list, on_progress
+    ):
+        tool_use_id = current["toolUseId"]
+        tool_name = current["name"]
+        input = current["input"]
+
+        output_file_names = input.get("output_files", [])
+        if type(output_file_names) != list:
+            if type(output_file_names) == str:
+                try:
+                    output_file_names = json.loads(output_file_names.replace("'", '"'))
+                except json.JSONDecodeError:
+                    output_file_names = [output_file_names]
+
+        output_files = []
+        for file_name in output_file_names:
+            file = generate_presigned_post(
+                s3_client, self.user_id, self.session_id, file_name
             )
 
-            self.tool_results.append(
-                {
-                    "toolUseId": tool_use_id,
-                    "status": response["status"],
-                    "name": tool_name,
-                    "content": response.get("content"),
-                    "extra": response.get("extra", {}),
-                }
+            output_files.append(file)
+
+        payload = {
+            "session_id": self.session_id,
+            "tool_use_id": tool_use_id,
+            "name": tool_name,
+            "input": input,
+            "input_files": input_files,
+            "output_files": output_files,
+            "result_max_tokens": TOOL_RESULT_MAX_TOKENS,
+            "image_upload": generate_presigned_post_response_prefix(
+                s3_client, self.user_id, self.session_id
+            ),
+        }
+
+        result_cache = self.result_caches.get(tool_name)
+        cached = None
+
+        if result_cache:
+            cache_key = result_cache.key(self.user_id, self.session_id, payload, files)
+            cached = result_cache.get(cache_key)
+
+        if cached:
+            print(f"Using cached result for {tool_name}")
+            response = cached
+        else:
+            response = self.invoke(s3_client, payload, on_progress)
+
+            if result_cache:
+                result_cache.put(cache_key, response)
+
+        if result_cache:
+            metrics.increment(
+                "ToolCacheHits" if cached else "ToolCacheMisses",
+                dimensions={"Tool": tool_name},
             )
+            extra = response.get("extra", {})
+            response = {
+                **response,
+                "extra": {**extra, "cache": result_cache.stats(cached is not None)},
+            }
+
+        return {
+            "toolUseId": tool_use_id,
+            "status": response["status"],
+            "name": tool_name,
+            "content": response.get("content"),
+            "extra": response.get("extra", {}),
+        }
+
+    def invoke(self, s3_client, payload: dict, on_progress):
+        tool_name = payload["name"]
+        timeout = TOOL_TIMEOUTS.get(tool_name, TOOL_TIMEOUT)
+
+        try:
+            if on_progress and is_streaming_tool(tool_name):
+                return self.execute_streaming(s3_client, payload, on_progress, timeout)
+
+            future = tool_executor.submit(self.provider.execute, payload)
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            # The invocation keeps running in the background; only its result
+            # is dropped.
+            print(f"Tool {tool_name} timed out after {timeout} seconds")
+            metrics.increment("ToolTimeouts", dimensions={"Tool": tool_name})
+
+            return {
+                "status": "error",
+                "content": {
+                    "text": f"Tool {tool_name} timed out after {timeout} seconds."
+                },
+            }
+
+    def execute_streaming(
+        self, s3_client, payload: dict, on_progress, timeout: float = None
+    ):
+        tool_use_id = payload["tool_use_id"]
+        tool_name = payload["name"]
+        channel = create_stream_channel(
+            s3_client, self.user_id, self.session_id, tool_use_id
+        )
+        payload["stream"] = channel.target()
+
+        future = tool_executor.submit(self.provider.execute, payload)
+        deadline = time.monotonic() + timeout if timeout else None
+
+        try:
+            done = False
+            while not done:
+                if deadline and time.monotonic() > deadline:
+                    raise TimeoutError()
+
+                done = bool(wait([future], timeout=STREAM_POLL_INTERVAL).done)
+
+                try:
+                    records = channel.poll()
+                except Exception as e:
+                    print(f"Failed to read tool stream: {e}")
+                    records = []
+
+                if records and not done:
+                    on_progress(tool_use_id, tool_name, records)
+
+            return future.result()
+        finally:
+            try:
+                channel.close()
+            except Exception as e:
+                print(f"Failed to clean up tool stream: {e}")
 
     def get_assistant_messages(self):
-        if not self.text_accumulator and not self.tool_use:
+        text = self.get_text()
+        if not text and not self.tool_use:
             return []
 
         content = []
-        if self.text_accumulator:
-            content.append({"text": self.text_accumulator})
+        if text:
+            content.append({"text": text})
 
         tool_use = self.get_formatted_tool_use()
         values = [{"toolUse": current} for current in tool_use]
@@ -180,7 +395,7 @@ class ConverseToolExecutor:
                         "toolResult": {
                             "toolUseId": current["toolUseId"],
                             "status": current["status"],
-                            "content": [current["content"]],
+                            "content": [shape_tool_content(current["content"])],
                         }
                     }
                     for current in self.tool_results
@@ -191,23 +406,21 @@ class ConverseToolExecutor:
         return messages
 
     def get_formatted_tool_use(self):
-        tool_use = []
-
-        for current in self.tool_use.values():
-            input = current["input"]
-            if isinstance(input, str):
-                input = json.loads(input)
-            input = input or {}
-
-            tool_use.append(
-                {
-                    "toolUseId": current["toolUseId"],
-                    "name": current["name"],
-                    "input": input,
-                }
-            )
-
-        return tool_use
+        return [self.format_tool_use(current) for current in self.tool_use.values()]
+
+    def format_tool_use(self, current: dict):
+        input = current["input"]
+        if isinstance(input, list):
+            input = "".join(input)
+        if isinstance(input, str):
+            input = json.loads(input)
+        input = input or {}
+
+        return {
+            "toolUseId": current["toolUseId"],
+            "name": current["name"],
+            "input": input,
+        }
 
     def get_tool_results(self):
         return self.tool_results
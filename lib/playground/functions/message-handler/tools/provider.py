@@ -1,9 +1,39 @@
+import os
 import json
 import boto3
+import urllib.request
+from common import metrics
+
+TOOL_HTTP_TIMEOUT = float(os.environ.get("TOOL_HTTP_TIMEOUT", "900"))
 
 lambda_client = boto3.client("lambda")
 
 
+def invoke_lambda(function_name: str, payload: dict):
+    response = lambda_client.invoke(
+        FunctionName=function_name,
+        InvocationType="RequestResponse",
+        Payload=json.dumps(payload),
+    )
+
+    return json.load(response["Payload"])
+
+
+def invoke_http(url: str, payload: dict):
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+
+    with urllib.request.urlopen(request, timeout=TOOL_HTTP_TIMEOUT) as response:
+        return json.load(response)
+
+
+# Each tool maps to a Lambda function name or ARN, an http(s) endpoint that
+# accepts the payload as a JSON POST, or a Python callable that is invoked
+# in-process with the payload as is.
 class ToolProvider:
     def __init__(self, tools: dict = {}):
         self.tools = tools
@@ -14,29 +44,44 @@ class ToolProvider:
         else:
             return None
 
-    def execute(self, payload):
-        print(json.dumps(payload, indent=2))
+    def register(self, tool_name: str, target):
+        self.tools = {**self.tools, tool_name: target}
 
+    def execute(self, payload):
         tool_name = payload["name"]
-        tool_arn = self.get_tool_arn(tool_name)
-        if tool_arn is None:
+        tool_use_id = payload.get("tool_use_id")
+        target = self.get_tool_arn(tool_name)
+        if not target:
             return {
                 "status": "error",
-                "content": [{"text": f"Tool {tool_name} not found."}],
+                "content": {"text": f"Tool {tool_name} not found."},
             }
 
-        response = lambda_client.invoke(
-            FunctionName=tool_arn,
-            InvocationType="RequestResponse",
-            Payload=json.dumps(payload),
-        )
+        print(f"Executing tool {tool_name} ({tool_use_id})")
+        dimensions = {"Tool": tool_name}
 
-        response_payload = json.load(response["Payload"])
-
-        print(json.dumps(response_payload, indent=2))
+        with metrics.timer("ToolLatency", dimensions):
+            if callable(target):
+                response_payload = target(payload)
+            elif target.startswith(("http://", "https://")):
+                response_payload = invoke_http(target, payload)
+            else:
+                response_payload = invoke_lambda(target, payload)
 
         status = response_payload["status"]
         content = response_payload.get("content", {})
         extra = response_payload.get("extra", {})
 
+        print(f"Tool {tool_name} ({tool_use_id}) finished with status {status}")
+        if status == "error":
+            metrics.increment("ToolErrors", dimensions=dimensions)
+        # Tools may report the time spent in each phase of the execution.
+        for phase, elapsed in extra.get("timings", {}).items():
+            metrics.add(
+                "ToolPhaseTime",
+                elapsed,
+                metrics.MILLISECONDS,
+                {**dimensions, "Phase": phase},
+            )
+
         return {"status": status, "content": content, "extra": extra}
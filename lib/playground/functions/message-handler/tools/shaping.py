@@ -0,0 +1,28 @@
+import os
+from common.tokens import CHARS_PER_TOKEN, estimate_tokens
+
+TOOL_RESULT_MAX_TOKENS = int(os.environ.get("TOOL_RESULT_MAX_TOKENS", "8000"))
+
+
+def truncate_middle(text: str, max_chars: int):
+    if len(text) <= max_chars:
+        return text
+
+    head = max_chars * 2 // 3
+    tail = max_chars - head
+    omitted = len(text) - head - tail
+
+    return f"{text[:head]}\n... [{omitted} characters truncated] ...\n{text[-tail:]}"
+
+
+# Bounds the copy of a tool result that goes back to the model. The full
+# result stays in the tool results sent to the user interface.
+def shape_tool_content(content, max_tokens: int = TOOL_RESULT_MAX_TOKENS):
+    if not isinstance(content, dict):
+        return content
+
+    text = content.get("text")
+    if not isinstance(text, str) or estimate_tokens(text) <= max_tokens:
+        return content
+
+    return {**content, "text": truncate_middle(text, max_tokens * CHARS_PER_TOKEN)}
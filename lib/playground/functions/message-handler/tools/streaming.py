@@ -0,0 +1,122 @@
+import os
+import json
+import urllib.parse
+from common.files import generate_presigned_post_prefix
+
+UPLOAD_BUCKET_NAME = os.environ.get("UPLOAD_BUCKET_NAME")
+TOOL_STREAMING = os.environ.get("TOOL_STREAMING", "1")
+# Only these tools write stream records; the others are not polled.
+TOOL_STREAMING_TOOLS = [
+    name.strip()
+    for name in os.environ.get("TOOL_STREAMING_TOOLS", "code_interpreter").split(",")
+    if name.strip()
+]
+TOOL_STREAM_PATH = os.environ.get("TOOL_STREAM_PATH")
+MAX_RECORD_SIZE = 1000 * 1000  # 1Mb
+
+
+class S3StreamChannel:
+    def __init__(self, s3_client, prefix: str):
+        self.s3_client = s3_client
+        self.prefix = prefix
+        self.last_key = None
+        self.keys = []
+
+    def target(self):
+        response = generate_presigned_post_prefix(
+            self.s3_client, self.prefix, max_size=MAX_RECORD_SIZE
+        )
+
+        return {"url": response["url"], "fields": response["fields"]}
+
+    def list_keys(self):
+        params = {"Bucket": UPLOAD_BUCKET_NAME, "Prefix": self.prefix}
+        if self.last_key:
+            params["StartAfter"] = self.last_key
+
+        response = self.s3_client.list_objects_v2(**params)
+        return [item["Key"] for item in response.get("Contents", [])]
+
+    def poll(self):
+        records = []
+
+        for key in self.list_keys():
+            response = self.s3_client.get_object(Bucket=UPLOAD_BUCKET_NAME, Key=key)
+            records.append(json.loads(response["Body"].read()))
+            self.last_key = key
+            self.keys.append(key)
+
+        return records
+
+    # The channel is polled once more after the tool has returned, so every
+    # record it wrote has been read and only those keys are deleted.
+    def close(self):
+        if not self.keys:
+            return
+
+        self.s3_client.delete_objects(
+            Bucket=UPLOAD_BUCKET_NAME,
+            Delete={"Objects": [{"Key": key} for key in self.keys], "Quiet": True},
+        )
+
+
+class LocalStreamChannel:
+    def __init__(self, path: str):
+        self.path = path
+        self.last_name = ""
+
+    def target(self):
+        return {"path": self.path}
+
+    def poll(self):
+        records = []
+
+        if not os.path.isdir(self.path):
+            return records
+
+        names = sorted(
+            name
+            for name in os.listdir(self.path)
+            if name.endswith(".json") and not name.startswith(".")
+        )
+
+        for name in names:
+            if name <= self.last_name:
+                continue
+
+            with open(os.path.join(self.path, name), "rb") as f:
+                records.append(json.loads(f.read()))
+            self.last_name = name
+
+        return records
+
+    def close(self):
+        if not os.path.isdir(self.path):
+            return
+
+        for name in os.listdir(self.path):
+            os.remove(os.path.join(self.path, name))
+
+        os.rmdir(self.path)
+
+
+def is_streaming_tool(tool_name: str):
+    return TOOL_STREAMING == "1" and tool_name in TOOL_STREAMING_TOOLS
+
+
+def create_stream_channel(s3_client, user_id: str, session_id: str, tool_use_id: str):
+    tool_use_id = urllib.parse.quote(tool_use_id, safe="")
+
+    if TOOL_STREAM_PATH:
+        return LocalStreamChannel(
+            os.path.join(TOOL_STREAM_PATH, user_id, session_id, tool_use_id)
+        )
+
+    prefix = f"{user_id}/{session_id}/stream/{tool_use_id}/"
+    return S3StreamChannel(s3_client, prefix)
+
+
+def records_text(records: list):
+    return "".join(
+        output.get("text", "") for record in records for output in record["outputs"]
+    )
@@ -501,6 +501,34 @@ export class Playground extends Construct {
       autoDeploy: true,
     });
 
+    // Shared token buckets for the Bedrock request and token quotas.
+    let rateLimitTable: dynamodb.Table | undefined;
+    if (config.bedrockQuota) {
+      rateLimitTable = new dynamodb.Table(this, "RateLimitTable", {
+        partitionKey: {
+          name: "bucket",
+          type: dynamodb.AttributeType.STRING,
+        },
+        billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+        encryption: dynamodb.TableEncryption.AWS_MANAGED,
+        removalPolicy: cdk.RemovalPolicy.DESTROY,
+      });
+    }
+
+    let toolCacheTable: dynamodb.Table | undefined;
+    if (config.webSearchTool?.resultCache === "dynamodb") {
+      toolCacheTable = new dynamodb.Table(this, "ToolCacheTable", {
+        partitionKey: {
+          name: "cacheKey",
+          type: dynamodb.AttributeType.STRING,
+        },
+        timeToLiveAttribute: "expires",
+        billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+        encryption: dynamodb.TableEncryption.AWS_MANAGED,
+        removalPolicy: cdk.RemovalPolicy.DESTROY,
+      });
+    }
+
     const messageHandler = new lambdaPython.PythonFunction(
       this,
       "MessageHandler",
@@ -515,12 +543,25 @@ export class Playground extends Construct {
           WEBSOCKET_API_ENDPOINT: stage.callbackUrl,
           BEDROCK_REGION: bedrockRegion,
           BEDROCK_MODEL: bedrockModel,
+          BEDROCK_ENDPOINTS: JSON.stringify(config.bedrockEndpoints ?? []),
+          BEDROCK_LOW_PRIORITY_ENDPOINTS: JSON.stringify(
+            config.bedrockLowPriorityEndpoints ?? []
+          ),
           SESSION_TABLE_NAME: sessionTable.tableName,
           SESSION_BUCKET_NAME: sessionBucket.bucketName,
           UPLOAD_BUCKET_NAME: uploadBucket.bucketName,
           ARTIFACTS_ENABLED: config.artifacts?.enabled ? "1" : "0",
           TOOL_CODE_INTERPRETER: codeInterpreterTool?.functionArn ?? "",
+          CODE_INTERPRETER_STATEFUL: config.codeInterpreterTool?.stateful
+            ? "1"
+            : "0",
+          TOOL_RESULT_CACHE: config.codeInterpreterTool?.resultCache ?? "",
           TOOL_WEB_SEARCH: webSearchTool?.functionArn ?? "",
+          WEB_SEARCH_CACHE: config.webSearchTool?.resultCache ?? "",
+          TOOL_CACHE_TABLE_NAME: toolCacheTable?.tableName ?? "",
+          BEDROCK_RPM: `${config.bedrockQuota?.requestsPerMinute ?? 0}`,
+          BEDROCK_TPM: `${config.bedrockQuota?.tokensPerMinute ?? 0}`,
+          RATE_LIMIT_TABLE_NAME: rateLimitTable?.tableName ?? "",
         },
       }
     );
@@ -554,6 +595,8 @@ export class Playground extends Construct {
     codeInterpreterTool?.grantInvoke(messageHandler);
     webSearchTool?.grantInvoke(messageHandler);
     sessionTable.grantReadWriteData(messageHandler);
+    toolCacheTable?.grantReadWriteData(messageHandler);
+    rateLimitTable?.grantReadWriteData(messageHandler);
     sessionBucket.grantReadWrite(messageHandler);
     uploadBucket.grantReadWrite(messageHandler);
 
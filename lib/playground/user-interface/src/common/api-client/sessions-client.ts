@@ -8,6 +8,7 @@ export interface GetSessionData {
   exists: boolean;
   messages: ChatMessage[];
   files: FileItem[];
+  version?: number;
 }
 
 export interface ListSessionData {
@@ -54,4 +55,22 @@ export class SessionsApiClient extends ApiClientBase {
 
     return data;
   }
+
+  async getSessionBlob(sessionId: string, checksum: string): Promise<string> {
+    const headers = await this.getHeaders();
+    const restOperation = get({
+      apiName: API_NAME,
+      path: `/sessions/${sessionId}/blobs/${checksum}`,
+      options: {
+        headers,
+      },
+    });
+
+    const response = await restOperation.response;
+    const { data } = (await response.body.json()) as unknown as {
+      data: string;
+    };
+
+    return data;
+  }
 }
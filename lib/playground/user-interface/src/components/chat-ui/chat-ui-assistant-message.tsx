@@ -1,4 +1,4 @@
-import { Fragment } from "react";
+import { Fragment, useEffect, useRef, useState } from "react";
 import {
   Box,
   Button,
@@ -18,6 +18,7 @@ import {
   ToolStatus,
   ChatMessageContentText,
   ChatMessageContentArtifact,
+  BlobRef,
 } from "../../types";
 import styles from "../../styles/chat-ui.module.scss";
 import { ApiClient } from "../../common/api-client/api-client";
@@ -121,6 +122,14 @@ function ContentToolUse({
     window.open(result.data);
   };
 
+  const [responseExpanded, setResponseExpanded] = useState(false);
+  const responseText = useBlobValue(
+    sessionId,
+    content.extra.response_text,
+    responseExpanded,
+  );
+  const responseHtml = useBlobValue(sessionId, content.extra.response_html);
+
   return (
     <>
       <Flashbar
@@ -129,7 +138,9 @@ function ContentToolUse({
             id: "tool",
             type: toolStatusMapper(content.status),
             loading: content.status == ToolStatus.RUNNING,
-            content: content.tool_name,
+            content: content.extra.cache?.hit
+              ? `${content.tool_name} (cached result)`
+              : content.tool_name,
           },
         ]}
       />
@@ -140,9 +151,12 @@ function ContentToolUse({
           </div>
         </ExpandableSection>
       )}
-      <ExpandableSection headerText="Response">
+      <ExpandableSection
+        headerText="Response"
+        onChange={({ detail }) => setResponseExpanded(detail.expanded)}
+      >
         <div style={{ width: "100%", overflowX: "scroll" }}>
-          <pre>{content.extra.response_text ?? "Not available"}</pre>
+          <pre>{responseText ?? "Not available"}</pre>
         </div>
       </ExpandableSection>
       {content.extra.output_files && (
@@ -161,16 +175,89 @@ function ContentToolUse({
           </SpaceBetween>
         </div>
       )}
-      {content.extra.response_html && (
-        <div
-          dangerouslySetInnerHTML={{ __html: content.extra.response_html }}
-          className={styles.result_html}
-        />
+      {responseHtml && (
+        <ToolResponseHtml sessionId={sessionId} html={responseHtml} />
       )}
     </>
   );
 }
 
+// Resolves values stored as blob references, once enabled.
+function useBlobValue(
+  sessionId: string,
+  value: string | BlobRef | undefined,
+  enabled = true,
+) {
+  const checksum = typeof value === "object" ? value.__blob__ : undefined;
+  const [loaded, setLoaded] = useState<string | undefined>(undefined);
+
+  useEffect(() => {
+    if (!checksum || !enabled) return;
+
+    let cancelled = false;
+    const apiClient = new ApiClient();
+    apiClient.sessions
+      .getSessionBlob(sessionId, checksum)
+      .then((data) => {
+        if (!cancelled) setLoaded(data);
+      })
+      .catch((e) => console.error(e));
+
+    return () => {
+      cancelled = true;
+    };
+  }, [sessionId, checksum, enabled]);
+
+  return typeof value === "object" ? loaded : value;
+}
+
+function ToolResponseHtml({
+  sessionId,
+  html,
+}: {
+  sessionId: string;
+  html: string;
+}) {
+  const ref = useRef<HTMLDivElement>(null);
+
+  useEffect(() => {
+    if (!ref.current) return;
+
+    // Image outputs are stored as separate files and referenced by id.
+    const images = ref.current.querySelectorAll<HTMLImageElement>(
+      "img[data-file-id]:not([src])",
+    );
+    if (images.length === 0) return;
+
+    const apiClient = new ApiClient();
+    images.forEach(async (image) => {
+      const fileId = image.dataset.fileId;
+      const fileName = image.dataset.fileName;
+      if (!fileId || !fileName) return;
+
+      try {
+        const result = await apiClient.files.presignedFileDonwload(
+          sessionId,
+          fileId,
+          fileName,
+        );
+
+        image.src = result.data;
+      } catch (e) {
+        console.error(e);
+      }
+    });
+  }, [sessionId, html]);
+
+  return (
+    <div
+      ref={ref}
+      dangerouslySetInnerHTML={{ __html: html }}
+      className={styles.result_html}
+    />
+  );
+}
+
 function toolStatusMapper(status: ToolStatus): FlashbarProps.Type {
   switch (status) {
     case ToolStatus.RUNNING:
@@ -32,6 +32,7 @@ export default function Playground() {
   const [socketUrl, setSocketUrl] = useState<string | null>(null);
   const [running, setRunning] = useState(false);
   const [messages, setMessages] = useState<ChatMessage[]>([]);
+  const [sessionVersion, setSessionVersion] = useState(0);
   const [artifactIndex, setArtifactIndex] = useState(-1);
   const { sendJsonMessage, readyState } = useWebSocket(socketUrl, {
     share: true,
@@ -79,6 +80,10 @@ export default function Playground() {
 
         setRunning(false);
       } else if (data.event_type === InboundEventType.LOOP) {
+        // The session may still be saving; the next request waits for it.
+        const version = data.session_version ?? sessionVersion;
+        setSessionVersion(version);
+
         if (data.finish) {
           setRunning(false);
         } else {
@@ -86,6 +91,7 @@ export default function Playground() {
             session_id: sessionId,
             event_type: OutboundEventType.CONVERSE,
             files,
+            session_version: version,
           };
 
           console.log("Sending message", message_data);
@@ -141,9 +147,18 @@ export default function Playground() {
               toolUseContent.status = data.status;
               toolUseContent.extra ??= {};
               toolUseContent.extra.request_text ??= data.extra?.request_text;
-              toolUseContent.extra.response_text ??= data.extra?.response_text;
+              if (data.extra?.response_text_delta) {
+                const responseText = toolUseContent.extra.response_text;
+                toolUseContent.extra.response_text =
+                  (typeof responseText === "string" ? responseText : "") +
+                  data.extra.response_text_delta;
+              }
+              if (data.extra?.response_text !== undefined) {
+                toolUseContent.extra.response_text = data.extra.response_text;
+              }
               toolUseContent.extra.response_html ??= data.extra?.response_html;
               toolUseContent.extra.output_files ??= data.extra?.output_files;
+              toolUseContent.extra.cache ??= data.extra?.cache;
 
               break;
             }
@@ -158,9 +173,11 @@ export default function Playground() {
               status: data.status,
               extra: {
                 request_text: data.extra.request_text,
-                response_text: data.extra.response_text,
+                response_text:
+                  data.extra.response_text ?? data.extra.response_text_delta,
                 response_html: data.extra.response_html,
                 output_files: data.extra.output_files,
+                cache: data.extra.cache,
               },
             };
 
@@ -193,6 +210,7 @@ export default function Playground() {
       if (result.exists) {
         setFiles(result.files ?? []);
         setMessages(result.messages ?? []);
+        setSessionVersion(result.version ?? 0);
       }
 
       setLoading(false);
@@ -226,6 +244,7 @@ export default function Playground() {
       event_type: OutboundEventType.CONVERSE,
       message,
       files,
+      session_version: sessionVersion,
     };
 
     console.log("Sending message", message_data);
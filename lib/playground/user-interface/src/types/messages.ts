@@ -1,4 +1,4 @@
-import { ToolStatus } from "./payload";
+import { ToolResultCacheStats, ToolStatus } from "./payload";
 import { ArtifactType } from "./sandbox";
 
 export interface ChatMessage {
@@ -46,15 +46,22 @@ export interface ChatMessageContentToolUse {
   status: ToolStatus;
   extra: {
     request_text?: string;
-    response_text?: string;
-    response_html?: string;
+    response_text?: string | BlobRef;
+    response_html?: string | BlobRef;
     output_files?: {
       file_id: string;
       file_name: string;
     }[];
+    cache?: ToolResultCacheStats;
   };
 }
 
+// Large tool payloads of stored sessions are loaded separately by checksum.
+export interface BlobRef {
+  __blob__: string;
+  size: number;
+}
+
 export interface ChatMessageContentArtifact {
   kind: ChatMessageContentType.Artifact;
   index: number;
@@ -47,6 +47,7 @@ export interface InboutPayloadLoop {
   event_type: InboundEventType.LOOP;
   sequence_idx: number;
   finish: boolean;
+  session_version?: number;
 }
 
 export interface InboutPayloadTextChunk {
@@ -55,6 +56,14 @@ export interface InboutPayloadTextChunk {
   text: string;
 }
 
+// Result cache statistics of tools with a result cache.
+export interface ToolResultCacheStats {
+  hit: boolean;
+  hits: number;
+  requests: number;
+  hit_rate: number;
+}
+
 export interface InboutPayloadToolUse {
   event_type: InboundEventType.TOOL_USE;
   sequence_idx: number;
@@ -64,10 +73,12 @@ export interface InboutPayloadToolUse {
   extra: {
     request_text?: string;
     response_text?: string;
+    response_text_delta?: string;
     response_html?: string;
     output_files?: {
       file_id: string;
       file_name: string;
     }[];
+    cache?: ToolResultCacheStats;
   };
 }
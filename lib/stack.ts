@@ -128,6 +128,13 @@ export class ArtifactsAndToolsStack extends cdk.Stack {
             subnetType: ec2.SubnetType.PRIVATE_ISOLATED,
           },
           role: codeInterpreterRole,
+          environment: {
+            EXECUTION_MODE:
+              props.config.codeInterpreterTool?.executionMode ?? "kernel",
+            STATEFUL_SESSIONS: props.config.codeInterpreterTool?.stateful
+              ? "1"
+              : "0",
+          },
         }
       );
 
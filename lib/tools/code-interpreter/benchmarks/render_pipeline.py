@@ -0,0 +1,165 @@
+"""
+Compares the legacy three-subprocess nbconvert pipeline with the warm kernel
+and in-process rendering used by the handler.
+
+Usage: python benchmarks/render_pipeline.py [--runs N]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import statistics
+import nbformat
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from index import COMMON_CODE  # noqa: E402
+from kernel import KernelPool  # noqa: E402
+from render import render_notebook  # noqa: E402
+
+NOTEBOOKS = {
+    "print": """for i in range(20):
+    print(f"Line {i}")""",
+    "dataframe": """import numpy as np
+df = pd.DataFrame(np.random.rand(200, 8), columns=list("abcdefgh"))
+df.describe()""",
+    "plot": """import numpy as np
+x = np.linspace(0, 10, 500)
+plt.plot(x, np.sin(x))
+plt.title("sin(x)")
+plt.show()""",
+    "mixed": """import numpy as np
+df = pd.DataFrame({"x": np.arange(100), "y": np.random.randn(100).cumsum()})
+print(df.head())
+df.plot(x="x", y="y")
+plt.show()
+df.tail()""",
+}
+
+
+def build_notebook(code):
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_code_cell(COMMON_CODE))
+    nb.cells.append(nbformat.v4.new_code_cell(code))
+
+    return nb
+
+
+def run_subprocess(args, cwd):
+    result = subprocess.run(
+        args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+
+    if result.returncode != 0:
+        raise Exception(result.stderr)
+
+
+def legacy_pipeline(code, work_path):
+    code_path = os.path.join(work_path, "notebook.ipynb")
+    html_path = os.path.join(work_path, "notebook.html")
+    asciidoc_path = os.path.join(work_path, "notebook.asciidoc")
+
+    with open(code_path, "w") as f:
+        nbformat.write(build_notebook(code), f)
+
+    run_subprocess(
+        [
+            "jupyter",
+            "nbconvert",
+            "--execute",
+            "--to",
+            "notebook",
+            "--output",
+            code_path,
+            code_path,
+        ],
+        work_path,
+    )
+    run_subprocess(
+        [
+            "jupyter",
+            "nbconvert",
+            "--no-input",
+            "--template",
+            "basic",
+            "--to",
+            "html",
+            "--output",
+            html_path,
+            code_path,
+        ],
+        work_path,
+    )
+    run_subprocess(
+        [
+            "jupyter",
+            "nbconvert",
+            "--no-input",
+            "--to",
+            "asciidoc",
+            "--output",
+            asciidoc_path,
+            code_path,
+        ],
+        work_path,
+    )
+
+
+def in_process_pipeline(pool, code, work_path):
+    nb = build_notebook(code)
+    kernel = pool.acquire()
+
+    try:
+        kernel.reset(work_path, work_path)
+        kernel.execute_notebook(nb)
+    finally:
+        pool.release(kernel)
+
+    render_notebook(nb)
+
+
+def measure(fn, runs):
+    samples = []
+    for _ in range(runs):
+        work_path = tempfile.mkdtemp()
+        try:
+            start = time.perf_counter()
+            fn(work_path)
+            samples.append((time.perf_counter() - start) * 1000)
+        finally:
+            shutil.rmtree(work_path)
+
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    pool = KernelPool()
+    # Start the kernel and import the common libraries once, as a warm
+    # container would have done on a previous invocation.
+    measure(lambda path: in_process_pipeline(pool, "1", path), 1)
+
+    print(f"{'notebook':<12}{'legacy ms':>12}{'in-process ms':>16}{'speedup':>10}")
+    for name, code in NOTEBOOKS.items():
+        legacy = measure(lambda path: legacy_pipeline(code, path), args.runs)
+        current = measure(lambda path: in_process_pipeline(pool, code, path), args.runs)
+
+        legacy_ms = statistics.median(legacy)
+        current_ms = statistics.median(current)
+        print(
+            f"{name:<12}{legacy_ms:>12.1f}{current_ms:>16.1f}{legacy_ms / current_ms:>9.1f}x"
+        )
+
+    for kernel in pool.idle:
+        kernel.shutdown()
+
+
+if __name__ == "__main__":
+    main()
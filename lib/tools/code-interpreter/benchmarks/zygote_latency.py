@@ -0,0 +1,108 @@
+"""
+Cold-vs-warm latency of a short code-interpreter execution that imports the
+scientific stack.
+
+  cold          a new kernel per execution, as every call used to start one
+  warm-kernel   the pooled kernel reused across executions (EXECUTION_MODE=kernel)
+  fork          the preloaded fork server (EXECUTION_MODE=fork)
+
+Usage: python benchmarks/zygote_latency.py [--runs N]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import nbformat
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from index import COMMON_CODE  # noqa: E402
+from kernel import KernelPool, WarmKernel  # noqa: E402
+from zygote import ForkServer  # noqa: E402
+
+CODE = """import numpy as np
+import seaborn as sns
+import cv2
+from sklearn.linear_model import LinearRegression
+x = np.arange(100).reshape(-1, 1)
+model = LinearRegression().fit(x, 2 * x.ravel() + 1)
+print(model.coef_, cv2.__version__, sns.__version__)"""
+
+
+def build_notebook():
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_code_cell(COMMON_CODE))
+    nb.cells.append(nbformat.v4.new_code_cell(CODE))
+
+    return nb
+
+
+def run_once(pool, work_path):
+    kernel = pool.acquire()
+
+    try:
+        kernel.reset(work_path, work_path)
+        kernel.execute_notebook(build_notebook())
+    finally:
+        pool.release(kernel)
+
+
+def run_cold(work_path):
+    kernel = WarmKernel()
+
+    try:
+        kernel.reset(work_path, work_path)
+        kernel.execute_notebook(build_notebook())
+    finally:
+        kernel.shutdown()
+
+
+def measure(fn, runs):
+    samples = []
+    for _ in range(runs):
+        work_path = tempfile.mkdtemp()
+        try:
+            start = time.perf_counter()
+            fn(work_path)
+            samples.append((time.perf_counter() - start) * 1000)
+        finally:
+            shutil.rmtree(work_path)
+
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    kernel_pool = KernelPool()
+    fork_server = ForkServer()
+
+    # Pay the one-off container start cost before measuring the warm paths.
+    measure(lambda path: run_once(kernel_pool, path), 1)
+    measure(lambda path: run_once(fork_server, path), 1)
+
+    results = {
+        "cold": measure(run_cold, args.runs),
+        "warm-kernel": measure(lambda path: run_once(kernel_pool, path), args.runs),
+        "fork": measure(lambda path: run_once(fork_server, path), args.runs),
+    }
+
+    print(f"{'mode':<14}{'median ms':>12}{'min ms':>10}{'max ms':>10}")
+    for name, samples in results.items():
+        print(
+            f"{name:<14}{statistics.median(samples):>12.1f}"
+            f"{min(samples):>10.1f}{max(samples):>10.1f}"
+        )
+
+    for kernel in kernel_pool.idle:
+        kernel.shutdown()
+
+
+if __name__ == "__main__":
+    main()
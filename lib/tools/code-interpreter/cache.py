@@ -0,0 +1,118 @@
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+
+INPUT_CACHE_PATH = os.environ.get("INPUT_CACHE_PATH", "/tmp/input-cache")
+INPUT_CACHE_MAX_BYTES = int(
+    os.environ.get("INPUT_CACHE_MAX_BYTES", str(256 * 1000 * 1000))
+)
+
+CHECKSUM_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def clone_file(src_path: str, dst_path: str):
+    # copy_file_range shares extents on filesystems that support reflinks and
+    # copies in-kernel everywhere else.
+    with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+        try:
+            while os.copy_file_range(src.fileno(), dst.fileno(), 1 << 30):
+                pass
+        except OSError:
+            src.seek(0)
+            dst.seek(0)
+            dst.truncate()
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+
+
+class FileCache:
+    # Content-addressed by the SHA-256 checksum tracked for every session file,
+    # with least-recently-used eviction under a size cap.
+    def __init__(
+        self, path: str = INPUT_CACHE_PATH, max_bytes: int = INPUT_CACHE_MAX_BYTES
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(self.path, exist_ok=True)
+        self.load()
+
+    def load(self):
+        files = []
+        for name in os.listdir(self.path):
+            file_path = os.path.join(self.path, name)
+
+            if not CHECKSUM_PATTERN.match(name):
+                os.remove(file_path)
+                continue
+
+            stat = os.stat(file_path)
+            files.append((stat.st_atime, name, stat.st_size))
+
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.total_bytes += size
+
+    def cacheable(self, checksum: str):
+        return bool(checksum) and CHECKSUM_PATTERN.match(checksum) is not None
+
+    def entry_path(self, checksum: str):
+        return os.path.join(self.path, checksum)
+
+    def get(self, checksum: str, dst_path: str):
+        if not self.cacheable(checksum):
+            return None
+
+        with self.lock:
+            size = self.entries.get(checksum)
+            if size is None:
+                return None
+
+            self.entries.move_to_end(checksum)
+
+        try:
+            clone_file(self.entry_path(checksum), dst_path)
+        except FileNotFoundError:
+            with self.lock:
+                if self.entries.pop(checksum, None) is not None:
+                    self.total_bytes -= size
+
+            return None
+
+        return size
+
+    def put(self, checksum: str, src_path: str):
+        if not self.cacheable(checksum):
+            return
+
+        size = os.path.getsize(src_path)
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            if checksum in self.entries:
+                return
+
+        tmp_path = f"{self.entry_path(checksum)}.{threading.get_ident()}.tmp"
+        clone_file(src_path, tmp_path)
+        os.replace(tmp_path, self.entry_path(checksum))
+
+        with self.lock:
+            if checksum in self.entries:
+                return
+
+            self.entries[checksum] = size
+            self.total_bytes += size
+
+            while self.total_bytes > self.max_bytes:
+                evicted, evicted_size = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+                try:
+                    os.remove(self.entry_path(evicted))
+                except FileNotFoundError:
+                    pass
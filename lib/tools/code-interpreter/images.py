@@ -0,0 +1,132 @@
+import io
+import os
+import copy
+import html
+import base64
+from PIL import Image
+from transfer import http_session, transfer_executor, TRANSFER_TIMEOUT
+
+IMAGE_FORMAT = os.environ.get("IMAGE_FORMAT", "webp")
+IMAGE_QUALITY = int(os.environ.get("IMAGE_QUALITY", "85"))
+IMAGE_MAX_DIMENSION = int(os.environ.get("IMAGE_MAX_DIMENSION", "2048"))
+
+EXTRACTED_MIME_TYPES = ("image/png", "image/jpeg")
+
+
+def encode_image(data: bytes, mime_type: str):
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception as e:
+        print(f"Failed to decode {mime_type} output: {e}")
+        return data, mime_type.split("/")[-1]
+
+    resized = max(image.size) > IMAGE_MAX_DIMENSION
+    if resized:
+        image.thumbnail((IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION))
+
+    buffer = io.BytesIO()
+    if IMAGE_FORMAT == "webp":
+        image.save(buffer, format="WEBP", quality=IMAGE_QUALITY, method=4)
+    else:
+        if image.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+            image = image.convert("RGBA")
+        image.save(buffer, format="PNG", optimize=True)
+
+    encoded = buffer.getvalue()
+    if not resized and len(encoded) >= len(data):
+        return data, mime_type.split("/")[-1]
+
+    return encoded, IMAGE_FORMAT
+
+
+def upload_image(target: dict, file_name: str, data: bytes):
+    response = http_session.post(
+        target["url"],
+        data=target["fields"],
+        files={"file": (file_name, data, "application/octet-stream")},
+        timeout=TRANSFER_TIMEOUT,
+    )
+
+    if response.status_code != 204:
+        print(f"Failed to upload {file_name}, status code: {response.status_code}")
+        return False
+
+    return True
+
+
+# Moves image outputs out of the notebook rendered to HTML. Each image is
+# re-encoded, uploaded under the target's key prefix and replaced with an
+# <img> tag that the user interface resolves through the files API. Images
+# that cannot be uploaded stay inline.
+class ImageExtractor:
+    def __init__(self, target: dict):
+        self.target = target
+        self.images = []
+
+    @staticmethod
+    def create(target: dict):
+        if not target:
+            return None
+
+        return ImageExtractor(target)
+
+    def extract(self, nb):
+        extracted = copy.deepcopy(nb)
+        uploads = []
+
+        for cell in extracted.cells:
+            for output in cell.get("outputs", []):
+                data = output.get("data")
+                if not data or "text/html" in data:
+                    continue
+
+                mime_type = next(
+                    (value for value in EXTRACTED_MIME_TYPES if value in data), None
+                )
+                if mime_type is None:
+                    continue
+
+                image_data = data[mime_type]
+                if isinstance(image_data, list):
+                    image_data = "".join(image_data)
+
+                file_name = f"output-{len(uploads) + 1}"
+                future = transfer_executor.submit(
+                    self.upload, file_name, base64.b64decode(image_data), mime_type
+                )
+                uploads.append((data, mime_type, future))
+
+        for data, mime_type, future in uploads:
+            file_name = future.result()
+            if not file_name:
+                continue
+
+            alt = data.get("text/plain", "")
+            if isinstance(alt, list):
+                alt = "".join(alt)
+
+            del data[mime_type]
+            data["text/html"] = (
+                f'<img data-file-id="{html.escape(self.target["file_id"])}" '
+                f'data-file-name="{html.escape(file_name)}" '
+                f'alt="{html.escape(alt)}" />'
+            )
+
+            self.images.append(
+                {"file_id": self.target["file_id"], "file_name": file_name}
+            )
+
+        return extracted
+
+    def upload(self, file_name: str, data: bytes, mime_type: str):
+        encoded, extension = encode_image(data, mime_type)
+        file_name = f"{file_name}.{extension}"
+
+        try:
+            if upload_image(self.target, file_name, encoded):
+                return file_name
+        except Exception as e:
+            print(f"Failed to upload {file_name}: {e}")
+
+        return None
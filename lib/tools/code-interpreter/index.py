@@ -1,14 +1,31 @@
 import os
+import time
 import uuid
-import requests
 import nbformat
-import subprocess
 import shutil
+from kernel import KernelPool, SessionKernels, CellExecutionError
+from render import render_notebook
+from zygote import ForkServer
+from transfer import start_downloads, OutputUploader
+from stream import ResultStream
+from images import ImageExtractor
+from shaping import RESULT_MAX_TOKENS, enforce_budget
+
+EXECUTION_MODE = os.environ.get("EXECUTION_MODE", "kernel")
+STATEFUL_SESSIONS = os.environ.get("STATEFUL_SESSIONS") == "1"
 
 COMMON_CODE = """%matplotlib inline
 import pandas as pd
 import matplotlib.pyplot as plt"""
 
+NEW_SESSION_NOTE = (
+    "Note: this execution started a new kernel session. "
+    "Variables from previous executions are not available.\n\n"
+)
+
+kernel_pool = ForkServer() if EXECUTION_MODE == "fork" else KernelPool()
+session_kernels = SessionKernels()
+
 
 def handler(event, context):
     print("Running the code in a Jupyter notebook...")
@@ -18,182 +35,141 @@ def handler(event, context):
     code = input.get("code")
     input_files = event.get("input_files", [])
     output_files = event.get("output_files", [])
+    max_tokens = event.get("result_max_tokens") or RESULT_MAX_TOKENS
 
     if code is None:
         return {"status": "error", "content": {"text": "No code provided."}}
 
-    base_name = str(uuid.uuid4())
-    base_path = f"/tmp/{base_name}"
+    session_id = event.get("session_id")
+    stateful = STATEFUL_SESSIONS and session_kernels.accepts(session_id)
+    session = None
+    resumed = False
+
+    if stateful:
+        session = session_kernels.open(session_id)
+        base_path = session.base_path
+    else:
+        base_path = f"/tmp/{uuid.uuid4()}"
+
     home_path = os.path.join(base_path, "home")
     notebooks_path = os.path.join(base_path, "notebooks")
-    matplotlib_path = os.path.join(home_path, ".matplotlib")
-    code_path = os.path.join(notebooks_path, f"{base_name}.ipynb")
-    html_output_path = os.path.join(notebooks_path, f"{base_name}.html")
-    asciidoc_output_path = os.path.join(notebooks_path, f"{base_name}.asciidoc")
 
     os.makedirs(base_path, exist_ok=True)
     os.makedirs(home_path, exist_ok=True)
     os.makedirs(notebooks_path, exist_ok=True)
 
-    env = os.environ.copy()
-    env["MPLCONFIGDIR"] = matplotlib_path
-    env["HOME"] = home_path
+    timings = {}
+    kernel = None
+    kernel_healthy = False
+    downloads = None
+    uploader = None
+    stream = ResultStream.create(event.get("stream"))
+    images = ImageExtractor.create(event.get("image_upload"))
 
     try:
         nb = nbformat.v4.new_notebook()
         nb.cells.append(nbformat.v4.new_code_cell(COMMON_CODE))
         nb.cells.append(nbformat.v4.new_code_cell(code))
 
-        download_files(notebooks_path, input_files)
-
-        with open(code_path, "w") as f:
-            nbformat.write(nb, f)
-
-        result = subprocess.run(
-            [
-                "jupyter",
-                "nbconvert",
-                "--execute",
-                "--to",
-                "notebook",
-                "--output",
-                code_path,
-                code_path,
-            ],
-            env=env,
-            cwd=notebooks_path,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-
-        if result.returncode != 0:
-            raise Exception(result.stderr)
-
-        result_html = subprocess.run(
-            [
-                "jupyter",
-                "nbconvert",
-                "--no-input",
-                "--template",
-                "basic",
-                "--to",
-                "html",
-                "--output",
-                html_output_path,
-                code_path,
-            ],
-            env=env,
-            cwd=notebooks_path,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-
-        if result_html.returncode != 0:
-            raise Exception(result_html.stderr)
-
-        result_asciidoc = subprocess.run(
-            [
-                "jupyter",
-                "nbconvert",
-                "--no-input",
-                "--to",
-                "asciidoc",
-                "--output",
-                asciidoc_output_path,
-                code_path,
-            ],
-            env=env,
-            cwd=notebooks_path,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-
-        if result_asciidoc.returncode != 0:
-            raise Exception(result_asciidoc.stderr)
-
-        html_output = ""
-        with open(html_output_path, "r") as f:
-            html_output = f.read()
-
-        asciidoc_output = ""
-        with open(asciidoc_output_path, "r") as f:
-            asciidoc_output = f.read()
+        # Input files are staged while the kernel is acquired and reset.
+        downloads = start_downloads(notebooks_path, input_files)
 
-        print(asciidoc_output)
+        with Timer(timings, "kernel_acquire_ms"):
+            if stateful:
+                kernel, resumed = session.acquire()
+                kernel.reset(notebooks_path, home_path, clear_namespace=not resumed)
+            else:
+                kernel = kernel_pool.acquire()
+                kernel.reset(notebooks_path, home_path)
 
-        files_result = upload_files(output_files, notebooks_path)
-        content_text = "Execution result in AsciiDoc format:\n" + asciidoc_output
+        with Timer(timings, "download_wait_ms"):
+            download_stats = downloads.wait()
 
-        return {
-            "status": "success",
-            "content": {"text": content_text},
-            "extra": {"html": html_output, "output_files": files_result},
-        }
-    except Exception as e:
-        print(e)
-        error_text = str(e)
+        print(f"Input files: {download_stats}")
 
-        return {"status": "error", "content": {"text": error_text}}
-    finally:
-        shutil.rmtree(base_path)
+        uploader = OutputUploader(notebooks_path, output_files)
 
+        with Timer(timings, "execute_ms"):
+            try:
+                kernel.execute_notebook(nb, stream)
+            except CellExecutionError:
+                kernel_healthy = True
+                raise
 
-def download_files(files_path, input_files):
-    for file in input_files:
-        file_name = file["file_name"]
-        file_url = file["url"]
+            kernel_healthy = True
 
-        file_path = os.path.join(files_path, file_name)
+        # Outputs not uploaded during the execution go out while rendering.
+        uploader.flush()
 
-        response = requests.get(file_url)
-        response.raise_for_status()
+        with Timer(timings, "render_ms"):
+            html_output, asciidoc_output = render_notebook(nb, max_tokens, images)
 
-        with open(file_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:  # Filter out keep-alive new chunks
-                    f.write(chunk)
+        with Timer(timings, "upload_wait_ms"):
+            files_result = uploader.results()
 
-        print(f"Downloaded {file_name} successfully.")
+        print(asciidoc_output)
+        print(f"Timings: {timings}")
 
+        content_text = "Execution result in AsciiDoc format:\n" + asciidoc_output
+        extra = {
+            "html": html_output,
+            "output_files": files_result,
+            "timings": timings,
+        }
 
-def upload_files(output_files, base_path):
-    ret_value = []
+        if images is not None:
+            extra["images"] = images.images
 
-    print("Uploading output files...")
-    print(f"Base path: {base_path}")
-    print(f"Output files: {output_files}")
+        if stateful:
+            extra["session_state"] = "resumed" if resumed else "new"
+            if not resumed:
+                content_text = NEW_SESSION_NOTE + content_text
 
-    for file_info in output_files:
-        file_name = file_info["file_name"]
-        file_id = file_info["file_id"]
-        file_path = os.path.join(base_path, file_name)
+        return {
+            "status": "success",
+            "content": {"text": content_text},
+            "extra": extra,
+        }
+    except Exception as e:
+        print(e)
+        error_text = enforce_budget(str(e), max_tokens)
 
-        if not os.path.exists(file_path):
-            print(f"File {file_name} does not exist.")
-            continue
+        if stateful and not resumed:
+            error_text = NEW_SESSION_NOTE + error_text
 
-        print(f"Uploading {file_name}")
+        return {
+            "status": "error",
+            "content": {"text": error_text},
+            "extra": {"timings": timings},
+        }
+    finally:
+        if downloads is not None:
+            downloads.cancel()
 
-        url = file_info["url"]
-        fields = file_info["fields"]
+        if uploader is not None:
+            uploader.stop()
 
-        with open(file_path, "rb") as f:
-            files = {"file": (file_name, f)}
-            response = requests.post(url, data=fields, files=files)
+        if stream is not None:
+            stream.close()
 
-            if response.status_code == 204:
-                print(f"Successfully uploaded {file_name}")
+        if stateful:
+            session_kernels.release(session, healthy=kernel_healthy)
+        else:
+            if kernel is not None:
+                kernel_pool.release(kernel, healthy=kernel_healthy)
 
-                ret_value.append(
-                    {"file_id": file_id, "file_name": file_name, "url": url}
-                )
+            shutil.rmtree(base_path, ignore_errors=True)
 
-            else:
-                print(
-                    f"Failed to upload {file_name}, status code: {response.status_code}"
-                )
 
-    return ret_value
+class Timer:
+    def __init__(self, timings: dict, name: str):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        elapsed = (time.perf_counter() - self.start) * 1000
+        self.timings[self.name] = round(elapsed, 1)
@@ -0,0 +1,345 @@
+import os
+import re
+import time
+import queue
+import shutil
+import nbformat
+from collections import OrderedDict
+from jupyter_client.manager import KernelManager
+
+KERNEL_NAME = "python3"
+KERNEL_HOME = "/tmp/kernel-home"
+KERNEL_STARTUP_TIMEOUT = 60
+EXECUTION_TIMEOUT = int(os.environ.get("EXECUTION_TIMEOUT", "600"))
+# How often a waiting execution checks that the kernel process is still alive.
+KERNEL_POLL_INTERVAL = 1.0
+KERNEL_POOL_SIZE = int(os.environ.get("KERNEL_POOL_SIZE", "1"))
+PRELOAD_MODULES = [
+    name.strip()
+    for name in os.environ.get(
+        "PRELOAD_MODULES",
+        "numpy,pandas,matplotlib.pyplot,seaborn,scipy,sklearn,cv2",
+    ).split(",")
+    if name.strip()
+]
+
+SESSIONS_PATH = "/tmp/sessions"
+SESSION_KERNEL_IDLE_TIMEOUT = int(os.environ.get("SESSION_KERNEL_IDLE_TIMEOUT", "900"))
+FUNCTION_MEMORY_MB = int(os.environ.get("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", "2048"))
+# Kept for the handler process and the pooled kernel of stateless executions.
+RESERVED_MEMORY_MB = int(os.environ.get("RESERVED_MEMORY_MB", "640"))
+SESSION_KERNELS_MEMORY_MB = max(FUNCTION_MEMORY_MB - RESERVED_MEMORY_MB, 256)
+SESSION_KERNEL_MAX_COUNT = int(os.environ.get("SESSION_KERNEL_MAX_COUNT", "2"))
+SESSION_KERNEL_MAX_MEMORY_MB = int(
+    os.environ.get(
+        "SESSION_KERNEL_MAX_MEMORY_MB",
+        str(SESSION_KERNELS_MEMORY_MB // SESSION_KERNEL_MAX_COUNT),
+    )
+)
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9-]{1,64}$")
+
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+
+RESET_CODE = """%reset -f
+import matplotlib.pyplot as __plt
+__plt.close("all")
+del __plt"""
+
+ENTER_CODE = """import os as __os
+__os.environ["HOME"] = {home_path!r}
+__os.environ["MPLCONFIGDIR"] = {matplotlib_path!r}
+__os.chdir({cwd!r})
+del __os"""
+
+PRELOAD_CODE = """import importlib as __importlib
+for __name in {modules!r}:
+    try:
+        __importlib.import_module(__name)
+    except Exception as __e:
+        print(f"Failed to preload {{__name}}: {{__e}}")
+del __importlib, __name"""
+
+
+class CellExecutionError(Exception):
+    def __init__(self, ename, evalue, traceback):
+        self.ename = ename
+        self.evalue = evalue
+        self.traceback = traceback
+
+        super().__init__(ANSI_ESCAPE.sub("", "\n".join(traceback)))
+
+
+class KernelTimeoutError(Exception):
+    pass
+
+
+class KernelDiedError(Exception):
+    pass
+
+
+def enter_code(cwd: str, home_path: str):
+    matplotlib_path = os.path.join(home_path, ".matplotlib")
+
+    return ENTER_CODE.format(
+        home_path=home_path, matplotlib_path=matplotlib_path, cwd=cwd
+    )
+
+
+def check_outputs(outputs):
+    for output in outputs:
+        if output["output_type"] == "error":
+            raise CellExecutionError(
+                output["ename"], output["evalue"], output["traceback"]
+            )
+
+
+class WarmKernel:
+    def __init__(self):
+        os.makedirs(KERNEL_HOME, exist_ok=True)
+
+        env = os.environ.copy()
+        env["HOME"] = KERNEL_HOME
+        env["MPLCONFIGDIR"] = os.path.join(KERNEL_HOME, ".matplotlib")
+
+        self.manager = KernelManager(kernel_name=KERNEL_NAME)
+        self.manager.start_kernel(env=env, cwd=KERNEL_HOME)
+        self.client = self.manager.client()
+        self.client.start_channels()
+        self.client.wait_for_ready(timeout=KERNEL_STARTUP_TIMEOUT)
+        self.executions = 0
+
+        if PRELOAD_MODULES:
+            self.run(PRELOAD_CODE.format(modules=PRELOAD_MODULES))
+
+    def is_alive(self):
+        return self.manager.is_alive()
+
+    def reset(self, cwd: str, home_path: str, clear_namespace: bool = True):
+        code = enter_code(cwd, home_path)
+
+        if clear_namespace:
+            code = f"{RESET_CODE}\n{code}"
+
+        check_outputs(self.run(code))
+
+    # Moves the kernel back to its own home, so the run directory can be
+    # removed while the kernel waits in the pool.
+    def leave(self):
+        check_outputs(self.run(enter_code(KERNEL_HOME, KERNEL_HOME)))
+
+    def memory_mb(self):
+        pid = getattr(self.manager.provisioner, "pid", None)
+        if pid is None:
+            return 0
+
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except FileNotFoundError:
+            pass
+
+        return 0
+
+    def run(self, code: str, stream=None):
+        msg_id = self.client.execute(code, store_history=False, allow_stdin=False)
+        deadline = time.monotonic() + EXECUTION_TIMEOUT
+        outputs = []
+
+        while True:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                self.manager.interrupt_kernel()
+                raise KernelTimeoutError(
+                    f"Code execution timed out after {EXECUTION_TIMEOUT} seconds."
+                )
+
+            try:
+                msg = self.client.get_iopub_msg(
+                    timeout=min(timeout, KERNEL_POLL_INTERVAL)
+                )
+            except queue.Empty:
+                if not self.manager.is_alive():
+                    raise KernelDiedError("The kernel died during code execution.")
+
+                continue
+
+            if msg["parent_header"].get("msg_id") != msg_id:
+                continue
+
+            msg_type = msg["msg_type"]
+            content = msg["content"]
+
+            if msg_type == "status":
+                if content["execution_state"] == "idle":
+                    break
+            elif msg_type == "clear_output":
+                outputs.clear()
+            elif msg_type == "stream":
+                if stream is not None:
+                    stream.write(content | {"output_type": "stream"})
+
+                if (
+                    outputs
+                    and outputs[-1]["output_type"] == "stream"
+                    and outputs[-1]["name"] == content["name"]
+                ):
+                    outputs[-1]["text"] += content["text"]
+                else:
+                    outputs.append(nbformat.v4.output_from_msg(msg))
+            elif msg_type in ("display_data", "execute_result", "error"):
+                output = nbformat.v4.output_from_msg(msg)
+                outputs.append(output)
+
+                if stream is not None:
+                    stream.write(output)
+
+        return outputs
+
+    def execute_notebook(self, nb, stream=None):
+        self.executions += 1
+
+        for cell in nb.cells:
+            if cell.cell_type != "code":
+                continue
+
+            cell.outputs = self.run(cell.source, stream)
+            check_outputs(cell.outputs)
+
+    def shutdown(self):
+        try:
+            self.client.stop_channels()
+            self.manager.shutdown_kernel(now=True)
+        except Exception as e:
+            print(f"Failed to shut down kernel: {e}")
+
+
+class KernelPool:
+    def __init__(self, size: int = KERNEL_POOL_SIZE):
+        self.size = size
+        self.idle = []
+
+    def acquire(self):
+        while self.idle:
+            kernel = self.idle.pop()
+            if kernel.is_alive():
+                return kernel
+
+            kernel.shutdown()
+
+        return WarmKernel()
+
+    def release(self, kernel: WarmKernel, healthy: bool = True):
+        if healthy and kernel.is_alive() and len(self.idle) < self.size:
+            try:
+                kernel.leave()
+            except Exception as e:
+                print(f"Failed to release kernel: {e}")
+                kernel.shutdown()
+                return
+
+            self.idle.append(kernel)
+        else:
+            kernel.shutdown()
+
+
+class SessionKernel:
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.base_path = os.path.join(SESSIONS_PATH, session_id)
+        self.kernel = None
+        self.last_used = time.monotonic()
+
+        shutil.rmtree(self.base_path, ignore_errors=True)
+        os.makedirs(self.base_path)
+
+    def acquire(self):
+        resumed = self.kernel is not None
+        if not resumed:
+            self.kernel = WarmKernel()
+
+        return self.kernel, resumed
+
+    def shutdown(self):
+        if self.kernel is not None:
+            self.kernel.shutdown()
+            self.kernel = None
+
+        shutil.rmtree(self.base_path, ignore_errors=True)
+
+
+# Kernels pinned to a session keep their variables between executions. They
+# are evicted when idle for too long, over the memory cap, or least recently
+# used once the container holds too many of them or the next execution might
+# not fit the function memory.
+class SessionKernels:
+    def __init__(self):
+        self.sessions = OrderedDict()
+
+    def accepts(self, session_id: str):
+        return bool(session_id) and SESSION_ID_PATTERN.match(session_id) is not None
+
+    def open(self, session_id: str):
+        self.evict_idle()
+
+        session = self.sessions.pop(session_id, None)
+        if session is not None and session.kernel and not session.kernel.is_alive():
+            session.shutdown()
+            session = None
+
+        if session is None:
+            while len(self.sessions) >= SESSION_KERNEL_MAX_COUNT:
+                _, evicted = self.sessions.popitem(last=False)
+                print(f"Evicting kernel for session {evicted.session_id}")
+                evicted.shutdown()
+
+            session = SessionKernel(session_id)
+
+        # The kernel about to run may grow up to its cap, so the others are
+        # evicted, least recently used first, until that still fits.
+        while self.sessions and (
+            self.memory_mb() + SESSION_KERNEL_MAX_MEMORY_MB > SESSION_KERNELS_MEMORY_MB
+        ):
+            _, evicted = self.sessions.popitem(last=False)
+            print(f"Evicting kernel for session {evicted.session_id} to free memory")
+            evicted.shutdown()
+
+        self.sessions[session_id] = session
+
+        return session
+
+    def memory_mb(self):
+        return sum(
+            session.kernel.memory_mb()
+            for session in self.sessions.values()
+            if session.kernel is not None
+        )
+
+    def release(self, session: SessionKernel, healthy: bool = True):
+        session.last_used = time.monotonic()
+        kernel = session.kernel
+
+        if kernel is None:
+            return
+
+        memory_mb = kernel.memory_mb()
+        within_memory = memory_mb <= SESSION_KERNEL_MAX_MEMORY_MB
+        if healthy and within_memory and kernel.is_alive():
+            return
+
+        print(
+            f"Evicting kernel for session {session.session_id} "
+            f"(healthy: {healthy}, memory: {memory_mb:.0f} MB)"
+        )
+        self.sessions.pop(session.session_id, None)
+        session.shutdown()
+
+    def evict_idle(self):
+        now = time.monotonic()
+
+        for session_id, session in list(self.sessions.items()):
+            if now - session.last_used > SESSION_KERNEL_IDLE_TIMEOUT:
+                print(f"Evicting idle kernel for session {session_id}")
+                self.sessions.pop(session_id)
+                session.shutdown()
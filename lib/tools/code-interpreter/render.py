@@ -0,0 +1,25 @@
+from nbconvert import HTMLExporter, ASCIIDocExporter
+from shaping import RESULT_MAX_TOKENS, shape_notebook, enforce_budget
+
+html_exporter = HTMLExporter(
+    template_name="basic",
+    exclude_input=True,
+    exclude_input_prompt=True,
+    exclude_output_prompt=True,
+)
+
+asciidoc_exporter = ASCIIDocExporter(
+    exclude_input=True,
+    exclude_input_prompt=True,
+    exclude_output_prompt=True,
+)
+
+
+# The HTML keeps the full output for the user interface, while the AsciiDoc
+# text returned to the model is shaped to stay within a token budget.
+def render_notebook(nb, max_tokens: int = RESULT_MAX_TOKENS, images=None):
+    html_nb = images.extract(nb) if images else nb
+    html_output, _ = html_exporter.from_notebook_node(html_nb)
+    asciidoc_output, _ = asciidoc_exporter.from_notebook_node(shape_notebook(nb))
+
+    return html_output, enforce_budget(asciidoc_output, max_tokens)
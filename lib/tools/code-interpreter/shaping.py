@@ -0,0 +1,87 @@
+import os
+import copy
+
+RESULT_MAX_TOKENS = int(os.environ.get("RESULT_MAX_TOKENS", "4000"))
+CHARS_PER_TOKEN = 4
+STREAM_MAX_CHARS = 6000
+TABLE_HEAD_LINES = 10
+TABLE_TAIL_LINES = 5
+TRACEBACK_MAX_FRAMES = 6
+
+
+def estimate_tokens(text: str):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_middle(text: str, max_chars: int):
+    if len(text) <= max_chars:
+        return text
+
+    head = max_chars * 2 // 3
+    tail = max_chars - head
+    omitted = len(text) - head - tail
+
+    return f"{text[:head]}\n... [{omitted} characters truncated] ...\n{text[-tail:]}"
+
+
+def truncate_lines(text: str, head: int, tail: int):
+    lines = text.splitlines()
+    if len(lines) <= head + tail + 1:
+        return text
+
+    omitted = len(lines) - head - tail
+    return "\n".join(
+        lines[:head] + [f"... [{omitted} lines truncated] ..."] + lines[-tail:]
+    )
+
+
+def join_text(value):
+    if isinstance(value, list):
+        return "".join(value)
+
+    return value
+
+
+def shape_output(output):
+    output_type = output.get("output_type")
+
+    if output_type == "stream":
+        output["text"] = truncate_middle(join_text(output["text"]), STREAM_MAX_CHARS)
+    elif output_type == "error":
+        traceback = output.get("traceback", [])
+        if len(traceback) > TRACEBACK_MAX_FRAMES:
+            output["traceback"] = traceback[:1] + traceback[-TRACEBACK_MAX_FRAMES + 1 :]
+    elif output_type in ("display_data", "execute_result"):
+        data = output.get("data", {})
+        html = join_text(data.get("text/html", ""))
+        text = join_text(data.get("text/plain", ""))
+
+        if 'class="dataframe"' in html and text:
+            # The plain text repr of a DataFrame is far more compact than its
+            # HTML table; keep only its first and last rows.
+            text = truncate_lines(text, TABLE_HEAD_LINES, TABLE_TAIL_LINES)
+            output["data"] = {"text/plain": text}
+        elif any(mime_type.startswith("image/") for mime_type in data):
+            output["data"] = {"text/plain": text or "[image output omitted]"}
+        elif text:
+            output["data"] = {"text/plain": truncate_middle(text, STREAM_MAX_CHARS)}
+
+            if html and len(html) <= STREAM_MAX_CHARS:
+                output["data"]["text/html"] = html
+
+
+def shape_notebook(nb):
+    shaped = copy.deepcopy(nb)
+
+    for cell in shaped.cells:
+        for output in cell.get("outputs", []):
+            shape_output(output)
+
+    return shaped
+
+
+def enforce_budget(text: str, max_tokens: int = RESULT_MAX_TOKENS):
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    return truncate_middle(text, max_tokens * CHARS_PER_TOKEN)
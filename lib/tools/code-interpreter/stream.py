@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import threading
+import requests
+
+STREAM_FLUSH_INTERVAL = float(os.environ.get("STREAM_FLUSH_INTERVAL", "0.5"))
+STREAM_MAX_TEXT_SIZE = 16 * 1024
+STREAM_TIMEOUT = 10
+
+
+def output_text(output: dict):
+    output_type = output.get("output_type")
+
+    if output_type == "stream":
+        return output.get("text", "")
+    if output_type == "error":
+        return f"{output.get('ename')}: {output.get('evalue')}\n"
+
+    data = output.get("data", {})
+    if "text/plain" in data:
+        text = data["text/plain"]
+        if isinstance(text, list):
+            text = "".join(text)
+
+        return text + "\n"
+
+    mime_types = ", ".join(data.keys())
+    return f"[{mime_types}]\n"
+
+
+# Incremental result records for the message handler, written either with a
+# presigned POST for a key prefix or into a local directory for local runs.
+# Records are batched and flushed from a background thread that is started
+# lazily in whichever process writes, so forked children can stream as well.
+class ResultStream:
+    def __init__(self, target: dict):
+        self.target = target
+        self.buffer = []
+        self.sequence = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.pid = None
+        self.session = None
+
+    @staticmethod
+    def create(target: dict):
+        if not target:
+            return None
+
+        return ResultStream(target)
+
+    def ensure_started(self):
+        if self.pid == os.getpid():
+            return
+
+        self.pid = os.getpid()
+        self.buffer = []
+        self.stopped = threading.Event()
+        self.session = requests.Session()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(self, output: dict):
+        self.ensure_started()
+        text = output_text(output)
+
+        if not text:
+            return
+
+        with self.lock:
+            if self.buffer and self.buffer[-1]["name"] == output.get("name"):
+                self.buffer[-1]["text"] += text
+            else:
+                self.buffer.append({"name": output.get("name"), "text": text})
+
+    def run(self):
+        while not self.stopped.wait(STREAM_FLUSH_INTERVAL):
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            outputs, self.buffer = self.buffer, []
+
+        if not outputs:
+            return
+
+        for output in outputs:
+            if len(output["text"]) > STREAM_MAX_TEXT_SIZE:
+                output["text"] = output["text"][:STREAM_MAX_TEXT_SIZE] + "...\n"
+
+        self.sequence += 1
+        record = {"sequence": self.sequence, "outputs": outputs}
+
+        try:
+            self.put_record(f"{time.time_ns():020d}.json", record)
+        except Exception as e:
+            print(f"Failed to write stream record: {e}")
+
+    def put_record(self, name: str, record: dict):
+        data = json.dumps(record).encode("utf-8")
+        path = self.target.get("path")
+
+        if path:
+            os.makedirs(path, exist_ok=True)
+            tmp_path = os.path.join(path, f".{name}")
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, os.path.join(path, name))
+            return
+
+        response = self.session.post(
+            self.target["url"],
+            data=self.target["fields"],
+            files={"file": (name, data, "application/json")},
+            timeout=STREAM_TIMEOUT,
+        )
+
+        if response.status_code != 204:
+            print(f"Failed to write stream record: {response.status_code}")
+
+    def close(self):
+        if self.pid != os.getpid():
+            return
+
+        self.stopped.set()
+        self.thread.join()
+        self.flush()
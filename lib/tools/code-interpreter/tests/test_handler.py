@@ -0,0 +1,34 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import index  # noqa: E402
+
+
+def run(code: str):
+    return index.handler({"input": {"code": code}}, None)
+
+
+def test_pooled_kernel_is_reused():
+    first = run("value = 1\nprint('first', value)")
+    second = run("print('second', 'value' in globals())")
+
+    assert first["status"] == "success", first["content"]["text"]
+    assert "first 1" in first["content"]["text"]
+    assert second["status"] == "success", second["content"]["text"]
+    assert "second False" in second["content"]["text"]
+
+
+def test_dead_kernel_fails_fast():
+    start = time.monotonic()
+    result = run("import os\nos._exit(1)")
+
+    assert result["status"] == "error"
+    assert time.monotonic() - start < 30
+
+    result = run("print('recovered')")
+
+    assert result["status"] == "success", result["content"]["text"]
+    assert "recovered" in result["content"]["text"]
@@ -0,0 +1,47 @@
+import os
+import sys
+import time
+import signal
+import tempfile
+import nbformat
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from zygote import ForkServer  # noqa: E402
+
+fork_server = ForkServer(preload=[])
+
+
+def run(code: str):
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_code_cell(code))
+
+    with tempfile.TemporaryDirectory() as work_path:
+        server = fork_server.acquire()
+        server.reset(work_path, work_path)
+        server.execute_notebook(nb)
+
+    return nb.cells[0].outputs
+
+
+def process_state(pid: int):
+    with open(f"/proc/{pid}/stat") as f:
+        return f.read().rsplit(")", 1)[1].split()[0]
+
+
+def test_executions_start_clean():
+    assert run("value = 1\nprint(value)")[0]["text"] == "1\n"
+    assert run("print('value' in globals())")[0]["text"] == "False\n"
+
+
+def test_dead_server_is_replaced():
+    run("print('before')")
+    pid = fork_server.pid
+
+    os.kill(pid, signal.SIGKILL)
+    # Left unreaped, as after an out-of-memory kill.
+    while process_state(pid) != "Z":
+        time.sleep(0.01)
+
+    assert run("print('after')")[0]["text"] == "after\n"
+    assert fork_server.pid != pid
@@ -0,0 +1,311 @@
+import io
+import os
+import uuid
+import hashlib
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cache import FileCache
+
+TRANSFER_WORKERS = int(os.environ.get("TRANSFER_WORKERS", "8"))
+TRANSFER_TIMEOUT = 60
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # 1Mb
+OUTPUT_WATCH_INTERVAL = 0.25
+MAX_INPUT_BYTES = int(os.environ.get("MAX_INPUT_BYTES", str(1000 * 1000 * 1000)))
+
+http_session = requests.Session()
+http_adapter = HTTPAdapter(
+    pool_connections=TRANSFER_WORKERS,
+    pool_maxsize=TRANSFER_WORKERS,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.2,
+        status_forcelist=[500, 502, 503, 504],
+        allowed_methods=["GET"],
+    ),
+)
+http_session.mount("https://", http_adapter)
+http_session.mount("http://", http_adapter)
+
+transfer_executor = ThreadPoolExecutor(
+    max_workers=TRANSFER_WORKERS, thread_name_prefix="transfer"
+)
+
+input_cache = FileCache()
+
+
+class InputBudgetExceeded(Exception):
+    pass
+
+
+class ByteBudget:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def check(self, size: int):
+        if self.used + size > self.limit:
+            raise InputBudgetExceeded(
+                f"Input files exceed the maximum total size of {self.limit} bytes."
+            )
+
+    def consume(self, size: int):
+        with self.lock:
+            self.check(size)
+            self.used += size
+
+
+class DownloadBatch:
+    def __init__(
+        self, files_path: str, input_files: list, limit: int = MAX_INPUT_BYTES
+    ):
+        self.files_path = files_path
+        self.budget = ByteBudget(limit)
+        self.cancelled = threading.Event()
+        self.futures = [
+            transfer_executor.submit(self.download, file) for file in input_files
+        ]
+
+    def download(self, file: dict):
+        file_name = file["file_name"]
+        checksum = file.get("checksum")
+        file_path = os.path.join(self.files_path, file_name)
+
+        cached_size = input_cache.get(checksum, file_path)
+        if cached_size is not None:
+            self.budget.consume(cached_size)
+            print(f"Using cached {file_name}.")
+            return True
+
+        digest = hashlib.sha256()
+        with http_session.get(
+            file["url"], stream=True, timeout=TRANSFER_TIMEOUT
+        ) as response:
+            response.raise_for_status()
+
+            self.budget.check(int(response.headers.get("Content-Length", 0)))
+
+            with open(file_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    if self.cancelled.is_set():
+                        return False
+
+                    self.budget.consume(len(chunk))
+                    digest.update(chunk)
+                    f.write(chunk)
+
+        print(f"Downloaded {file_name} successfully.")
+
+        if checksum and digest.hexdigest() == checksum:
+            input_cache.put(checksum, file_path)
+
+        return False
+
+    def wait(self):
+        try:
+            cache_hits = sum(1 for future in self.futures if future.result())
+        except Exception:
+            self.cancel()
+            raise
+
+        return {
+            "files": len(self.futures),
+            "bytes": self.budget.used,
+            "cache_hits": cache_hits,
+        }
+
+    # Running downloads stop at their next chunk; they are waited for so
+    # nothing writes into the directory after it is removed.
+    def cancel(self):
+        self.cancelled.set()
+
+        for future in self.futures:
+            future.cancel()
+
+        wait(self.futures)
+
+
+def start_downloads(files_path: str, input_files: list):
+    return DownloadBatch(files_path, input_files)
+
+
+class MultipartFileBody:
+    # Streams a multipart/form-data body from disk with a known Content-Length,
+    # which S3 presigned POST requires, instead of buffering it in memory.
+    def __init__(self, fields: dict, file_name: str, file_path: str):
+        boundary = uuid.uuid4().hex
+        file_name = file_name.replace('"', "%22")
+
+        head = []
+        for key, value in fields.items():
+            head.append(
+                f"--{boundary}\r\n"
+                f'Content-Disposition: form-data; name="{key}"\r\n\r\n'
+                f"{value}\r\n"
+            )
+        head.append(
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="{file_name}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n"
+        )
+        head = "".join(head).encode("utf-8")
+        tail = f"\r\n--{boundary}--\r\n".encode("utf-8")
+
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        self.length = len(head) + os.path.getsize(file_path) + len(tail)
+        self.parts = [io.BytesIO(head), open(file_path, "rb"), io.BytesIO(tail)]
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size: int = -1):
+        chunks = []
+
+        while self.parts and (size < 0 or size > 0):
+            chunk = self.parts[0].read(size)
+            if not chunk:
+                self.parts.pop(0).close()
+                continue
+
+            chunks.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+
+        return b"".join(chunks)
+
+    def close(self):
+        for part in self.parts:
+            part.close()
+
+        self.parts = []
+
+
+def upload_file(file_info: dict, file_path: str):
+    file_name = file_info["file_name"]
+    body = MultipartFileBody(file_info["fields"], file_name, file_path)
+
+    print(f"Uploading {file_name}")
+
+    try:
+        response = http_session.post(
+            file_info["url"],
+            data=body,
+            headers={"Content-Type": body.content_type},
+            timeout=TRANSFER_TIMEOUT,
+        )
+    finally:
+        body.close()
+
+    if response.status_code != 204:
+        print(f"Failed to upload {file_name}, status code: {response.status_code}")
+        return None
+
+    print(f"Successfully uploaded {file_name}")
+
+    return {
+        "file_id": file_info["file_id"],
+        "file_name": file_name,
+        "url": file_info["url"],
+    }
+
+
+def file_signature(file_path: str):
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+
+    return stat.st_size, stat.st_mtime_ns
+
+
+class OutputUploader:
+    # Uploads each declared output file as soon as it is written and stops
+    # changing, then re-checks everything once the execution is done. Files
+    # left over from earlier executions in a stateful session are skipped.
+    def __init__(self, files_path: str, output_files: list):
+        self.files_path = files_path
+        self.output_files = output_files
+        self.pending = {file["file_name"]: file for file in output_files}
+        self.initial = {
+            file_name: file_signature(self.file_path(file_name))
+            for file_name in self.pending
+        }
+        self.uploads = {}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.watch, daemon=True)
+
+        if self.pending:
+            self.thread.start()
+
+    def file_path(self, file_name: str):
+        return os.path.join(self.files_path, file_name)
+
+    def watch(self):
+        seen = {}
+
+        while not self.stopped.wait(OUTPUT_WATCH_INTERVAL):
+            for file_name in list(self.pending):
+                signature = file_signature(self.file_path(file_name))
+                if signature == self.initial[file_name]:
+                    continue
+
+                if signature is not None and seen.get(file_name) == signature:
+                    self.submit(self.pending.pop(file_name), signature)
+
+                seen[file_name] = signature
+
+    def submit(self, file_info: dict, signature: tuple):
+        file_name = file_info["file_name"]
+        future = transfer_executor.submit(
+            upload_file, file_info, self.file_path(file_name)
+        )
+
+        self.uploads[file_name] = (signature, future)
+
+    def stop(self):
+        self.stopped.set()
+
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def flush(self):
+        self.stop()
+
+        for file_info in self.output_files:
+            file_name = file_info["file_name"]
+            signature = file_signature(self.file_path(file_name))
+
+            if signature is None:
+                print(f"File {file_name} does not exist.")
+                continue
+
+            if signature == self.initial[file_name]:
+                print(f"File {file_name} was not written by this execution.")
+                continue
+
+            previous = self.uploads.get(file_name)
+            if previous and previous[0] == signature:
+                continue
+
+            if previous:
+                # The file changed after an early upload; wait for that upload
+                # so the final content is the last one written to the key.
+                previous[1].result()
+
+            self.submit(file_info, signature)
+
+    def results(self):
+        ret_value = []
+        for file_info in self.output_files:
+            upload = self.uploads.get(file_info["file_name"])
+            if not upload:
+                continue
+
+            result = upload[1].result()
+            if result:
+                ret_value.append(result)
+
+        return ret_value
@@ -0,0 +1,336 @@
+import os
+import sys
+import time
+import pickle
+import base64
+import select
+import signal
+import traceback
+import importlib
+import nbformat
+import multiprocessing
+from multiprocessing import reduction
+from stream import ResultStream
+from kernel import (
+    KERNEL_HOME,
+    EXECUTION_TIMEOUT,
+    PRELOAD_MODULES,
+    KernelTimeoutError,
+    check_outputs,
+)
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class OutputCollector:
+    def __init__(self, result_stream=None):
+        self.outputs = []
+        self.result_stream = result_stream
+
+    def append(self, output: dict):
+        self.outputs.append(output)
+
+        if self.result_stream is not None:
+            self.result_stream.write(output)
+
+    def stream(self, name: str, text: str):
+        if self.result_stream is not None:
+            self.result_stream.write(
+                {"output_type": "stream", "name": name, "text": text}
+            )
+
+        if (
+            self.outputs
+            and self.outputs[-1]["output_type"] == "stream"
+            and self.outputs[-1]["name"] == name
+        ):
+            self.outputs[-1]["text"] += text
+        else:
+            self.outputs.append({"output_type": "stream", "name": name, "text": text})
+
+    def display(self, output_type: str, data: dict, metadata: dict = None):
+        output = {
+            "output_type": output_type,
+            "data": encode_mime_bundle(data),
+            "metadata": metadata or {},
+        }
+
+        self.append(output)
+
+    def error(self, ename: str, evalue: str, traceback: list):
+        self.append(
+            {
+                "output_type": "error",
+                "ename": ename,
+                "evalue": evalue,
+                "traceback": traceback,
+            }
+        )
+
+    def clear(self):
+        self.outputs.clear()
+
+
+class StreamWriter:
+    def __init__(self, collector: OutputCollector, name: str):
+        self.collector = collector
+        self.name = name
+
+    def write(self, text):
+        if text:
+            self.collector.stream(self.name, text)
+
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+def create_shell():
+    from traitlets.config import Config
+    from IPython.core.interactiveshell import InteractiveShell
+
+    # Figures are captured by the inline backend, so there is no GUI event
+    # loop to integrate with.
+    class ExecutionShell(InteractiveShell):
+        def enable_gui(self, gui=None):
+            pass
+
+    # Forked executions would all write to the same history database.
+    config = Config()
+    config.HistoryManager.enabled = False
+
+    return ExecutionShell.instance(config=config, colors="NoColor")
+
+
+# Imports the preload list once per container and runs every execution in a
+# copy-on-write forked child, so each run starts from the same clean state.
+# Executions are forked from a server process that is itself forked when the
+# handler is created, before the transfer and stream threads start, so no
+# child inherits a thread or a lock held by one.
+class ForkServer:
+    def __init__(self, preload: list = PRELOAD_MODULES):
+        self.preload = preload
+        self.shell = None
+        self.cwd = None
+        self.home_path = None
+        self.start()
+
+    def start(self):
+        conn, server_conn = multiprocessing.Pipe()
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+
+        if pid == 0:
+            conn.close()
+            self.serve(server_conn)
+
+        server_conn.close()
+        self.conn = conn
+        self.pid = pid
+
+    def is_alive(self):
+        try:
+            pid, _ = os.waitpid(self.pid, os.WNOHANG)
+        except ChildProcessError:
+            return False
+
+        return pid == 0
+
+    def warm_up(self):
+        os.makedirs(KERNEL_HOME, exist_ok=True)
+        os.environ.setdefault("MPLCONFIGDIR", os.path.join(KERNEL_HOME, ".matplotlib"))
+
+        for name in self.preload:
+            try:
+                importlib.import_module(name)
+            except Exception as e:
+                print(f"Failed to preload {name}: {e}")
+
+        self.shell = create_shell()
+        self.shell.enable_matplotlib("inline")
+
+    def serve(self, conn):
+        try:
+            self.warm_up()
+
+            while True:
+                try:
+                    request = conn.recv()
+                except EOFError:
+                    break
+
+                write_fd = reduction.recv_handle(conn)
+
+                sys.stdout.flush()
+                sys.stderr.flush()
+                pid = os.fork()
+
+                if pid == 0:
+                    conn.close()
+                    self.run_child(request, write_fd)
+
+                os.close(write_fd)
+                conn.send(pid)
+                os.waitpid(pid, 0)
+        except BaseException:
+            traceback.print_exc(file=sys.__stderr__)
+        finally:
+            os._exit(0)
+
+    # A server that died, for example killed for memory, is replaced. The
+    # handler's threads are idle between executions, so forking it again
+    # here does not copy a lock held mid-operation.
+    def acquire(self):
+        if not self.is_alive():
+            print("The code execution server exited, starting a new one.")
+            self.conn.close()
+            self.start()
+
+        return self
+
+    def release(self, kernel, healthy: bool = True):
+        pass
+
+    def reset(self, cwd: str, home_path: str):
+        self.cwd = cwd
+        self.home_path = home_path
+
+    def execute_notebook(self, nb, stream=None):
+        cells = [cell for cell in nb.cells if cell.cell_type == "code"]
+        request = {
+            "cells": [cell.source for cell in cells],
+            "cwd": self.cwd,
+            "home_path": self.home_path,
+            "stream": stream.target if stream is not None else None,
+        }
+        read_fd, write_fd = os.pipe()
+
+        try:
+            try:
+                self.conn.send(request)
+                reduction.send_handle(self.conn, write_fd, self.pid)
+            finally:
+                os.close(write_fd)
+
+            pid = self.conn.recv()
+            data = self.read_result(read_fd, pid)
+        finally:
+            os.close(read_fd)
+
+        results = pickle.loads(data)
+        for cell, outputs in zip(cells, results):
+            cell.outputs = [nbformat.v4.new_output(**output) for output in outputs]
+            check_outputs(cell.outputs)
+
+    def read_result(self, read_fd: int, pid: int):
+        deadline = time.monotonic() + EXECUTION_TIMEOUT
+        chunks = []
+
+        while True:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                os.kill(pid, signal.SIGKILL)
+                raise KernelTimeoutError(
+                    f"Code execution timed out after {EXECUTION_TIMEOUT} seconds."
+                )
+
+            ready, _, _ = select.select([read_fd], [], [], timeout)
+            if not ready:
+                continue
+
+            chunk = os.read(read_fd, READ_CHUNK_SIZE)
+            if not chunk:
+                break
+
+            chunks.append(chunk)
+
+        if not chunks:
+            raise Exception("Code execution process exited unexpectedly.")
+
+        return b"".join(chunks)
+
+    def run_child(self, request: dict, write_fd: int):
+        try:
+            home_path = request["home_path"]
+            os.environ["HOME"] = home_path
+            os.environ["MPLCONFIGDIR"] = os.path.join(home_path, ".matplotlib")
+            os.chdir(request["cwd"])
+
+            stream = ResultStream.create(request["stream"])
+
+            results = []
+            for source in request["cells"]:
+                outputs = self.run_cell(source, stream)
+                results.append(outputs)
+
+                if any(output["output_type"] == "error" for output in outputs):
+                    break
+
+            if stream is not None:
+                stream.close()
+
+            data = pickle.dumps(results)
+            with os.fdopen(write_fd, "wb") as f:
+                f.write(data)
+        except BaseException:
+            traceback.print_exc(file=sys.__stderr__)
+        finally:
+            os._exit(0)
+
+    def run_cell(self, source: str, stream=None):
+        shell = self.shell
+        collector = OutputCollector(stream)
+
+        def display_hook(result):
+            if result is None:
+                return
+
+            shell.user_ns["_"] = result
+            data, metadata = shell.display_formatter.format(result)
+            collector.display("execute_result", data, metadata)
+
+        def show_traceback(etype, evalue, stb):
+            collector.error(etype.__name__, str(evalue), stb)
+
+        shell.display_pub.publish = (
+            lambda data, metadata=None, *args, **kwargs: collector.display(
+                "display_data", data, metadata
+            )
+        )
+        shell.display_pub.clear_output = lambda *args, **kwargs: collector.clear()
+        shell.display_trap.hook = display_hook
+        shell._showtraceback = show_traceback
+
+        sys.stdout = StreamWriter(collector, "stdout")
+        sys.stderr = StreamWriter(collector, "stderr")
+
+        try:
+            shell.run_cell(source, store_history=True)
+        finally:
+            sys.stdout = sys.__stdout__
+            sys.stderr = sys.__stderr__
+
+        outputs = collector.outputs
+        for output in outputs:
+            if output["output_type"] == "execute_result":
+                output["execution_count"] = shell.execution_count - 1
+
+        return outputs
+
+
+def encode_mime_bundle(data: dict):
+    ret_value = {}
+
+    for mime_type, value in data.items():
+        if isinstance(value, bytes):
+            value = base64.b64encode(value).decode("ascii")
+
+        ret_value[mime_type] = value
+
+    return ret_value
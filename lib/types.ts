@@ -1,6 +1,20 @@
+export interface BedrockEndpoint {
+  region?: string;
+  model: string;
+}
+
 export interface StackConfig {
   bedrockRegion?: string;
   bedrockModel: string;
+  // Region/model pairs tried in order, failing over on throttling or 5xx.
+  // Defaults to bedrockRegion and bedrockModel.
+  bedrockEndpoints?: BedrockEndpoint[];
+  // Tried first for turns sent with low priority.
+  bedrockLowPriorityEndpoints?: BedrockEndpoint[];
+  bedrockQuota?: {
+    requestsPerMinute?: number;
+    tokensPerMinute?: number;
+  };
   playground?: {
     enabled: boolean;
   };
@@ -9,8 +23,12 @@ export interface StackConfig {
   };
   codeInterpreterTool?: {
     enabled: boolean;
+    executionMode?: "kernel" | "fork";
+    stateful?: boolean;
+    resultCache?: "memory" | "disk";
   };
   webSearchTool?: {
     enabled: boolean;
+    resultCache?: "memory" | "dynamodb";
   };
 }